@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Métricas de engagement dos imóveis em buckets pré-agregados.
+
+Os eventos (visualizações e cliques) são somados em memória e gravados a cada
+poucos segundos como $inc em buckets horários na coleção `imoveis_stats`.
+A compactação dobra os buckets horários de dias já terminados num bucket
+diário, por isso as consultas de estatísticas leem no máximo um documento por
+dia (mais as horas do dia corrente), nunca eventos individuais.
+
+Compactação manual (ou via cron):
+    python analytics.py compactar
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATS_COLLECTION = 'imoveis_stats'
+HORA = 'hora'
+DIA = 'dia'
+EVENTOS = {'visualizacao': 'visualizacoes', 'clique': 'cliques'}
+FLUSH_INTERVAL_SECONDS = float(
+    os.environ.get('ENGAGEMENT_FLUSH_SECONDS', '5'))
+
+
+def hour_start(when: datetime) -> datetime:
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, dtime.min, tzinfo=timezone.utc)
+
+
+async def ensure_indexes(db):
+    await db[STATS_COLLECTION].create_index(
+        [("imovel_id", 1), ("granularidade", 1), ("inicio", 1)], unique=True)
+
+
+class EngagementBuffer:
+    """Agrega eventos em memória e grava-os em lote (um bulk_write por flush)."""
+
+    def __init__(self, db, flush_interval: float = FLUSH_INTERVAL_SECONDS):
+        self.collection = db[STATS_COLLECTION]
+        self.flush_interval = flush_interval
+        self._counts: Dict[Tuple[str, datetime], Dict[str, int]] = defaultdict(
+            lambda: defaultdict(int))
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, imovel_id: str, evento: str, when: Optional[datetime] = None) -> None:
+        campo = EVENTOS[evento]
+        bucket = hour_start(when or datetime.now(timezone.utc))
+        self._counts[(imovel_id, bucket)][campo] += 1
+
+    async def flush(self) -> int:
+        if not self._counts:
+            return 0
+        counts, self._counts = self._counts, defaultdict(
+            lambda: defaultdict(int))
+        operations = [
+            UpdateOne(
+                {"imovel_id": imovel_id, "granularidade": HORA, "inicio": bucket},
+                {"$inc": dict(campos)},
+                upsert=True)
+            for (imovel_id, bucket), campos in counts.items()]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.warning(
+                f"Falha ao gravar {len(operations)} buckets de engagement: {e}")
+        return len(operations)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+async def get_stats(db, imovel_id: str, desde: date, ate: date) -> dict:
+    """Série diária [desde, ate] lida só dos buckets diários e horários."""
+    collection = db[STATS_COLLECTION]
+    buckets = await collection.find(
+        {"imovel_id": imovel_id,
+         "inicio": {"$gte": day_start(desde), "$lt": day_start(ate + timedelta(days=1))}},
+        {"_id": 0, "inicio": 1, "visualizacoes": 1, "cliques": 1}).to_list(length=None)
+
+    por_dia = {desde + timedelta(days=n): {"visualizacoes": 0, "cliques": 0}
+               for n in range((ate - desde).days + 1)}
+    for bucket in buckets:
+        dia = por_dia.get(bucket["inicio"].date())
+        if dia is None:
+            continue
+        dia["visualizacoes"] += bucket.get("visualizacoes", 0)
+        dia["cliques"] += bucket.get("cliques", 0)
+
+    serie = [{"dia": dia.isoformat(), **valores}
+             for dia, valores in sorted(por_dia.items())]
+    return {
+        "imovel_id": imovel_id,
+        "desde": desde.isoformat(),
+        "ate": ate.isoformat(),
+        "total_visualizacoes": sum(d["visualizacoes"] for d in serie),
+        "total_cliques": sum(d["cliques"] for d in serie),
+        "dias": serie,
+    }
+
+
+async def compactar(db, antes_de: Optional[date] = None) -> int:
+    """
+    Dobra os buckets horários de dias anteriores a `antes_de` num bucket diário
+    por imóvel. Por omissão compacta até ao início do dia UTC de há uma hora,
+    para não apanhar horas que ainda podem receber um flush.
+
+    É idempotente: as horas são primeiro marcadas com um lote, o bucket diário
+    regista os lotes já somados e só depois as horas são apagadas. Repetir após
+    uma falha nunca conta a dobrar.
+    """
+    collection = db[STATS_COLLECTION]
+    if antes_de is None:
+        antes_de = (datetime.now(timezone.utc) - timedelta(hours=1)).date()
+    limite = day_start(antes_de)
+    await collection.update_many(
+        {"granularidade": HORA, "inicio": {"$lt": limite}, "lote": {"$exists": False}},
+        {"$set": {"lote": uuid.uuid4().hex}})
+    grupos = collection.aggregate([
+        {"$match": {"granularidade": HORA, "lote": {"$exists": True}}},
+        {"$group": {
+            "_id": {"imovel_id": "$imovel_id", "lote": "$lote",
+                    "dia": {"$dateTrunc": {"date": "$inicio", "unit": "day"}}},
+            "visualizacoes": {"$sum": {"$ifNull": ["$visualizacoes", 0]}},
+            "cliques": {"$sum": {"$ifNull": ["$cliques", 0]}},
+        }},
+    ])
+    compactados = 0
+    async for grupo in grupos:
+        imovel_id, lote, dia = grupo["_id"]["imovel_id"], grupo["_id"]["lote"], grupo["_id"]["dia"]
+        try:
+            await collection.update_one(
+                {"imovel_id": imovel_id, "granularidade": DIA,
+                    "inicio": dia, "lotes": {"$ne": lote}},
+                {"$inc": {"visualizacoes": grupo["visualizacoes"], "cliques": grupo["cliques"]},
+                 "$push": {"lotes": lote}},
+                upsert=True)
+        except DuplicateKeyError:
+            # O bucket diário já contém este lote (execução anterior interrompida)
+            pass
+        await collection.delete_many(
+            {"imovel_id": imovel_id, "granularidade": HORA, "lote": lote,
+             "inicio": {"$gte": dia, "$lt": dia + timedelta(days=1)}})
+        compactados += 1
+    return compactados
+
+
+async def _main():
+    import sys
+    from pathlib import Path
+
+    import certifi
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    if len(sys.argv) < 2 or sys.argv[1] != 'compactar':
+        print("Uso: python analytics.py compactar")
+        return
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'], tlsCAFile=certifi.where())
+    db = client[os.environ.get('DB_NAME', 'alt_ilhabela')]
+    try:
+        total = await compactar(db)
+        print(f"✅ {total} dias compactados.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
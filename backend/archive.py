@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Arquivo (tier frio) para registos inativos ou resolvidos.
+
+Imóveis e perfis de parceiros desativados e candidaturas aprovadas/recusadas
+há mais de N dias são movidos em lotes para `<coleção>_arquivo`. Assim as
+coleções quentes só guardam linhas vivas e os seus índices parciais ficam
+pequenos. Um registo arquivado pode ser restaurado a qualquer momento.
+
+Cada lote é primeiro copiado (replace com upsert, por isso repetir é seguro)
+e só depois apagado da coleção quente, com o mesmo filtro: um registo
+reativado entretanto fica na coleção quente e a cópia arquivada é descartada.
+
+Uso (manual ou via cron):
+    python archive.py arquivar --dias 90
+    python archive.py restaurar imoveis <id>
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from pymongo import ReplaceOne
+
+ARCHIVE_SUFFIX = '_arquivo'
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+DEFAULT_BATCH_SIZE = 500
+RESOLVIDAS = ["aprovado", "recusado"]
+
+# coleção -> (filtro dos registos mortos, campo com a data da última alteração)
+ARQUIVAVEIS = {
+    "imoveis": ({"ativo": False}, "updated_at"),
+    "perfis_parceiros": ({"ativo": False}, "updated_at"),
+    "candidaturas_membros": ({"status": {"$in": RESOLVIDAS}}, "resolvido_em"),
+    "candidaturas_parceiros": ({"status": {"$in": RESOLVIDAS}}, "resolvido_em"),
+    "candidaturas_associados": ({"status": {"$in": RESOLVIDAS}}, "resolvido_em"),
+}
+
+
+def archive_name(colecao: str) -> str:
+    return f"{colecao}{ARCHIVE_SUFFIX}"
+
+
+def filtro_arquivo(colecao: str, limite: datetime) -> dict:
+    filtro, campo_data = ARQUIVAVEIS[colecao]
+    # Documentos antigos podem não ter updated_at/resolvido_em: usa-se created_at
+    return {**filtro, "$or": [
+        {campo_data: {"$lt": limite}},
+        {campo_data: {"$exists": False}, "created_at": {"$lt": limite}},
+    ]}
+
+
+async def ensure_indexes(db):
+    for colecao in ARQUIVAVEIS:
+        await db[archive_name(colecao)].create_index("id")
+        await db[archive_name(colecao)].create_index("arquivado_em")
+
+
+async def arquivar_colecao(db, colecao: str, limite: datetime,
+                           lote: int = DEFAULT_BATCH_SIZE) -> int:
+    quente, arquivo = db[colecao], db[archive_name(colecao)]
+    filtro = filtro_arquivo(colecao, limite)
+    movidos = 0
+    while True:
+        docs = await quente.find(filtro).limit(lote).to_list(length=None)
+        if not docs:
+            return movidos
+        agora = datetime.now(timezone.utc)
+        for doc in docs:
+            doc["arquivado_em"] = agora
+        await arquivo.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+        ids = [doc["_id"] for doc in docs]
+        result = await quente.delete_many({"_id": {"$in": ids}, **filtro})
+        if result.deleted_count < len(ids):
+            # Reativados entre a cópia e a remoção: continuam quentes
+            vivos = await quente.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(length=None)
+            await arquivo.delete_many({"_id": {"$in": [doc["_id"] for doc in vivos]}})
+        movidos += result.deleted_count
+
+
+async def arquivar(db, dias: int = ARCHIVE_AFTER_DAYS,
+                   lote: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """Move para o arquivo os registos mortos há mais de `dias`. Devolve quantos por coleção."""
+    limite = datetime.now(timezone.utc) - timedelta(days=dias)
+    return {colecao: await arquivar_colecao(db, colecao, limite, lote)
+            for colecao in ARQUIVAVEIS}
+
+
+async def restaurar(db, colecao: str, doc_id: str) -> Optional[dict]:
+    """
+    Devolve o registo arquivado à coleção quente. A data usada pelo filtro do
+    arquivo passa a ser agora, senão a próxima execução voltava a arquivá-lo.
+    """
+    arquivo = db[archive_name(colecao)]
+    doc = await arquivo.find_one({"id": doc_id})
+    if not doc:
+        return None
+    doc.pop("arquivado_em", None)
+    agora = datetime.now(timezone.utc)
+    doc[ARQUIVAVEIS[colecao][1]] = agora
+    doc["restaurado_em"] = agora
+    await db[colecao].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+    await arquivo.delete_one({"_id": doc["_id"]})
+    return doc
+
+
+async def _main():
+    from pathlib import Path
+
+    import certifi
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Arquivo de registos inativos/resolvidos")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    cmd_arquivar = comandos.add_parser('arquivar')
+    cmd_arquivar.add_argument('--dias', type=int, default=ARCHIVE_AFTER_DAYS)
+    cmd_arquivar.add_argument('--lote', type=int, default=DEFAULT_BATCH_SIZE)
+    cmd_restaurar = comandos.add_parser('restaurar')
+    cmd_restaurar.add_argument('colecao', choices=sorted(ARQUIVAVEIS))
+    cmd_restaurar.add_argument('id')
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'], tlsCAFile=certifi.where())
+    db = client[os.environ.get('DB_NAME', 'alt_ilhabela')]
+    try:
+        if args.comando == 'arquivar':
+            await ensure_indexes(db)
+            movidos = await arquivar(db, args.dias, args.lote)
+            for colecao, total in movidos.items():
+                print(f"✅ {colecao}: {total} arquivados")
+        else:
+            doc = await restaurar(db, args.colecao, args.id)
+            if doc:
+                print(f"✅ {args.id} restaurado em {args.colecao}")
+            else:
+                print(f"❌ {args.id} não encontrado em {archive_name(args.colecao)}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark do arranque a frio do backend.
+
+Cada execução corre num processo novo (como num cold start) e mede o tempo de
+`import server` e de `create_app()`. O resultado é comparado com o orçamento
+definido em STARTUP_BUDGET_MS (ou --budget-ms); o script termina com código 1
+se a mediana o ultrapassar.
+
+Uso:
+    python benchmark_startup.py --runs 5 --output startup_history.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+DEFAULT_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', '1500'))
+
+# Módulos que não devem ser carregados no arranque
+LAZY_MODULES = ['cloudinary', 'cloudinary.uploader', 'smtplib', 'email.mime.multipart']
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+server.create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "eager_modules": [m for m in {LAZY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def run_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT_DIR,
+        capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--output', type=Path,
+                        help="Ficheiro JSONL onde acrescentar o resultado (histórico)")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(r['import_ms'] for r in runs)
+    create_app_ms = statistics.median(r['create_app_ms'] for r in runs)
+    eager_modules = sorted({m for r in runs for m in r['eager_modules']})
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'runs': args.runs,
+        'import_ms_median': round(import_ms, 1),
+        'create_app_ms_median': round(create_app_ms, 1),
+        'total_ms_median': round(import_ms + create_app_ms, 1),
+        'budget_ms': args.budget_ms,
+        'eager_modules': eager_modules,
+    }
+    report['within_budget'] = report['total_ms_median'] <= args.budget_ms and not eager_modules
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+
+    if not report['within_budget']:
+        if eager_modules:
+            print(f"❌ Módulos carregados no arranque: {', '.join(eager_modules)}")
+        else:
+            print(f"❌ Arranque acima do orçamento de {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print("✅ Arranque dentro do orçamento.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cache em memória (por processo) para respostas públicas muito lidas.
+
+As entradas são agrupadas por namespace (ex.: "main-page") para que uma escrita
+possa invalidar de uma só vez tudo o que depende da mesma coleção.
+
+Há chaves por utilizador vindas de URLs públicos (perfil-publico), por isso o
+número de entradas é limitado (LRU, CACHE_MAX_ENTRIES) e os locks de
+carregamento só existem enquanto há pedidos à espera.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '2000'))
+
+
+class TTLCache:
+    def __init__(self, default_ttl: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        # chave -> [lock, pedidos à espera ou a carregar]
+        self._locks: Dict[Tuple[str, str], List] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, namespace: str, key: str = "") -> Optional[Any]:
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop((namespace, key), None)
+            return None
+        self._entries.move_to_end((namespace, key))
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        self._entries[(namespace, key)] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end((namespace, key))
+        if len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self) -> None:
+        agora = time.monotonic()
+        for entry_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < agora]:
+            del self._entries[entry_key]
+        # Sem expiradas suficientes: sai a menos usada recentemente
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str, key: Optional[str] = None) -> None:
+        """Remove uma entrada, ou todo o namespace quando key é None."""
+        if key is not None:
+            self._entries.pop((namespace, key), None)
+            return
+        for entry_key in [k for k in self._entries if k[0] == namespace]:
+            self._entries.pop(entry_key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+        # Um único loader por chave: pedidos concorrentes esperam pelo primeiro
+        entry_key = (namespace, key)
+        lock_entry = self._locks.setdefault(entry_key, [asyncio.Lock(), 0])
+        lock_entry[1] += 1
+        try:
+            async with lock_entry[0]:
+                value = self.get(namespace, key)
+                if value is None:
+                    value = await loader()
+                    self.set(namespace, key, value, ttl)
+        finally:
+            lock_entry[1] -= 1
+            if lock_entry[1] == 0:
+                self._locks.pop(entry_key, None)
+        return value
+
+
+cache = TTLCache()
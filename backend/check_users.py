@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """
 Script para verificar usuários no banco
+
+Lê as coleções em streaming (cursor com lotes limitados e só os campos
+mostrados), por isso funciona com qualquer volume de dados. Para exportar
+ou filtrar, usa o export_collection.py.
 """
 import asyncio
 import os
@@ -10,48 +14,43 @@ from motor.motor_asyncio import AsyncIOMotorClient
 # Load environment variables
 load_dotenv('.env')
 
+BATCH_SIZE = 500
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+SECOES = [
+    ("USUÁRIOS NO BANCO", "users", [
+     ("Email", "email"), ("Nome", "nome"), ("Role", "role"), ("Ativo", "ativo")]),
+    ("CANDIDATURAS MEMBROS", "candidaturas_membros", [
+     ("Nome", "nome"), ("Email", "email"), ("Status", "status")]),
+    ("CANDIDATURAS PARCEIROS", "candidaturas_parceiros", [
+     ("Nome", "nome"), ("Email", "email"), ("Empresa", "nome_empresa"), ("Status", "status")]),
+    ("CANDIDATURAS ASSOCIADOS", "candidaturas_associados", [
+     ("Nome", "nome"), ("Email", "email"), ("Status", "status")]),
+]
+
+
+async def print_collection(titulo, collection_name, campos):
+    print(f"\n=== {titulo} ===")
+    projecao = {campo: 1 for _, campo in campos}
+    projecao["_id"] = 0
+    total = 0
+    async for doc in db[collection_name].find({}, projecao, batch_size=BATCH_SIZE):
+        for label, campo in campos:
+            print(f"{label}: {doc.get(campo, '(em falta)')}")
+        print("---")
+        total += 1
+    print(f"Total: {total}")
+
+
 async def check_users():
     """Check users in database"""
-    
-    users = await db.users.find({}).to_list(length=None)
-    
-    print("=== USUÁRIOS NO BANCO ===")
-    for user in users:
-        print(f"Email: {user['email']}")
-        print(f"Nome: {user['nome']}")
-        print(f"Role: {user['role']}")
-        print(f"Ativo: {user['ativo']}")
-        print("---")
-    
-    print("\n=== CANDIDATURAS MEMBROS ===")
-    candidaturas = await db.candidaturas_membros.find({}).to_list(length=None)
-    for c in candidaturas:
-        print(f"Nome: {c['nome']}")
-        print(f"Email: {c['email']}")
-        print(f"Status: {c['status']}")
-        print("---")
-    
-    print("\n=== CANDIDATURAS PARCEIROS ===")
-    candidaturas_p = await db.candidaturas_parceiros.find({}).to_list(length=None)
-    for c in candidaturas_p:
-        print(f"Nome: {c['nome']}")
-        print(f"Email: {c['email']}")
-        print(f"Empresa: {c['nome_empresa']}")
-        print(f"Status: {c['status']}")
-        print("---")
-    
-    print("\n=== CANDIDATURAS ASSOCIADOS ===")
-    candidaturas_a = await db.candidaturas_associados.find({}).to_list(length=None)
-    for c in candidaturas_a:
-        print(f"Nome: {c['nome']}")
-        print(f"Email: {c['email']}")
-        print(f"Status: {c['status']}")
-        print("---")
+    for titulo, collection_name, campos in SECOES:
+        await print_collection(titulo, collection_name, campos)
+
 
 async def main():
     try:
@@ -62,4 +61,4 @@ async def main():
         client.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Configuração da ligação ao MongoDB.
+
+Todos os parâmetros do pool e de encaminhamento de leituras vêm de variáveis
+de ambiente, para que possam ser ajustados por ambiente sem alterar código.
+"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return int(value)
+
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'alt_ilhabela')
+
+# --- Pool de ligações ---
+MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE', 50)
+MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS', 60000)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+
+# --- Timeouts ---
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int(
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS', 10000)
+MONGO_SOCKET_TIMEOUT_MS = _env_int('MONGO_SOCKET_TIMEOUT_MS', 20000)
+
+# --- Compressão (zlib não precisa de dependências extra) ---
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zlib')
+
+# --- Leituras públicas ---
+# "primary" (omissão) lê o que acabou de ser escrito; "secondaryPreferred" tira o
+# catálogo público do primário, à custa de leituras até max_staleness atrasadas
+# (um imóvel acabado de criar pode dar 404). O MongoDB exige max_staleness >= 90 s.
+# Os loaders da cache leem sempre do primário (ver server.py).
+MONGO_PUBLIC_READ_PREFERENCE = os.environ.get(
+    'MONGO_PUBLIC_READ_PREFERENCE', 'primary')
+MONGO_MAX_STALENESS_SECONDS = _env_int('MONGO_MAX_STALENESS_SECONDS', 120)
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Contabiliza a utilização do pool por servidor para planeamento de capacidade."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _server(self, address) -> Dict[str, int]:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self._stats:
+            self._stats[key] = {
+                "open": 0, "checked_out": 0, "waiting": 0,
+                "peak_checked_out": 0, "peak_waiting": 0,
+                "created_total": 0, "checkout_failures": 0,
+                "wait_timeouts": 0, "pool_clears": 0,
+            }
+        return self._stats[key]
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            stats = self._server(address)
+            for field, delta in deltas.items():
+                stats[field] += delta
+            stats["peak_checked_out"] = max(
+                stats["peak_checked_out"], stats["checked_out"])
+            stats["peak_waiting"] = max(
+                stats["peak_waiting"], stats["waiting"])
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {server: dict(stats) for server, stats in self._stats.items()}
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, open=1, created_total=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        deltas = {"waiting": -1, "checkout_failures": 1}
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            deltas["wait_timeouts"] = 1
+        self._update(event.address, **deltas)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+
+pool_stats_listener = PoolStatsListener()
+
+
+def client_options() -> dict:
+    options = {
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+
+def create_client(event_listeners: Optional[List] = None) -> AsyncIOMotorClient:
+    listeners = [pool_stats_listener] + list(event_listeners or [])
+    return AsyncIOMotorClient(MONGO_URL, event_listeners=listeners, **client_options())
+
+
+def public_read_preference():
+    if MONGO_PUBLIC_READ_PREFERENCE == 'secondaryPreferred':
+        return SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+    return Primary()
+
+
+def get_public_db(client: AsyncIOMotorClient):
+    """Base de dados para rotas públicas só de leitura, com o read preference configurado."""
+    return client.get_database(DB_NAME, read_preference=public_read_preference())
+
+
+def pool_config() -> dict:
+    return {
+        **client_options(),
+        "public_read_preference": MONGO_PUBLIC_READ_PREFERENCE,
+        "max_staleness_seconds": MONGO_MAX_STALENESS_SECONDS,
+    }
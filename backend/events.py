@@ -0,0 +1,173 @@
+"""
+Eventos em tempo real para o painel de administração (Server-Sent Events).
+
+Os handlers de escrita publicam eventos tipados (candidatura submetida,
+imóvel à espera de aprovação, contagens alteradas) na coleção `admin_events`.
+Cada evento recebe um número de sequência crescente, usado como `id` no SSE:
+um cliente que volte a ligar envia-o em Last-Event-ID e recebe os eventos que
+perdeu. Os eventos publicados neste worker são entregues de imediato às
+ligações locais; os dos outros workers chegam por consultas incrementais a
+partir do `criado_em` preenchido pelo MongoDB ($currentDate), tal como o
+barramento de invalidação da cache.
+
+Os eventos expiram pelo índice TTL em `criado_em`; um cursor mais antigo do
+que o evento mais antigo guardado recebe um evento "resync" (o painel volta a
+carregar tudo).
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = 'admin_events'
+SEQUENCE_COLLECTION = 'admin_events_seq'
+POLL_INTERVAL_SECONDS = float(os.environ.get('ADMIN_EVENTS_POLL_SECONDS', '1'))
+EVENTS_TTL_SECONDS = int(os.environ.get('ADMIN_EVENTS_TTL_SECONDS', str(60 * 60)))
+# Margem para eventos que ficam visíveis ligeiramente depois do seu criado_em
+POLL_SLACK = timedelta(seconds=5)
+# Eventos por ligação à espera de serem enviados; acima disto o cliente é ressincronizado
+MAX_PENDENTES_POR_LIGACAO = 256
+MAX_REPLAY = 500
+
+RESYNC = "resync"
+
+
+class Assinatura:
+    """Fila de eventos de uma ligação SSE."""
+
+    def __init__(self):
+        self.fila: asyncio.Queue = asyncio.Queue(MAX_PENDENTES_POR_LIGACAO)
+        self.perdeu_eventos = False
+
+    def entregar(self, evento: dict) -> None:
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.perdeu_eventos = True
+
+
+class EventBus:
+    def __init__(self, db, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.collection = db[EVENTS_COLLECTION]
+        self.sequences = db[SEQUENCE_COLLECTION]
+        self.poll_interval = poll_interval
+        self._assinaturas: Set[Assinatura] = set()
+        # seq -> criado_em dos eventos já entregues (podado pela marca de água)
+        self._vistos: Dict[int, Any] = {}
+        self._watermark = None
+        self._poller: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("criado_em", expireAfterSeconds=EVENTS_TTL_SECONDS)
+
+    def subscribe(self) -> Assinatura:
+        assinatura = Assinatura()
+        self._assinaturas.add(assinatura)
+        return assinatura
+
+    def unsubscribe(self, assinatura: Assinatura) -> None:
+        self._assinaturas.discard(assinatura)
+
+    def __len__(self) -> int:
+        return len(self._assinaturas)
+
+    def _entregar(self, evento: dict) -> None:
+        for assinatura in self._assinaturas:
+            assinatura.entregar(evento)
+
+    async def publish(self, tipo: str, dados: Optional[dict] = None) -> Optional[int]:
+        """Grava o evento e entrega-o às ligações deste worker. Devolve o seq."""
+        try:
+            contador = await self.sequences.find_one_and_update(
+                {"_id": EVENTS_COLLECTION}, {"$inc": {"seq": 1}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+            seq = contador["seq"]
+            evento = await self.collection.find_one_and_update(
+                {"_id": seq},
+                {"$set": {"tipo": tipo, "dados": dados or {}},
+                 "$currentDate": {"criado_em": True}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except Exception as e:
+            logger.warning(f"Falha ao publicar evento {tipo}: {e}")
+            return None
+        self._vistos[seq] = evento["criado_em"]
+        self._entregar(evento)
+        return seq
+
+    def spawn(self, coro: Awaitable) -> None:
+        """Executa a publicação em segundo plano, sem atrasar a resposta."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def replay(self, desde: int) -> Tuple[List[dict], bool]:
+        """
+        Eventos com seq > desde, por ordem. O segundo valor indica que alguns
+        já expiraram e o cliente tem de se ressincronizar.
+        """
+        mais_antigo = await self.collection.find_one({}, sort=[("_id", 1)])
+        if mais_antigo is None:
+            contador = await self.sequences.find_one({"_id": EVENTS_COLLECTION})
+            return [], bool(contador and contador["seq"] > desde)
+        eventos = await self.collection.find({"_id": {"$gt": desde}}).sort(
+            "_id", 1).limit(MAX_REPLAY).to_list(length=None)
+        perdidos = mais_antigo["_id"] > desde + 1 or len(eventos) == MAX_REPLAY
+        return eventos, perdidos
+
+    async def poll_once(self) -> int:
+        """Entrega os eventos publicados por outros workers. Devolve quantos entregou."""
+        query = {}
+        if self._watermark is not None:
+            query = {"criado_em": {"$gte": self._watermark - POLL_SLACK}}
+        novos = []
+        async for doc in self.collection.find(query):
+            if doc["_id"] not in self._vistos:
+                self._vistos[doc["_id"]] = doc["criado_em"]
+                # Na primeira consulta só registamos os eventos existentes
+                if self._watermark is not None:
+                    novos.append(doc)
+            if self._watermark is None or doc["criado_em"] > self._watermark:
+                self._watermark = doc["criado_em"]
+        if self._watermark is None:
+            self._watermark = (await self.collection.database.command("hello"))["localTime"]
+        for evento in sorted(novos, key=lambda doc: doc["_id"]):
+            self._entregar(evento)
+        self._prune()
+        return len(novos)
+
+    def _prune(self) -> None:
+        limite = self._watermark - 2 * POLL_SLACK
+        antigos = [seq for seq, criado_em in self._vistos.items() if criado_em < limite]
+        for seq in antigos:
+            del self._vistos[seq]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao consultar eventos de administração: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Exportação/inspeção em streaming de qualquer coleção do MongoDB.
+
+Os documentos são lidos com um cursor assíncrono em lotes de tamanho fixo
+(--lote) e escritos à medida que chegam, por isso a memória usada não depende
+do tamanho da coleção.
+
+CSV e Parquet precisam das colunas (e o Parquet dos tipos) antes do primeiro
+lote: sem --campos, uma agregação prévia recolhe todas as chaves de topo e os
+tipos BSON de cada uma nos documentos do filtro. Uma coluna com tipos
+incompatíveis é exportada como texto; nada é descartado em silêncio.
+
+Uso:
+    python export_collection.py users --campos email,nome,role,ativo
+    python export_collection.py imoveis --filtro '{"ativo": true}' --formato csv --saida imoveis.csv
+    python export_collection.py candidaturas_membros --formato parquet --saida c.parquet
+    python export_collection.py users --contar --filtro '{"role": "membro"}'
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import certifi
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def to_jsonable(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+def flat_value(value):
+    """Valores compostos vão para o CSV/Parquet como JSON."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=to_jsonable, ensure_ascii=False)
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+async def esquema(collection, filtro: dict, projecao: Optional[dict]) -> Dict[str, Set[str]]:
+    """Chaves de topo dos documentos do filtro -> tipos BSON ($type) encontrados."""
+    pipeline = [{"$match": filtro}]
+    if projecao:
+        pipeline.append({"$project": projecao})
+    pipeline += [
+        {"$project": {"kv": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$kv"},
+        {"$group": {"_id": "$kv.k", "tipos": {"$addToSet": {"$type": "$kv.v"}}}},
+        {"$sort": {"_id": 1}},
+    ]
+    tipos = {}
+    async for doc in collection.aggregate(pipeline):
+        tipos[doc["_id"]] = set(doc["tipos"])
+    # Identificadores primeiro, o resto por ordem alfabética
+    return {k: tipos[k] for k in sorted(tipos, key=lambda k: (k not in ("_id", "id"), k))}
+
+
+class JsonlWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write_batch(self, docs: List[dict]):
+        for doc in docs:
+            self.out.write(json.dumps(doc, default=to_jsonable,
+                           ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.out.flush()
+
+
+class CsvWriter:
+    def __init__(self, out, campos: List[str]):
+        self.out = out
+        # Uma chave fora das colunas (ex.: escrita concorrente) falha em vez de se perder
+        self.writer = csv.DictWriter(self.out, fieldnames=campos, extrasaction='raise')
+        self.writer.writeheader()
+
+    def write_batch(self, docs: List[dict]):
+        for doc in docs:
+            self.writer.writerow({k: flat_value(v) for k, v in doc.items()})
+
+    def close(self):
+        self.out.flush()
+
+
+class ParquetWriter:
+    def __init__(self, path: Path, tipos: Dict[str, Set[str]]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit(
+                "ERRO: a exportação em Parquet requer o pacote pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.schema = pyarrow.schema(
+            [(campo, self._tipo_arrow(t)) for campo, t in tipos.items()])
+        self.writer = pyarrow.parquet.ParquetWriter(str(path), self.schema)
+
+    def _tipo_arrow(self, tipos_bson: Set[str]):
+        tipos = tipos_bson - {"null", "missing", "undefined"}
+        if tipos == {"bool"}:
+            return self.pa.bool_()
+        if tipos and tipos <= {"int", "long"}:
+            return self.pa.int64()
+        if tipos and tipos <= {"int", "long", "double"}:
+            return self.pa.float64()
+        if tipos == {"date"}:
+            return self.pa.timestamp("ms", tz="UTC")
+        # Texto, ObjectId, objetos/listas (JSON), colunas só com null e tipos mistos
+        return self.pa.string()
+
+    @staticmethod
+    def _valor(valor, tipo):
+        if valor is None:
+            return None
+        if tipo == "string":
+            valor = flat_value(valor)
+            if isinstance(valor, str):
+                return valor
+            if isinstance(valor, datetime):
+                return valor.isoformat()
+            return json.dumps(valor)
+        if tipo == "double":
+            return float(valor)
+        return valor
+
+    def write_batch(self, docs: List[dict]):
+        columns = {campo.name: [self._valor(doc.get(campo.name), str(campo.type)) for doc in docs]
+                   for campo in self.schema}
+        # Com o esquema fixo, um valor que não converte dá erro (não é descartado)
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+async def export(db, args) -> int:
+    collection = db[args.colecao]
+    filtro = json.loads(args.filtro) if args.filtro else {}
+
+    if args.contar:
+        total = await collection.count_documents(filtro)
+        print(total)
+        return total
+
+    campos = [c.strip() for c in args.campos.split(',')] if args.campos else None
+    projecao = None
+    if campos:
+        projecao = {c: 1 for c in campos}
+        if '_id' not in campos:
+            projecao['_id'] = 0
+    elif not args.incluir_id:
+        projecao = {'_id': 0}
+
+    cursor = collection.find(filtro, projecao, batch_size=args.lote)
+    if args.ordenar:
+        campo, _, direcao = args.ordenar.partition(':')
+        cursor = cursor.sort(campo, -1 if direcao == 'desc' else 1)
+    if args.limite:
+        cursor = cursor.limit(args.limite)
+
+    tipos = None
+    if args.formato in ('csv', 'parquet'):
+        tipos = await esquema(collection, filtro, projecao)
+        if campos:
+            tipos = {c: tipos.get(c, set()) for c in campos}
+
+    out = None
+    if args.formato == 'parquet':
+        if not args.saida:
+            raise SystemExit("ERRO: --saida é obrigatório para Parquet")
+        writer = ParquetWriter(args.saida, tipos)
+    else:
+        out = open(args.saida, 'w', newline='', encoding='utf-8') if args.saida else sys.stdout
+        writer = CsvWriter(out, list(tipos)) if args.formato == 'csv' else JsonlWriter(out)
+
+    total = 0
+    batch = []
+    try:
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= args.lote:
+                writer.write_batch(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(batch)
+            total += len(batch)
+    finally:
+        writer.close()
+        if out is not None and out is not sys.stdout:
+            out.close()
+    return total
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Exportação/inspeção em streaming de coleções do MongoDB")
+    parser.add_argument('colecao')
+    parser.add_argument('--filtro', help="Filtro MongoDB em JSON")
+    parser.add_argument('--campos', help="Projeção: campos separados por vírgula")
+    parser.add_argument('--formato', choices=['jsonl', 'csv', 'parquet'], default='jsonl')
+    parser.add_argument('--saida', type=Path, help="Ficheiro de saída (por omissão stdout)")
+    parser.add_argument('--lote', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Documentos por lote do cursor e por escrita")
+    parser.add_argument('--limite', type=int)
+    parser.add_argument('--ordenar', help="campo[:asc|desc]")
+    parser.add_argument('--incluir-id', action='store_true', help="Inclui o _id do MongoDB")
+    parser.add_argument('--contar', action='store_true', help="Mostra só o número de documentos")
+    return parser
+
+
+async def main_async(args) -> int:
+    mongo_url = os.environ.get('MONGO_URL')
+    if not mongo_url:
+        print("ERRO: Variável MONGO_URL não encontrada no .env", file=sys.stderr)
+        return 1
+    client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where())
+    db = client[os.environ.get('DB_NAME', 'alt_ilhabela')]
+    try:
+        total = await export(db, args)
+    finally:
+        client.close()
+    if not args.contar:
+        print(f"{total} documentos exportados de {args.colecao}", file=sys.stderr)
+    return 0
+
+
+def main():
+    args = build_parser().parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Suporte ao cabeçalho Idempotency-Key em POSTs caros (uploads, criação de
+imóveis, candidaturas).
+
+A primeira chamada com uma chave reserva-a na coleção `idempotency_keys`
+(estado "em_curso") e, quando termina, guarda a resposta. Repetições com a
+mesma chave devolvem a resposta guardada sem voltar a executar o pedido.
+Duplicados concorrentes esperam pelo pedido em curso: no mesmo worker através
+de um Future, noutros workers consultando a coleção. Se o pedido falhar a
+reserva é apagada para o cliente poder tentar de novo.
+
+Os registos expiram pelo índice TTL em `created_at`.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_COLLECTION = 'idempotency_keys'
+IDEMPOTENCY_TTL_SECONDS = int(
+    os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+# Quanto tempo um duplicado espera pelo pedido original
+IDEMPOTENCY_WAIT_SECONDS = float(
+    os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '60'))
+# Uma reserva em curso mais antiga do que isto é considerada abandonada
+LEASE = timedelta(seconds=float(
+    os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '300')))
+POLL_INTERVAL_SECONDS = 0.25
+MAX_KEY_LENGTH = 255
+
+EM_CURSO = 'em_curso'
+CONCLUIDO = 'concluido'
+
+
+def fingerprint(*partes: Any) -> str:
+    """Hash do conteúdo do pedido, para recusar a mesma chave com outro pedido."""
+    h = hashlib.sha256()
+    for parte in partes:
+        if not isinstance(parte, bytes):
+            parte = json.dumps(jsonable_encoder(parte), sort_keys=True).encode()
+        h.update(parte)
+    return h.hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, db):
+        self.collection = db[IDEMPOTENCY_COLLECTION]
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+    async def run(self, key: Optional[str], scope: str, request_hash: str,
+                  handler: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa `handler` uma única vez por (scope, key). Sem chave executa sempre."""
+        if not key:
+            return await handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key demasiado longa")
+        doc_id = f"{scope}:{key}"
+        agora = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                "_id": doc_id, "estado": EM_CURSO, "hash": request_hash,
+                "created_at": agora, "lock_ate": agora + LEASE})
+        except DuplicateKeyError:
+            return await self._replay(key, scope, request_hash, handler)
+        return await self._execute(doc_id, handler)
+
+    async def _execute(self, doc_id: str, handler: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[doc_id] = future
+        try:
+            resposta = jsonable_encoder(await handler())
+        except BaseException as e:
+            await self.collection.delete_one({"_id": doc_id, "estado": EM_CURSO})
+            future.set_exception(e)
+            # Evita o aviso de exceção não lida quando ninguém está à espera
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(doc_id, None)
+        await self.collection.update_one(
+            {"_id": doc_id},
+            {"$set": {"estado": CONCLUIDO, "resposta": resposta},
+             "$unset": {"lock_ate": ""}})
+        future.set_result(resposta)
+        return resposta
+
+    async def _replay(self, key: str, scope: str, request_hash: str,
+                      handler: Callable[[], Awaitable[Any]]) -> Any:
+        doc_id = f"{scope}:{key}"
+        local = self._inflight.get(doc_id)
+        if local is not None:
+            doc = await self.collection.find_one({"_id": doc_id}, {"hash": 1})
+            self._check_hash(doc, request_hash)
+            try:
+                return await asyncio.wait_for(asyncio.shield(local), IDEMPOTENCY_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=409, detail="Pedido com esta Idempotency-Key ainda em curso")
+
+        limite = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            doc = await self.collection.find_one({"_id": doc_id})
+            if doc is None:
+                # O pedido original falhou (ou expirou): tenta-se de novo
+                return await self.run(key, scope, request_hash, handler)
+            self._check_hash(doc, request_hash)
+            if doc["estado"] == CONCLUIDO:
+                return doc["resposta"]
+            agora = datetime.now(timezone.utc)
+            lock_ate = doc["lock_ate"]
+            if lock_ate.tzinfo is None:
+                lock_ate = lock_ate.replace(tzinfo=timezone.utc)
+            if lock_ate < agora:
+                # Reserva abandonada (worker terminou a meio): assume-se o pedido
+                tomado = await self.collection.find_one_and_update(
+                    {"_id": doc_id, "estado": EM_CURSO, "lock_ate": doc["lock_ate"]},
+                    {"$set": {"lock_ate": agora + LEASE}})
+                if tomado:
+                    logger.warning(f"Reserva de idempotência abandonada retomada: {doc_id}")
+                    return await self._execute(doc_id, handler)
+            if asyncio.get_running_loop().time() > limite:
+                raise HTTPException(
+                    status_code=409, detail="Pedido com esta Idempotency-Key ainda em curso")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    @staticmethod
+    def _check_hash(doc: Optional[dict], request_hash: str) -> None:
+        if doc and doc.get("hash") != request_hash:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key já usada com um pedido diferente")
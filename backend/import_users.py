@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Importação em massa de utilizadores a partir de CSV ou JSONL (não interativo).
+
+Colunas/campos: email, nome, telefone (opcional), role (opcional se --role),
+password (opcional se --gerar-senhas).
+
+Cada linha é validada com o modelo User, as senhas são convertidas em hash
+num pool de processos e os utilizadores são inseridos em lotes com
+insert_many(ordered=False). Erros de validação e duplicados são reportados
+por linha.
+
+Uso:
+    python import_users.py membros.csv --role membro --relatorio erros.jsonl
+    python import_users.py novos.jsonl --gerar-senhas --credenciais senhas.csv
+
+Nota: o tempo total é dominado pelo custo do bcrypt (~0,25 s por hash com o
+custo 12 por omissão) dividido pelo número de processos.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import secrets
+import string
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import certifi
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from pymongo.errors import BulkWriteError
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+ROLES_VALIDOS = {"admin", "associado", "membro", "parceiro"}
+MIN_PASSWORD = 6
+# Linhas lidas/validadas entre cada cedência ao event loop (deixa avançar o lote anterior)
+LINHAS_POR_CEDENCIA = 100
+
+
+# --- Modelo (Copiado do server.py para garantir independência) ---
+
+
+class User(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    email: EmailStr
+    nome: str
+    telefone: Optional[str] = None
+    role: str
+    ativo: bool = True
+    descricao: Optional[str] = None
+    foto_url: Optional[str] = None
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc))
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+def generate_random_password(length=10):
+    characters = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(characters) for _ in range(length))
+
+
+# --- Leitura ---
+
+
+def read_rows(path: Path, formato: str) -> Iterator[Tuple[int, dict]]:
+    """Devolve (número da linha, registo) sem carregar o ficheiro todo em memória."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if formato == 'csv':
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, {"__erro__": f"JSON inválido: {e}"}
+
+
+def validate_row(row: dict, args) -> Tuple[Optional[dict], Optional[str], bool, Optional[str]]:
+    """Devolve (documento sem hash, senha, se a senha foi gerada, erro)."""
+    if "__erro__" in row:
+        return None, None, False, row["__erro__"]
+    data = {k.strip().lower(): (v.strip() if isinstance(v, str) else v)
+            for k, v in row.items() if k}
+    data = {k: v for k, v in data.items() if v not in ('', None)}
+    data.setdefault("role", args.role)
+    if data.get("email"):
+        data["email"] = data["email"].lower()
+    if data.get("role") not in ROLES_VALIDOS:
+        return None, None, False, f"Role inválido: {data.get('role')!r}"
+
+    password = data.pop("password", None) or data.pop("senha", None)
+    gerada = password is None and args.gerar_senhas
+    if gerada:
+        password = generate_random_password()
+    if not password or len(password) < MIN_PASSWORD:
+        return None, None, False, f"Senha ausente ou com menos de {MIN_PASSWORD} caracteres"
+
+    try:
+        user = User(**{k: v for k, v in data.items() if k in User.model_fields})
+    except ValidationError as e:
+        erros = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                          for err in e.errors())
+        return None, None, False, erros
+    return user.dict(), password, gerada, None
+
+
+# --- Importação ---
+
+
+class Importacao:
+    def __init__(self, db, pool: ProcessPoolExecutor, args):
+        self.users = db.users
+        self.pool = pool
+        self.args = args
+        self.emails_vistos = set()
+        self.inseridos = 0
+        self.erros: List[dict] = []
+        self.credenciais: List[Tuple[str, str]] = []
+
+    def erro(self, line_no: int, email: Optional[str], mensagem: str):
+        self.erros.append({"linha": line_no, "email": email, "erro": mensagem})
+
+    async def processar_lote(self, lote: List[Tuple[int, dict, str, bool]]):
+        emails = [doc["email"] for _, doc, _, _ in lote]
+        existentes = await self.users.find(
+            {"email": {"$in": emails}}, {"email": 1}).to_list(length=None)
+        em_uso = {u["email"] for u in existentes}
+        pendentes = []
+        for line_no, doc, password, gerada in lote:
+            if doc["email"] in em_uso:
+                self.erro(line_no, doc["email"], "Email já cadastrado")
+            else:
+                pendentes.append((line_no, doc, password, gerada))
+        if not pendentes:
+            return
+
+        loop = asyncio.get_running_loop()
+        chunksize = max(1, len(pendentes) // (self.args.processos * 4))
+        hashes = await loop.run_in_executor(None, lambda: list(self.pool.map(
+            get_password_hash, [p for _, _, p, _ in pendentes], chunksize=chunksize)))
+        for (_, doc, _, _), hashed_password in zip(pendentes, hashes):
+            doc["hashed_password"] = hashed_password
+
+        if self.args.dry_run:
+            self.inseridos += len(pendentes)
+            return
+        docs = [doc for _, doc, _, _ in pendentes]
+        falhados = {}
+        try:
+            await self.users.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            falhados = {err["index"]: err for err in e.details.get("writeErrors", [])}
+        for idx, (line_no, doc, password, gerada) in enumerate(pendentes):
+            err = falhados.get(idx)
+            if err is None:
+                self.inseridos += 1
+                # Só as senhas geradas aqui; as do ficheiro o utilizador já conhece
+                if gerada:
+                    self.credenciais.append((doc["email"], password))
+            elif err.get("code") == 11000:
+                self.erro(line_no, doc["email"], "Email já cadastrado")
+            else:
+                self.erro(line_no, doc["email"], err.get("errmsg", "Erro ao inserir"))
+
+    async def run(self, path: Path, formato: str):
+        lote = []
+        insercao = None
+        for i, (line_no, row) in enumerate(read_rows(path, formato), start=1):
+            if insercao and i % LINHAS_POR_CEDENCIA == 0:
+                # A leitura e a validação são síncronas: sem ceder, o lote
+                # anterior só avançaria quando este estivesse completo
+                await asyncio.sleep(0)
+            doc, password, gerada, erro = validate_row(row, self.args)
+            if erro:
+                self.erro(line_no, row.get("email") if isinstance(row, dict) else None, erro)
+                continue
+            if doc["email"] in self.emails_vistos:
+                self.erro(line_no, doc["email"], "Email duplicado no ficheiro")
+                continue
+            self.emails_vistos.add(doc["email"])
+            lote.append((line_no, doc, password, gerada))
+            if len(lote) >= self.args.lote:
+                # O lote anterior é inserido enquanto este é preparado
+                if insercao:
+                    await insercao
+                insercao = asyncio.create_task(self.processar_lote(lote))
+                lote = []
+        if insercao:
+            await insercao
+        if lote:
+            await self.processar_lote(lote)
+
+
+async def main_async(args):
+    mongo_url = os.environ.get('MONGO_URL')
+    db_name = os.environ.get('DB_NAME', 'alt_ilhabela')
+    if not mongo_url:
+        print("ERRO: Variável MONGO_URL não encontrada no .env")
+        return 1
+
+    formato = args.formato or ('csv' if args.ficheiro.suffix.lower() == '.csv' else 'jsonl')
+    client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where())
+    db = client[db_name]
+    inicio = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.processos) as pool:
+            importacao = Importacao(db, pool, args)
+            await importacao.run(args.ficheiro, formato)
+    finally:
+        client.close()
+    duracao = time.perf_counter() - inicio
+
+    print(f"\n{'[DRY RUN] ' if args.dry_run else ''}Inseridos: {importacao.inseridos} | "
+          f"Erros: {len(importacao.erros)} | Tempo: {duracao:.1f}s")
+    for erro in importacao.erros[:20]:
+        print(f"  linha {erro['linha']} ({erro['email']}): {erro['erro']}")
+    if len(importacao.erros) > 20:
+        print(f"  ... e mais {len(importacao.erros) - 20} erros")
+
+    if args.relatorio:
+        with open(args.relatorio, 'w', encoding='utf-8') as f:
+            for erro in importacao.erros:
+                f.write(json.dumps(erro, ensure_ascii=False) + '\n')
+        print(f"Relatório de erros: {args.relatorio}")
+    if args.credenciais and importacao.credenciais:
+        with open(args.credenciais, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["email", "senha"])
+            writer.writerows(importacao.credenciais)
+        print(f"Senhas geradas: {args.credenciais}")
+    return 0 if not importacao.erros else 2
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Importação em massa de utilizadores (CSV/JSONL)")
+    parser.add_argument('ficheiro', type=Path)
+    parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                        help="Por omissão é deduzido pela extensão")
+    parser.add_argument('--role', choices=sorted(ROLES_VALIDOS),
+                        help="Role para linhas sem a coluna role")
+    parser.add_argument('--gerar-senhas', action='store_true',
+                        help="Gera senha aleatória para linhas sem password")
+    parser.add_argument('--credenciais', type=Path,
+                        help="CSV onde guardar as senhas geradas")
+    parser.add_argument('--lote', type=int, default=1000,
+                        help="Utilizadores por insert_many")
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                        help="Processos para o hash das senhas")
+    parser.add_argument('--relatorio', type=Path,
+                        help="JSONL com os erros por linha")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Valida e faz hash sem inserir")
+    args = parser.parse_args()
+    if args.gerar_senhas and not args.credenciais and not args.dry_run:
+        parser.error("--gerar-senhas requer --credenciais")
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Barramento de invalidação da cache entre workers.
+
+Cada escrita que invalida a cache incrementa a versão de um documento na coleção
+`cache_versions` (um por namespace, ou por namespace+chave). Cada worker consulta
+periodicamente só os documentos alterados desde a última leitura e remove da sua
+cache local as entradas cuja versão mudou. `updated_at` é preenchido pelo próprio
+MongoDB ($currentDate), por isso todos os workers comparam com o mesmo relógio.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_COLLECTION = 'cache_versions'
+POLL_INTERVAL_SECONDS = float(
+    os.environ.get('CACHE_INVALIDATION_POLL_SECONDS', '1'))
+# Margem para escritas que ficam visíveis ligeiramente depois do seu updated_at
+POLL_SLACK = timedelta(seconds=5)
+# Documentos sem alterações há mais tempo que isto são apagados pelo índice TTL
+VERSIONS_TTL_SECONDS = 24 * 60 * 60
+
+
+def _doc_id(namespace: str, key: Optional[str]) -> str:
+    return namespace if key is None else f"{namespace}:{key}"
+
+
+class InvalidationBus:
+    def __init__(self, db, cache: TTLCache, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.collection = db[VERSIONS_COLLECTION]
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self._versions: Dict[str, int] = {}
+        self._watermark = None
+        self._poller: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+        self._subscribers: Dict[str, List[Callable[[Optional[str]], Awaitable[None]]]] = {}
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("updated_at", expireAfterSeconds=VERSIONS_TTL_SECONDS)
+
+    def subscribe(self, namespace: str, callback: Callable[[Optional[str]], Awaitable[None]]) -> None:
+        """Chama `callback(key)` quando outro worker publica uma invalidação deste namespace."""
+        self._subscribers.setdefault(namespace, []).append(callback)
+
+    def invalidate(self, namespace: str, key: Optional[str] = None) -> None:
+        """Invalida localmente de imediato e publica para os outros workers em segundo plano."""
+        self.cache.invalidate(namespace, key)
+        task = asyncio.get_running_loop().create_task(self.publish(namespace, key))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def publish(self, namespace: str, key: Optional[str] = None) -> None:
+        doc_id = _doc_id(namespace, key)
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": doc_id},
+                {"$inc": {"version": 1},
+                 "$set": {"namespace": namespace, "key": key},
+                 "$currentDate": {"updated_at": True}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+            # A própria escrita já foi aplicada localmente
+            self._versions[doc_id] = doc["version"]
+        except Exception as e:
+            logger.warning(f"Falha ao publicar invalidação de {doc_id}: {e}")
+
+    async def poll_once(self) -> int:
+        """Aplica as invalidações publicadas desde a última consulta. Devolve quantas aplicou."""
+        query = {}
+        if self._watermark is not None:
+            query = {"updated_at": {"$gte": self._watermark - POLL_SLACK}}
+        applied = 0
+        async for doc in self.collection.find(query):
+            known = self._versions.get(doc["_id"])
+            if known != doc["version"]:
+                self._versions[doc["_id"]] = doc["version"]
+                # Na primeira consulta só registamos as versões existentes
+                if self._watermark is not None:
+                    self.cache.invalidate(doc["namespace"], doc.get("key"))
+                    for callback in self._subscribers.get(doc["namespace"], []):
+                        try:
+                            await callback(doc.get("key"))
+                        except Exception as e:
+                            logger.warning(
+                                f"Falha ao aplicar invalidação de {doc['_id']}: {e}")
+                    applied += 1
+            if self._watermark is None or doc["updated_at"] > self._watermark:
+                self._watermark = doc["updated_at"]
+        if self._watermark is None:
+            # Coleção vazia: qualquer documento que apareça a seguir é novo
+            self._watermark = (await self.collection.database.command("hello"))["localTime"]
+        return applied
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao consultar invalidações da cache: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
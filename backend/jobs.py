@@ -0,0 +1,212 @@
+"""
+Fila de tarefas persistente no MongoDB (coleção `jobs`).
+
+Os handlers da API só registam a tarefa (um insert) e respondem; um processo
+worker separado (worker.py) executa-a. Cada tarefa é reclamada com um
+find_one_and_update atómico que lhe dá um lease: se o worker morrer a meio,
+o lease expira e a tarefa volta a ficar visível para outro worker. Falhas são
+repetidas com backoff exponencial até `max_tentativas`; depois a tarefa fica
+"falhado" para inspeção. Prioridades mais altas são executadas primeiro.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = 'jobs'
+PENDENTE = 'pendente'
+EM_CURSO = 'em_curso'
+CONCLUIDO = 'concluido'
+FALHADO = 'falhado'
+
+PRIORIDADE_ALTA = 10
+PRIORIDADE_NORMAL = 5
+PRIORIDADE_BAIXA = 0
+
+MAX_TENTATIVAS = int(os.environ.get('JOBS_MAX_ATTEMPTS', '5'))
+# Tempo durante o qual uma tarefa reclamada fica invisível para outros workers
+VISIBILITY_TIMEOUT = timedelta(seconds=float(
+    os.environ.get('JOBS_VISIBILITY_TIMEOUT_SECONDS', '60')))
+BACKOFF_BASE_SECONDS = float(os.environ.get('JOBS_BACKOFF_BASE_SECONDS', '5'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('JOBS_BACKOFF_MAX_SECONDS', '3600'))
+POLL_INTERVAL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', '1'))
+# Tarefas concluídas são apagadas pelo índice TTL após este período
+RETENCAO_CONCLUIDAS_SECONDS = int(
+    os.environ.get('JOBS_RETENTION_DAYS', '7')) * 24 * 60 * 60
+
+Handler = Callable[[dict], Awaitable[Any]]
+HANDLERS: Dict[str, Handler] = {}
+
+
+def handler(tipo: str):
+    """Regista a função que executa as tarefas de um tipo."""
+    def register(func: Handler) -> Handler:
+        HANDLERS[tipo] = func
+        return func
+    return register
+
+
+def _job_doc(tipo: str, payload: dict, prioridade: int, atraso: float,
+             max_tentativas: int) -> dict:
+    agora = datetime.now(timezone.utc)
+    return {
+        "_id": str(uuid.uuid4()),
+        "tipo": tipo,
+        "payload": payload,
+        "prioridade": prioridade,
+        "estado": PENDENTE,
+        "tentativas": 0,
+        "max_tentativas": max_tentativas,
+        "disponivel_em": agora + timedelta(seconds=atraso),
+        "created_at": agora,
+        "updated_at": agora,
+        # O worker continua o trace do pedido que registou a tarefa
+        "traceparent": tracing.current_traceparent(),
+    }
+
+
+async def ensure_indexes(db):
+    collection = db[JOBS_COLLECTION]
+    await collection.create_index(
+        [("estado", 1), ("prioridade", -1), ("disponivel_em", 1)])
+    await collection.create_index("concluido_em", expireAfterSeconds=RETENCAO_CONCLUIDAS_SECONDS)
+
+
+async def enqueue(db, tipo: str, payload: dict, prioridade: int = PRIORIDADE_NORMAL,
+                  atraso: float = 0, max_tentativas: int = MAX_TENTATIVAS) -> str:
+    doc = _job_doc(tipo, payload, prioridade, atraso, max_tentativas)
+    await db[JOBS_COLLECTION].insert_one(doc)
+    return doc["_id"]
+
+
+async def enqueue_many(db, tipo: str, payloads: List[dict], prioridade: int = PRIORIDADE_NORMAL,
+                       max_tentativas: int = MAX_TENTATIVAS) -> int:
+    if not payloads:
+        return 0
+    docs = [_job_doc(tipo, payload, prioridade, 0, max_tentativas) for payload in payloads]
+    await db[JOBS_COLLECTION].insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def backoff(tentativas: int) -> float:
+    """Atraso antes da próxima tentativa: exponencial com jitter."""
+    atraso = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (tentativas - 1))
+    return atraso * random.uniform(0.5, 1.0)
+
+
+class Worker:
+    def __init__(self, db, concorrencia: int = 4, tipos: Optional[List[str]] = None):
+        self.collection = db[JOBS_COLLECTION]
+        self.concorrencia = concorrencia
+        self.tipos = tipos
+        self.nome = f"{socket.gethostname()}:{os.getpid()}"
+        self._parar = asyncio.Event()
+
+    def stop(self) -> None:
+        """Deixa de reclamar tarefas; as que estão em curso terminam."""
+        self._parar.set()
+
+    async def claim(self) -> Optional[dict]:
+        agora = datetime.now(timezone.utc)
+        query = {"$or": [
+            {"estado": PENDENTE, "disponivel_em": {"$lte": agora}},
+            # Lease expirado: o worker que a tinha morreu ou bloqueou
+            {"estado": EM_CURSO, "lease_ate": {"$lt": agora}},
+        ]}
+        if self.tipos:
+            query["tipo"] = {"$in": self.tipos}
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"estado": EM_CURSO, "lease_ate": agora + VISIBILITY_TIMEOUT,
+                      "worker": self.nome, "updated_at": agora},
+             "$inc": {"tentativas": 1}},
+            sort=[("prioridade", -1), ("disponivel_em", 1)],
+            return_document=ReturnDocument.AFTER)
+
+    async def _heartbeat(self, job: dict):
+        """Renova o lease enquanto a tarefa corre."""
+        while True:
+            await asyncio.sleep(VISIBILITY_TIMEOUT.total_seconds() / 3)
+            try:
+                await self.collection.update_one(
+                    {"_id": job["_id"], "worker": self.nome, "estado": EM_CURSO},
+                    {"$set": {"lease_ate": datetime.now(timezone.utc) + VISIBILITY_TIMEOUT}})
+            except Exception as e:
+                logger.warning(f"Falha ao renovar o lease da tarefa {job['_id']}: {e}")
+
+    async def run_job(self, job: dict) -> bool:
+        func = HANDLERS.get(job["tipo"])
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(job))
+        try:
+            if func is None:
+                raise LookupError(f"Tipo de tarefa desconhecido: {job['tipo']}")
+            with tracing.trace(f"job {job['tipo']}", job.get("traceparent"),
+                               confiar_amostragem=True, job_id=job["_id"],
+                               tentativa=job["tentativas"]):
+                await func(job["payload"])
+        except Exception as e:
+            agora = datetime.now(timezone.utc)
+            erro = f"{type(e).__name__}: {e}"
+            if job["tentativas"] >= job["max_tentativas"]:
+                update = {"estado": FALHADO, "erro": erro,
+                          "trace": traceback.format_exc(), "updated_at": agora}
+                logger.error(f"Tarefa {job['_id']} ({job['tipo']}) falhou definitivamente: {erro}")
+            else:
+                update = {"estado": PENDENTE, "erro": erro, "updated_at": agora,
+                          "disponivel_em": agora + timedelta(seconds=backoff(job["tentativas"]))}
+                logger.warning(
+                    f"Tarefa {job['_id']} ({job['tipo']}) falhou "
+                    f"(tentativa {job['tentativas']}/{job['max_tentativas']}): {erro}")
+            await self.collection.update_one(
+                {"_id": job["_id"], "worker": self.nome},
+                {"$set": update, "$unset": {"lease_ate": ""}})
+            return False
+        finally:
+            heartbeat.cancel()
+        agora = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker": self.nome},
+            {"$set": {"estado": CONCLUIDO, "concluido_em": agora, "updated_at": agora},
+             "$unset": {"lease_ate": "", "erro": ""}})
+        return True
+
+    async def _slot(self):
+        while not self._parar.is_set():
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logger.warning(f"Falha ao reclamar tarefa: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._parar.wait(), POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run(self):
+        logger.info(f"Worker {self.nome} a processar tarefas ({self.concorrencia} em paralelo)")
+        await asyncio.gather(*(self._slot() for _ in range(self.concorrencia)))
+        logger.info(f"Worker {self.nome} terminado")
+
+
+async def resumo(db) -> dict:
+    """Contagem de tarefas por estado e as últimas falhas definitivas."""
+    collection = db[JOBS_COLLECTION]
+    contagens = {c["_id"]: c["total"] async for c in collection.aggregate([
+        {"$group": {"_id": "$estado", "total": {"$sum": 1}}}])}
+    falhadas = await collection.find(
+        {"estado": FALHADO}, {"trace": 0}).sort("updated_at", -1).limit(20).to_list(length=None)
+    return {"contagens": contagens, "falhadas": falhadas}
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Recolha (mark-and-sweep) das fotos e vídeos órfãos no Cloudinary.
+
+Imóveis apagados, fotos removidas numa edição e fotos de perfil substituídas
+deixam os ficheiros no Cloudinary. Esta recolha:
+
+1. constrói o conjunto de public_ids referenciados, percorrendo em streaming
+   imóveis, perfis de parceiros, notícias e utilizadores (e as cópias
+   arquivadas ou em quarentena, que podem ser restauradas);
+2. compara-o com a listagem dos ficheiros no Cloudinary (prefixo
+   MEDIA_GC_PREFIX);
+3. marca os órfãos em `media_orfaos` com a data em que foram vistos pela
+   primeira vez; uma marca desaparece se o ficheiro voltar a ser referenciado;
+4. apaga, em lotes com pausa entre eles, os órfãos marcados há mais do que o
+   período de graça e carregados há mais do que esse período (um upload
+   recente ainda pode estar num formulário por submeter).
+
+Em dry run nada é escrito nem apagado: só se devolve o relatório.
+
+Uso (manual ou via cron; também corre como tarefa "media_gc" no worker):
+    python media_gc.py --dry-run
+    python media_gc.py --max 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from pymongo.errors import BulkWriteError
+
+import archive
+import migrations
+
+logger = logging.getLogger(__name__)
+
+MARCAS_COLLECTION = 'media_orfaos'
+PREFIX = os.environ.get('MEDIA_GC_PREFIX', 'alt_ilhabela/')
+GRACE_PERIOD = timedelta(hours=float(os.environ.get('MEDIA_GC_GRACE_HOURS', '72')))
+# A Admin API aceita no máximo 100 public_ids por pedido de remoção
+BATCH_SIZE = min(100, int(os.environ.get('MEDIA_GC_BATCH_SIZE', '100')))
+DELETE_INTERVAL_SECONDS = float(os.environ.get('MEDIA_GC_DELETE_INTERVAL_SECONDS', '2'))
+MAX_DELETES = int(os.environ.get('MEDIA_GC_MAX_DELETES', '1000'))
+RESOURCE_TYPES = ("image", "video")
+LISTAGEM_PAGE_SIZE = 500
+AMOSTRA_RELATORIO = 50
+
+# coleção -> campos com URLs de media
+REFERENCIAS = {
+    "imoveis": ["fotos", "video_url"],
+    "perfis_parceiros": ["fotos", "video_url"],
+    "noticias": ["fotos", "video_url", "relacionadas.foto"],
+    "users": ["foto_url"],
+}
+# coleção -> campos de texto/HTML com URLs embutidos (<img>/<video> do editor de notícias)
+REFERENCIAS_TEXTO = {
+    "imoveis": ["descricao"],
+    "perfis_parceiros": ["descricao"],
+    "noticias": ["conteudo", "resumo"],
+}
+
+Asset = Tuple[str, str]  # (resource_type, public_id)
+
+_VERSAO = re.compile(r"^v\d+$")
+# O editor guarda o URL prefixado pelo BACKEND_URL; basta encontrar o do Cloudinary
+_URL_CLOUDINARY = re.compile(r"https?://res\.cloudinary\.com/[^\s\"'<>()&]+")
+
+
+def asset_from_url(url) -> Optional[Asset]:
+    """(resource_type, public_id) de um URL de entrega do Cloudinary, ou None."""
+    if not isinstance(url, str) or "res.cloudinary.com" not in url:
+        return None
+    partes = urlparse(url).path.strip("/").split("/")
+    # /<cloud>/<resource_type>/upload/[transformações/][v<versão>/]<public_id>.<ext>
+    if len(partes) < 4 or partes[2] != "upload":
+        return None
+    resto = partes[3:]
+    versoes = [i for i, parte in enumerate(resto) if _VERSAO.match(parte)]
+    if versoes:
+        resto = resto[versoes[0] + 1:]
+    if not resto:
+        return None
+    resto[-1] = resto[-1].rsplit(".", 1)[0]
+    return partes[1], "/".join(resto)
+
+
+def urls_em_texto(texto) -> List[str]:
+    if not isinstance(texto, str):
+        return []
+    return _URL_CLOUDINARY.findall(texto)
+
+
+def _valores(doc: dict, campo: str):
+    valor = doc
+    for chave in campo.split("."):
+        if isinstance(valor, list):
+            return [v.get(chave) for v in valor if isinstance(v, dict)]
+        if not isinstance(valor, dict):
+            return []
+        valor = valor.get(chave)
+    return valor if isinstance(valor, list) else [valor]
+
+
+def colecoes_referencia(colecao: str) -> List[str]:
+    """A coleção e as cópias dos seus documentos que ainda podem voltar a ela."""
+    nomes = [colecao]
+    if colecao in archive.ARQUIVAVEIS:
+        nomes.append(archive.archive_name(colecao))
+    if colecao in migrations.MIGRATIONS:
+        # Documentos em quarentena podem ser corrigidos e repostos
+        nomes.append(migrations.quarantine_name(colecao))
+    return nomes
+
+
+async def referenciados(db) -> Set[Asset]:
+    """Todos os ficheiros referenciados pelas coleções quentes, arquivadas e em quarentena."""
+    assets: Set[Asset] = set()
+    for colecao, campos in REFERENCIAS.items():
+        textos = REFERENCIAS_TEXTO.get(colecao, [])
+        projection = {"_id": 0, **{campo: 1 for campo in campos + textos}}
+        for nome in colecoes_referencia(colecao):
+            async for doc in db[nome].find({}, projection, batch_size=1000):
+                urls = [url for campo in campos for url in _valores(doc, campo)]
+                urls += [url for campo in textos for url in urls_em_texto(doc.get(campo))]
+                for url in urls:
+                    asset = asset_from_url(url)
+                    if asset:
+                        assets.add(asset)
+    return assets
+
+
+def _cloudinary_api():
+    import cloudinary
+    import cloudinary.api
+    cloudinary.config(secure=True)
+    return cloudinary.api
+
+
+def listar_assets(api, prefix: str = PREFIX) -> Iterator[dict]:
+    """Percorre (síncrono, paginado) os ficheiros carregados com o prefixo dado."""
+    for resource_type in RESOURCE_TYPES:
+        cursor = None
+        while True:
+            kwargs = {"type": "upload", "resource_type": resource_type, "prefix": prefix,
+                      "max_results": LISTAGEM_PAGE_SIZE}
+            if cursor:
+                kwargs["next_cursor"] = cursor
+            pagina = api.resources(**kwargs)
+            for resource in pagina.get("resources", []):
+                resource.setdefault("resource_type", resource_type)
+                yield resource
+            cursor = pagina.get("next_cursor")
+            if not cursor:
+                break
+
+
+def _created_at(resource: dict) -> datetime:
+    valor = resource.get("created_at")
+    if not valor:
+        return datetime.now(timezone.utc)
+    return datetime.fromisoformat(valor.replace("Z", "+00:00"))
+
+
+def _marca_id(asset: Asset) -> str:
+    return f"{asset[0]}:{asset[1]}"
+
+
+async def _marcar(db, orfaos: Dict[Asset, dict], agora: datetime) -> Dict[str, datetime]:
+    """Atualiza as marcas e devolve a data da primeira deteção de cada órfão."""
+    marcas = db[MARCAS_COLLECTION]
+    existentes = {doc["_id"]: doc["detectado_em"]
+                  async for doc in marcas.find({}, {"detectado_em": 1})}
+    atuais = {_marca_id(asset): asset for asset in orfaos}
+    # Marcas de ficheiros que voltaram a ser referenciados ou já não existem
+    obsoletas = [marca_id for marca_id in existentes if marca_id not in atuais]
+    if obsoletas:
+        await marcas.delete_many({"_id": {"$in": obsoletas}})
+    novas = [{"_id": marca_id, "resource_type": asset[0], "public_id": asset[1],
+              "bytes": orfaos[asset].get("bytes", 0), "detectado_em": agora}
+             for marca_id, asset in atuais.items() if marca_id not in existentes]
+    if novas:
+        try:
+            await marcas.insert_many(novas, ordered=False)
+        except BulkWriteError:
+            # Outra recolha em paralelo marcou os mesmos ficheiros
+            pass
+    return {marca_id: existentes.get(marca_id, agora) for marca_id in atuais}
+
+
+async def _apagar(db, api, elegiveis: List[Asset], intervalo: float) -> int:
+    apagados = 0
+    por_tipo: Dict[str, List[str]] = {}
+    for resource_type, public_id in elegiveis:
+        por_tipo.setdefault(resource_type, []).append(public_id)
+    primeiro = True
+    for resource_type, public_ids in por_tipo.items():
+        for inicio in range(0, len(public_ids), BATCH_SIZE):
+            if not primeiro:
+                # Respeita o limite de pedidos por hora da Admin API
+                await asyncio.sleep(intervalo)
+            primeiro = False
+            lote = public_ids[inicio:inicio + BATCH_SIZE]
+            resultado = await asyncio.to_thread(
+                api.delete_resources, lote, resource_type=resource_type)
+            removidos = [public_id for public_id, estado in resultado.get("deleted", {}).items()
+                         if estado in ("deleted", "not_found")]
+            await db[MARCAS_COLLECTION].delete_many(
+                {"_id": {"$in": [_marca_id((resource_type, p)) for p in removidos]}})
+            apagados += sum(1 for p in removidos if resultado["deleted"][p] == "deleted")
+            logger.info(f"Recolha de media: {len(removidos)} ficheiros ({resource_type}) removidos do Cloudinary")
+    return apagados
+
+
+async def ensure_indexes(db):
+    await db[MARCAS_COLLECTION].create_index("detectado_em")
+
+
+async def recolher(db, dry_run: bool = True, max_deletes: int = MAX_DELETES,
+                   grace: timedelta = GRACE_PERIOD, intervalo: float = DELETE_INTERVAL_SECONDS,
+                   api=None) -> dict:
+    """
+    Executa a recolha e devolve o relatório. Em dry run as marcas não são
+    atualizadas, por isso os órfãos ainda não marcados não contam como elegíveis.
+    """
+    api = api or _cloudinary_api()
+    agora = datetime.now(timezone.utc)
+    usados = await referenciados(db)
+    assets = await asyncio.to_thread(lambda: list(listar_assets(api)))
+
+    orfaos: Dict[Asset, dict] = {}
+    for resource in assets:
+        asset = (resource["resource_type"], resource["public_id"])
+        if asset not in usados:
+            orfaos[asset] = resource
+
+    if dry_run:
+        detectados = {doc["_id"]: doc["detectado_em"]
+                      async for doc in db[MARCAS_COLLECTION].find({}, {"detectado_em": 1})}
+    else:
+        detectados = await _marcar(db, orfaos, agora)
+
+    limite = agora - grace
+    elegiveis = []
+    for asset, resource in orfaos.items():
+        detectado_em = detectados.get(_marca_id(asset))
+        if detectado_em is None:
+            continue
+        if detectado_em.tzinfo is None:
+            detectado_em = detectado_em.replace(tzinfo=timezone.utc)
+        if detectado_em <= limite and _created_at(resource) <= limite:
+            elegiveis.append(asset)
+    elegiveis.sort()
+    elegiveis = elegiveis[:max_deletes]
+
+    relatorio = {
+        "dry_run": dry_run,
+        "assets": len(assets),
+        "referenciados": len(usados),
+        "orfaos": len(orfaos),
+        "orfaos_bytes": sum(r.get("bytes", 0) for r in orfaos.values()),
+        "elegiveis": len(elegiveis),
+        "elegiveis_bytes": sum(orfaos[a].get("bytes", 0) for a in elegiveis),
+        "amostra": [{"resource_type": a[0], "public_id": a[1]}
+                    for a in elegiveis[:AMOSTRA_RELATORIO]],
+        "apagados": 0,
+    }
+    if not dry_run and elegiveis:
+        relatorio["apagados"] = await _apagar(db, api, elegiveis, intervalo)
+    return relatorio
+
+
+async def _main():
+    from pathlib import Path
+
+    import certifi
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Recolha dos ficheiros órfãos no Cloudinary")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Só mostra o relatório, não marca nem apaga")
+    parser.add_argument('--max', type=int, default=MAX_DELETES,
+                        help="Máximo de ficheiros apagados nesta execução")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'], tlsCAFile=certifi.where())
+    db = client[os.environ.get('DB_NAME', 'alt_ilhabela')]
+    try:
+        await ensure_indexes(db)
+        relatorio = await recolher(db, dry_run=args.dry_run, max_deletes=args.max)
+        print(f"✅ {relatorio['assets']} ficheiros no Cloudinary, "
+              f"{relatorio['orfaos']} órfãos ({relatorio['orfaos_bytes']} bytes)")
+        print(f"✅ {relatorio['elegiveis']} elegíveis para remoção "
+              f"({relatorio['elegiveis_bytes']} bytes), {relatorio['apagados']} apagados")
+        for asset in relatorio["amostra"]:
+            print(f"   {asset['resource_type']}: {asset['public_id']}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Migrações de esquema versionadas e validação offline dos documentos.
+
+Cada documento de imoveis, perfis_parceiros e noticias tem um campo
+`schema_version`. As migrações de uma coleção formam uma lista ordenada: a
+função registada com a versão N leva um documento da versão N-1 para N. A
+versão atual de cada coleção é o número de migrações registadas e os novos
+documentos já são gravados com ela.
+
+Este script percorre em lotes os documentos desatualizados, aplica as
+migrações em falta, valida o resultado com o modelo Pydantic da API e:
+  - grava só os campos alterados e a nova versão (atualizações concorrentes
+    de outros campos não se perdem);
+  - move para `<coleção>_quarentena`, com os erros de validação, os
+    documentos que continuam inválidos.
+
+Assim os handlers de leitura podem confiar nos documentos com a versão atual
+e entregá-los sem os validar um a um.
+
+Uso:
+    python migrations.py --dry-run
+    python migrations.py --colecao imoveis --lote 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+from pymongo import ReplaceOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_FIELD = 'schema_version'
+QUARANTINE_SUFFIX = '_quarentena'
+DEFAULT_BATCH_SIZE = 500
+
+Migracao = Callable[[dict], dict]
+MIGRATIONS: Dict[str, List[Migracao]] = {}
+
+
+def migration(colecao: str, versao: int):
+    """Regista a migração que leva os documentos de `colecao` à `versao`."""
+    def register(func: Migracao) -> Migracao:
+        migracoes = MIGRATIONS.setdefault(colecao, [])
+        if versao != len(migracoes) + 1:
+            raise ValueError(f"Migração {colecao} v{versao} fora de ordem")
+        migracoes.append(func)
+        return func
+    return register
+
+
+def current_version(colecao: str) -> int:
+    return len(MIGRATIONS.get(colecao, []))
+
+
+def quarantine_name(colecao: str) -> str:
+    return f"{colecao}{QUARANTINE_SUFFIX}"
+
+
+def filtro_desatualizados(colecao: str) -> dict:
+    return {"$or": [{SCHEMA_VERSION_FIELD: {"$exists": False}},
+                    {SCHEMA_VERSION_FIELD: {"$lt": current_version(colecao)}}]}
+
+
+def migrar(colecao: str, doc: dict) -> dict:
+    """Aplica a `doc` (uma cópia) as migrações em falta."""
+    doc = dict(doc)
+    versao = doc.get(SCHEMA_VERSION_FIELD) or 0
+    for func in MIGRATIONS.get(colecao, [])[versao:]:
+        doc = func(doc)
+    doc[SCHEMA_VERSION_FIELD] = current_version(colecao)
+    return doc
+
+
+# --- Normalizações partilhadas ---
+
+def _normalizar_fotos(doc: dict) -> None:
+    fotos = doc.get("fotos")
+    if isinstance(fotos, str):
+        fotos = [fotos]
+    doc["fotos"] = [str(foto) for foto in fotos or [] if foto]
+
+
+def _vazio_para_none(doc: dict, campos: List[str]) -> None:
+    for campo in campos:
+        if campo in doc and isinstance(doc[campo], str) and not doc[campo].strip():
+            doc[campo] = None
+
+
+def _datas(doc: dict) -> None:
+    # Sem created_at o modelo gerava uma data nova em cada leitura
+    if not doc.get("created_at"):
+        doc["created_at"] = doc.get("updated_at") or datetime.now(timezone.utc)
+    if not doc.get("updated_at"):
+        doc["updated_at"] = doc["created_at"]
+
+
+# --- Versão 1: normaliza o que os handlers corrigiam a cada leitura/escrita ---
+
+@migration("imoveis", 1)
+def imoveis_v1(doc: dict) -> dict:
+    _normalizar_fotos(doc)
+    _vazio_para_none(doc, ["video_url", "link_booking", "link_airbnb"])
+    _datas(doc)
+    return doc
+
+
+@migration("perfis_parceiros", 1)
+def perfis_parceiros_v1(doc: dict) -> dict:
+    _normalizar_fotos(doc)
+    _vazio_para_none(doc, ["website", "instagram", "facebook", "video_url"])
+    _datas(doc)
+    return doc
+
+
+@migration("noticias", 1)
+def noticias_v1(doc: dict) -> dict:
+    _normalizar_fotos(doc)
+    _vazio_para_none(doc, ["video_url", "link_externo"])
+    tags = doc.get("tags") or []
+    doc["tags"] = list(dict.fromkeys(
+        t.strip().lower() for t in tags if isinstance(t, str) and t.strip()))
+    _datas(doc)
+    return doc
+
+
+def _alteracoes(original: dict, migrado: dict):
+    definir = {campo: valor for campo, valor in migrado.items()
+               if campo not in original or original[campo] != valor}
+    remover = {campo: "" for campo in original if campo not in migrado}
+    return definir, remover
+
+
+async def validar_colecao(db, colecao: str, modelo, dry_run: bool = False,
+                          lote: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """Migra e valida os documentos desatualizados de uma coleção. Devolve as contagens."""
+    collection = db[colecao]
+    quarentena = db[quarantine_name(colecao)]
+    contagens = {"migrados": 0, "quarentena": 0}
+    ignorados = []
+    while True:
+        query = filtro_desatualizados(colecao)
+        if ignorados:
+            # Em dry run nada muda: não voltar a ler os mesmos documentos
+            query = {**query, "_id": {"$nin": ignorados}}
+        docs = await collection.find(query).limit(lote).to_list(length=None)
+        if not docs:
+            return contagens
+        atualizacoes, quarentenados = [], []
+        for doc in docs:
+            migrado = migrar(colecao, doc)
+            try:
+                modelo(**migrado)
+            except ValidationError as e:
+                logger.warning(f"{colecao} {doc.get('id')}: inválido, vai para quarentena: {e}")
+                quarentenados.append({**doc, "erros": json.loads(e.json()),
+                                      "quarentena_em": datetime.now(timezone.utc)})
+                continue
+            definir, remover = _alteracoes(doc, migrado)
+            update = {"$set": definir}
+            if remover:
+                update["$unset"] = remover
+            atualizacoes.append(UpdateOne(
+                {"_id": doc["_id"], SCHEMA_VERSION_FIELD: doc.get(SCHEMA_VERSION_FIELD)}, update))
+        contagens["migrados"] += len(atualizacoes)
+        contagens["quarentena"] += len(quarentenados)
+        if dry_run:
+            ignorados.extend(doc["_id"] for doc in docs)
+            continue
+        if atualizacoes:
+            await collection.bulk_write(atualizacoes, ordered=False)
+        if quarentenados:
+            # Copia primeiro (repetir é seguro) e só depois apaga da coleção
+            await quarentena.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in quarentenados],
+                ordered=False)
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in quarentenados]}})
+
+
+async def validar(db, modelos: Dict[str, type], colecoes: Optional[List[str]] = None,
+                  dry_run: bool = False, lote: int = DEFAULT_BATCH_SIZE) -> Dict[str, Dict[str, int]]:
+    return {colecao: await validar_colecao(db, colecao, modelos[colecao], dry_run, lote)
+            for colecao in colecoes or MIGRATIONS}
+
+
+def _modelos():
+    import server
+    return {"imoveis": server.Imovel, "perfis_parceiros": server.PerfilParceiro,
+            "noticias": server.Noticia}
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Migração e validação do esquema dos documentos")
+    parser.add_argument('--colecao', action='append', choices=sorted(MIGRATIONS),
+                        help="Só esta coleção (pode repetir)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Só conta o que seria migrado/posto em quarentena")
+    parser.add_argument('--lote', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    # server carrega o .env, cria a ligação ao MongoDB e define os modelos
+    import server
+    try:
+        resultado = await validar(server.db, _modelos(), args.colecao, args.dry_run, args.lote)
+        for colecao, contagens in resultado.items():
+            print(f"✅ {colecao} (v{current_version(colecao)}): {contagens['migrados']} migrados")
+            if contagens["quarentena"]:
+                destino = "a mover" if args.dry_run else "movidos"
+                print(f"❌ {colecao}: {contagens['quarentena']} inválidos {destino} para "
+                      f"{quarantine_name(colecao)}")
+    finally:
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
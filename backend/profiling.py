@@ -0,0 +1,208 @@
+"""
+Perfis de CPU e de memória do processo em produção, a pedido de um admin.
+
+CPU: uma thread amostra periodicamente a pilha das threads do processo
+(sys._current_frames) durante N segundos. O resultado são pilhas colapsadas
+("modulo:funcao;modulo:funcao N", o formato do flamegraph.pl e do speedscope)
+ou um flamegraph SVG. Por omissão só é amostrada a thread do event loop: é lá
+que um ciclo de validação Pydantic ou outro trabalho síncrono atrasa todos os
+pedidos.
+
+Memória: enquanto o tracemalloc estiver ativo, guarda-se um snapshot de base e
+o middleware regista, por rota, quanta memória rastreada cada pedido deixou
+alocada. O relatório compara um snapshot novo com o de base (linhas que mais
+cresceram) e lista as rotas com maior crescimento. Com pedidos concorrentes a
+atribuição por rota é aproximada.
+
+Tudo é local ao worker que atende o pedido (o relatório indica o pid).
+"""
+import html
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+MAX_SEGUNDOS_CPU = 60
+INTERVALO_CPU_MS = 10
+MAX_PROFUNDIDADE = 128
+TRACEMALLOC_FRAMES = int(os.environ.get('PROFILING_TRACEMALLOC_FRAMES', '10'))
+# Pedidos sem rota (404) ficam todos aqui, para o número de chaves não crescer
+ROTA_DESCONHECIDA = "(sem rota)"
+
+
+def _nome_frame(frame) -> str:
+    codigo = frame.f_code
+    modulo = frame.f_globals.get('__name__', os.path.basename(codigo.co_filename))
+    return f"{modulo}:{codigo.co_name}"
+
+
+def _pilha(frame) -> List[str]:
+    nomes = []
+    while frame is not None and len(nomes) < MAX_PROFUNDIDADE:
+        nomes.append(_nome_frame(frame))
+        frame = frame.f_back
+    nomes.reverse()
+    return nomes
+
+
+class CpuProfiler:
+    """Amostragem estatística; um perfil de cada vez por processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def ocupado(self) -> bool:
+        return self._lock.locked()
+
+    def amostrar(self, segundos: float, intervalo_ms: float = INTERVALO_CPU_MS,
+                 threads: Optional[Iterable[int]] = None) -> Counter:
+        """
+        Bloqueia durante `segundos` (correr numa thread). `threads` limita as
+        threads amostradas; None amostra todas menos a própria.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Já está a decorrer um perfil de CPU")
+        try:
+            alvo = set(threads) if threads is not None else None
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            proprio = threading.get_ident()
+            pilhas: Counter = Counter()
+            fim = time.monotonic() + segundos
+            while time.monotonic() < fim:
+                for ident, frame in sys._current_frames().items():
+                    if ident == proprio or (alvo is not None and ident not in alvo):
+                        continue
+                    pilha = _pilha(frame)
+                    if alvo is None or len(alvo) > 1:
+                        pilha.insert(0, nomes.get(ident, str(ident)))
+                    pilhas[";".join(pilha)] += 1
+                time.sleep(intervalo_ms / 1000)
+            return pilhas
+        finally:
+            self._lock.release()
+
+
+def collapsed(pilhas: Counter) -> str:
+    return "".join(f"{pilha} {n}\n" for pilha, n in pilhas.most_common())
+
+
+def flamegraph_svg(pilhas: Counter, titulo: str = "CPU", largura: int = 1200) -> str:
+    """Flamegraph SVG mínimo (sem JavaScript): largura proporcional às amostras."""
+    raiz: Dict = {"n": 0, "filhos": {}}
+    for pilha, n in pilhas.items():
+        raiz["n"] += n
+        no = raiz
+        for nome in pilha.split(";"):
+            no = no["filhos"].setdefault(nome, {"n": 0, "filhos": {}})
+            no["n"] += n
+    total = raiz["n"] or 1
+    altura_linha = 16
+
+    def profundidade(no: Dict) -> int:
+        return 1 + max((profundidade(f) for f in no["filhos"].values()), default=0)
+
+    altura = profundidade(raiz) * altura_linha + 30
+    retangulos: List[str] = []
+
+    def desenhar(no: Dict, x: float, nivel: int):
+        # Raiz em baixo, como no flamegraph.pl
+        y = altura - 10 - (nivel + 1) * altura_linha
+        for nome, filho in sorted(no["filhos"].items()):
+            w = filho["n"] / total * largura
+            if w >= 0.5:
+                texto = html.escape(nome)
+                pct = filho["n"] / total * 100
+                tom = 200 + (hash(nome) % 55)
+                etiqueta = (f'<text x="{x + 3:.1f}" y="{y + altura_linha - 4}">'
+                            f'{html.escape(nome[:int(w / 7)])}</text>' if w > 35 else '')
+                retangulos.append(
+                    f'<g><title>{texto} ({filho["n"]} amostras, {pct:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{altura_linha - 1}" '
+                    f'fill="rgb({tom},{tom // 2},40)"/>{etiqueta}</g>')
+                desenhar(filho, x, nivel + 1)
+            x += w
+
+    desenhar(raiz, 0, 0)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" height="{altura}" '
+            f'font-family="monospace" font-size="11">'
+            f'<text x="4" y="14">{html.escape(titulo)} ({raiz["n"]} amostras)</text>'
+            f'{"".join(retangulos)}</svg>')
+
+
+class MemoryProfiler:
+    """Snapshots do tracemalloc e crescimento da memória rastreada por rota."""
+
+    def __init__(self):
+        self._base: Optional[tracemalloc.Snapshot] = None
+        self._iniciado_em: Optional[float] = None
+        self._rotas: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self) -> bool:
+        return self._base is not None and tracemalloc.is_tracing()
+
+    def iniciar(self, frames: int = TRACEMALLOC_FRAMES) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        with self._lock:
+            self._rotas = {}
+        self._base = self._snapshot()
+        self._iniciado_em = time.time()
+
+    def parar(self) -> None:
+        self._base = None
+        self._iniciado_em = None
+        tracemalloc.stop()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # O mesmo filtro na base e nos relatórios, senão a diferença inclui-o
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    @staticmethod
+    def memoria_atual() -> int:
+        return tracemalloc.get_traced_memory()[0]
+
+    def registar(self, rota: str, delta: int) -> None:
+        with self._lock:
+            stats = self._rotas.setdefault(
+                rota, {"pedidos": 0, "bytes_total": 0, "bytes_max": 0})
+            stats["pedidos"] += 1
+            stats["bytes_total"] += delta
+            stats["bytes_max"] = max(stats["bytes_max"], delta)
+
+    def relatorio(self, top: int = 20, agrupar: str = "lineno") -> dict:
+        if not self.ativo:
+            raise RuntimeError("O tracemalloc não está ativo")
+        snapshot = self._snapshot()
+        diferencas = snapshot.compare_to(self._base, agrupar)[:top]
+        atual, pico = tracemalloc.get_traced_memory()
+        with self._lock:
+            rotas = sorted(({"rota": rota, **stats} for rota, stats in self._rotas.items()),
+                           key=lambda r: r["bytes_total"], reverse=True)[:top]
+        return {
+            "pid": os.getpid(),
+            "iniciado_em": self._iniciado_em,
+            "memoria_rastreada": atual,
+            "pico": pico,
+            "crescimento": [{
+                "local": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "bytes": stat.size,
+                "bytes_diferenca": stat.size_diff,
+                "blocos": stat.count,
+                "blocos_diferenca": stat.count_diff,
+            } for stat in diferencas],
+            "rotas": rotas,
+        }
+
+
+cpu_profiler = CpuProfiler()
+memory_profiler = MemoryProfiler()
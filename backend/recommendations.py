@@ -0,0 +1,152 @@
+"""
+Recomendação de imóveis semelhantes com uma matriz de features em NumPy.
+
+Cada imóvel aprovado e ativo ocupa uma linha da matriz (one-hot de tipo e
+região, números normalizados e comodidades), já multiplicada pelos pesos e
+normalizada. A similaridade é o cosseno, por isso uma recomendação é um único
+produto matriz-vetor seguido de um top-k com argpartition.
+
+A matriz vive em memória e é atualizada linha a linha quando um imóvel é
+aprovado, editado ou desativado.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Campos lidos do MongoDB para montar o vetor
+FEATURE_FIELDS = ["id", "tipo", "regiao", "num_quartos", "num_banheiros", "capacidade",
+                  "possui_piscina", "possui_churrasqueira", "possui_wifi", "permite_pets",
+                  "tem_vista_mar", "tem_ar_condicionado"]
+CATEGORICAL = {"tipo": 3.0, "regiao": 2.0}
+# campo -> (valor de saturação, peso)
+NUMERIC = {"num_quartos": (6, 1.5), "num_banheiros": (5, 1.0), "capacidade": (12, 1.5)}
+AMENITIES = {"possui_piscina": 0.7, "possui_churrasqueira": 0.4, "possui_wifi": 0.2,
+             "permite_pets": 0.6, "tem_vista_mar": 0.7, "tem_ar_condicionado": 0.4}
+CATALOG_QUERY = {"status_aprovacao": "aprovado", "ativo": True}
+
+
+class SimilarityIndex:
+    def __init__(self, initial_capacity: int = 256):
+        self._lock = threading.Lock()
+        self._vocab: Dict[str, Dict[str, int]] = {campo: {} for campo in CATEGORICAL}
+        self._fixed_dim = len(NUMERIC) + len(AMENITIES)
+        self._matrix = np.zeros((initial_capacity, self._dim()), dtype=np.float32)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _dim(self) -> int:
+        return self._fixed_dim + sum(len(v) for v in self._vocab.values())
+
+    def _column(self, campo: str, valor) -> int:
+        """Coluna one-hot de um valor categórico; valores novos acrescentam uma coluna."""
+        vocab = self._vocab[campo]
+        if valor not in vocab:
+            vocab[valor] = len(vocab)
+            # As colunas categóricas ficam depois das fixas, por ordem de CATEGORICAL
+            offset = self._fixed_dim
+            for outro in CATEGORICAL:
+                if outro == campo:
+                    break
+                offset += len(self._vocab[outro])
+            insert_at = offset + vocab[valor]
+            self._matrix = np.insert(self._matrix, insert_at, 0.0, axis=1)
+        offset = self._fixed_dim
+        for outro in CATEGORICAL:
+            if outro == campo:
+                return offset + vocab[valor]
+            offset += len(self._vocab[outro])
+        raise KeyError(campo)
+
+    def _vector(self, imovel: dict) -> np.ndarray:
+        # Regista primeiro os valores categóricos (podem alargar a matriz)
+        columns = [(self._column(campo, imovel.get(campo)), peso)
+                   for campo, peso in CATEGORICAL.items()]
+        vector = np.zeros(self._dim(), dtype=np.float32)
+        idx = 0
+        for campo, (saturacao, peso) in NUMERIC.items():
+            valor = imovel.get(campo) or 0
+            vector[idx] = peso * min(max(float(valor), 0.0), saturacao) / saturacao
+            idx += 1
+        for campo, peso in AMENITIES.items():
+            vector[idx] = peso if imovel.get(campo) else 0.0
+            idx += 1
+        for column, peso in columns:
+            vector[column] = peso
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def upsert(self, imovel: dict) -> None:
+        with self._lock:
+            vector = self._vector(imovel)
+            row = self._rows.get(imovel["id"])
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                    self._ids[row] = imovel["id"]
+                else:
+                    row = len(self._ids)
+                    self._ids.append(imovel["id"])
+                    if row >= self._matrix.shape[0]:
+                        grown = np.zeros(
+                            (self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float32)
+                        grown[:row] = self._matrix[:row]
+                        self._matrix = grown
+                self._rows[imovel["id"]] = row
+            self._matrix[row] = vector
+
+    def remove(self, imovel_id: str) -> None:
+        with self._lock:
+            row = self._rows.pop(imovel_id, None)
+            if row is None:
+                return
+            self._matrix[row] = 0.0
+            self._ids[row] = None
+            self._free.append(row)
+
+    def sync(self, imovel_id: str, imovel: Optional[dict]) -> None:
+        """Reflete o estado atual de um imóvel (None = apagado)."""
+        if imovel and imovel.get("status_aprovacao") == "aprovado" and imovel.get("ativo"):
+            self.upsert(imovel)
+        else:
+            self.remove(imovel_id)
+
+    def rebuild(self, imoveis: List[dict]) -> None:
+        fresh = SimilarityIndex(initial_capacity=max(256, len(imoveis)))
+        for imovel in imoveis:
+            fresh.upsert(imovel)
+        with self._lock:
+            self._vocab, self._matrix = fresh._vocab, fresh._matrix
+            self._ids, self._rows, self._free = fresh._ids, fresh._rows, fresh._free
+
+    def top_k(self, imovel: dict, k: int) -> List[str]:
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return []
+            row = self._rows.get(imovel["id"])
+            vector = self._matrix[row].copy() if row is not None else self._vector(imovel)
+            scores = self._matrix[:n] @ vector
+            for free in self._free:
+                scores[free] = -np.inf
+            if row is not None:
+                scores[row] = -np.inf
+            k = min(k, len(self._rows) - (1 if row is not None else 0))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [self._ids[i] for i in top]
+
+
+async def load_catalog(db) -> List[dict]:
+    projecao = {campo: 1 for campo in FEATURE_FIELDS}
+    projecao["_id"] = 0
+    return await db.imoveis.find(CATALOG_QUERY, projecao).to_list(length=None)
@@ -0,0 +1,102 @@
+"""
+Revogação de tokens JWT (logout) pelo claim `jti`.
+
+Os jti revogados ficam na coleção `revoked_tokens` até ao fim da validade do
+token (índice TTL em `expira_em`) e cada worker mantém uma cópia em memória.
+Verificar se um token foi revogado é uma consulta a um dicionário em memória,
+sem ida à base de dados; a cópia é atualizada por consultas incrementais
+periódicas a partir do `revogado_em` preenchido pelo MongoDB ($currentDate),
+tal como o barramento de invalidação da cache.
+
+Como os tokens duram no máximo ACCESS_TOKEN_EXPIRE_MINUTES, a cópia só guarda
+os jti revogados nesse período e os expirados são podados a cada consulta.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REVOKED_COLLECTION = 'revoked_tokens'
+POLL_INTERVAL_SECONDS = float(
+    os.environ.get('TOKEN_REVOCATION_POLL_SECONDS', '2'))
+# Margem para revogações que ficam visíveis ligeiramente depois do seu revogado_em
+POLL_SLACK = timedelta(seconds=5)
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class RevocationStore:
+    def __init__(self, db, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.collection = db[REVOKED_COLLECTION]
+        self.poll_interval = poll_interval
+        self._revoked: Dict[str, datetime] = {}
+        self._watermark = None
+        self._poller: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expira_em", expireAfterSeconds=0)
+        await self.collection.create_index("revogado_em")
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    async def revoke(self, jti: str, expira_em: datetime) -> None:
+        self._revoked[jti] = _aware(expira_em)
+        await self.collection.update_one(
+            {"_id": jti},
+            {"$set": {"expira_em": expira_em}, "$currentDate": {"revogado_em": True}},
+            upsert=True)
+
+    async def poll_once(self) -> int:
+        """Acrescenta os jti revogados desde a última consulta. Devolve quantos são novos."""
+        query = {}
+        if self._watermark is not None:
+            query = {"revogado_em": {"$gte": self._watermark - POLL_SLACK}}
+        novos = 0
+        async for doc in self.collection.find(query):
+            if doc["_id"] not in self._revoked:
+                self._revoked[doc["_id"]] = _aware(doc["expira_em"])
+                novos += 1
+            if self._watermark is None or doc["revogado_em"] > self._watermark:
+                self._watermark = doc["revogado_em"]
+        if self._watermark is None:
+            self._watermark = (await self.collection.database.command("hello"))["localTime"]
+        self._prune()
+        return novos
+
+    def _prune(self) -> None:
+        agora = datetime.now(timezone.utc)
+        expirados = [jti for jti, expira_em in self._revoked.items() if expira_em <= agora]
+        for jti in expirados:
+            del self._revoked[jti]
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao consultar tokens revogados: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
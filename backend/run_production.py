@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Arranque de produção com vários workers.
+
+O processo principal abre o socket e faz pre-fork de N workers uvicorn
+(uvloop/httptools quando instalados). Cada worker é reciclado após
+WORKER_MAX_REQUESTS pedidos (com jitter, para não reciclarem todos ao mesmo
+tempo) e substituído automaticamente. Ao receber SIGTERM/SIGINT os workers
+terminam os pedidos em curso durante até GRACEFUL_TIMEOUT segundos.
+
+A cache em memória de cada worker mantém-se coerente através do barramento
+de invalidação (ver invalidation.py).
+
+Também arranca JOB_WORKERS processos da fila de tarefas (ver worker.py),
+supervisionados da mesma forma.
+
+Uso:
+    python run_production.py --workers 4 --port 8000
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import uvicorn
+
+logger = logging.getLogger("run_production")
+
+ROOT_DIR = Path(__file__).parent
+
+HANDLED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def _serve(config: uvicorn.Config, sockets) -> None:
+    # Importa a aplicação dentro do worker (cada processo tem o seu event loop e cliente Motor)
+    sys.path.insert(0, str(ROOT_DIR))
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def _work(concorrencia: int) -> None:
+    sys.path.insert(0, str(ROOT_DIR))
+    from worker import run_worker
+    run_worker(concorrencia)
+
+
+class Supervisor:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.should_exit = threading.Event()
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: List[multiprocessing.Process] = []
+        self.job_processes: List[multiprocessing.Process] = []
+        base_config = self._config()
+        self.socket = base_config.bind_socket()
+
+    def _config(self) -> uvicorn.Config:
+        max_requests = self.args.max_requests
+        if max_requests:
+            max_requests += random.randint(0, self.args.max_requests_jitter)
+        return uvicorn.Config(
+            "server:app",
+            host=self.args.host,
+            port=self.args.port,
+            loop="auto",  # uvloop se estiver instalado
+            http="auto",  # httptools se estiver instalado
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+            limit_max_requests=max_requests or None,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            timeout_keep_alive=self.args.keep_alive,
+            log_level=self.args.log_level,
+        )
+
+    def spawn_worker(self) -> multiprocessing.Process:
+        process = self.context.Process(
+            target=_serve, args=(self._config(), [self.socket]))
+        process.start()
+        logger.info(f"Worker iniciado [{process.pid}]")
+        return process
+
+    def spawn_job_worker(self) -> multiprocessing.Process:
+        process = self.context.Process(
+            target=_work, args=(self.args.job_concurrency,))
+        process.start()
+        logger.info(f"Worker de tarefas iniciado [{process.pid}]")
+        return process
+
+    def handle_signal(self, sig, frame):
+        self.should_exit.set()
+
+    def run(self):
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self.handle_signal)
+        logger.info(
+            f"A iniciar {self.args.workers} workers em {self.args.host}:{self.args.port}")
+        self.processes = [self.spawn_worker()
+                          for _ in range(self.args.workers)]
+        self.job_processes = [self.spawn_job_worker()
+                              for _ in range(self.args.job_workers)]
+
+        # Substitui workers reciclados (limit_max_requests) ou que terminaram inesperadamente
+        while not self.should_exit.wait(0.5):
+            for processes, spawn in ((self.processes, self.spawn_worker),
+                                     (self.job_processes, self.spawn_job_worker)):
+                for idx, process in enumerate(processes):
+                    if not process.is_alive():
+                        logger.info(
+                            f"Worker [{process.pid}] terminou (código {process.exitcode}); a substituir")
+                        process.join()
+                        processes[idx] = spawn()
+
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("A drenar workers...")
+        processes = self.processes + self.job_processes
+        for process in processes:
+            if process.is_alive():
+                # SIGTERM: o uvicorn termina os pedidos em curso e o worker de tarefas as suas tarefas
+                process.terminate()
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(
+                    f"Worker [{process.pid}] não terminou a tempo; a forçar")
+                process.kill()
+                process.join()
+        self.socket.close()
+        logger.info("Todos os workers terminaram.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servidor de produção ALT Ilhabela (multi-worker)")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(
+        os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count()))))
+    parser.add_argument("--max-requests", type=int,
+                        default=int(os.environ.get("WORKER_MAX_REQUESTS", "10000")),
+                        help="Recicla cada worker após N pedidos (0 desativa)")
+    parser.add_argument("--max-requests-jitter", type=int,
+                        default=int(os.environ.get("WORKER_MAX_REQUESTS_JITTER", "1000")))
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=int(os.environ.get("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--keep-alive", type=int,
+                        default=int(os.environ.get("KEEP_ALIVE", "5")))
+    parser.add_argument("--job-workers", type=int,
+                        default=int(os.environ.get("JOB_WORKERS", "1")),
+                        help="Processos da fila de tarefas (0 se correrem noutro sítio)")
+    parser.add_argument("--job-concurrency", type=int,
+                        default=int(os.environ.get("JOBS_CONCURRENCY", "4")))
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    Supervisor(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,84 @@
-
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, BackgroundTasks, File, UploadFile, Form, Body
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Body, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from pydantic import BaseModel, Field, EmailStr, HttpUrl, field_validator, ValidationError
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Union
+from datetime import date, datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import os
+import asyncio
+import base64
+import csv
+import functools
+import io
+import json
 import logging
+import time
 import uuid
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from pathlib import Path
 import secrets
 import string
-import aiofiles
-import socket
-
-# --- NOVA IMPORTAÇÃO DO CLOUDINARY ---
-import cloudinary
-import cloudinary.uploader
+import threading
 
 # Load environment variables
+# (antes dos módulos locais, que leem a configuração ao serem importados)
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# --- Main App Creation (ONCE ONLY) ---
-app = FastAPI(title="ALT Ilhabela Portal", version="1.0.0")
-
-
-@app.get("/")
-async def health_check():
-    return {"status": "online", "message": "ALT Ilhabela Backend is running!"}
+from cache import cache
+from invalidation import InvalidationBus
+from events import EventBus, RESYNC
+from idempotency import IdempotencyStore, fingerprint
+from revocation import RevocationStore
+import analytics
+import archive
+import jobs
+import media_gc
+import migrations
+import profiling
+import tracing
+from export_collection import flat_value, to_jsonable
+from recommendations import FEATURE_FIELDS, CATALOG_QUERY, SimilarityIndex, load_catalog
+from database import DB_NAME, create_client, get_public_db, pool_config, pool_stats_listener
+from slow_query import SlowQueryListener, current_request_scope, PLANS_COLLECTION
+
+# O Cloudinary e o SMTP são carregados só quando usados (ver get_cloudinary_uploader
+# e send_email): no plano gratuito cada cold start conta.
 
 api_router = APIRouter(prefix="/api")
 
 # --- Database Connection ---
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'alt_ilhabela')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
-# --- NOVA CONFIGURAÇÃO DO CLOUDINARY ---
-# O Cloudinary vai ler a variável de ambiente CLOUDINARY_URL automaticamente
-# Certifica-te de que definiste a CLOUDINARY_URL=cloudinary://... no teu ambiente
-cloudinary.config(
-    secure=True  # Garante que as URLs retornadas sejam sempre HTTPS
-)
-logging.info("Cloudinary configurado.")
+# Pool, timeouts e compressão são configurados em database.py via variáveis de ambiente
+# Regista comandos acima de SLOW_QUERY_MS e captura o explain() de formas novas
+slow_query_listener = SlowQueryListener()
+# Spans por comando nos pedidos amostrados (ver tracing.py)
+client = create_client(event_listeners=[slow_query_listener, tracing.TracingListener()])
+db = client[DB_NAME]
+# Leituras do catálogo público (pode usar secundários com staleness limitada)
+public_db = get_public_db(client)
+# Propaga invalidações da cache em memória a todos os workers
+invalidation_bus = InvalidationBus(db, cache)
+# Eventos em tempo real para o painel de administração (/admin/events)
+event_bus = EventBus(db)
+# Visualizações/cliques agregados em memória e gravados em buckets horários
+engagement = analytics.EngagementBuffer(db)
+# Respostas guardadas por Idempotency-Key (repetições de clientes móveis)
+idempotency_store = IdempotencyStore(db)
+# jti dos tokens revogados (logout), espelhados em memória em cada worker
+revocation_store = RevocationStore(db)
+# Matriz de features dos imóveis aprovados para /imoveis/{id}/similares
+similarity_index = SimilarityIndex()
+
+# --- Arranque ---
+# Pré-abre ligações, garante índices e pré-carrega a cache ao iniciar
+WARMUP_ON_STARTUP = os.environ.get(
+    'WARMUP_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
 
 # --- Upload Configuration (REMOVIDO) ---
 # A pasta UPLOAD_DIR não é mais necessária, pois tudo vai para a nuvem.
@@ -300,6 +327,15 @@ class PerfilParceiro(ParceiroBase):
 # Enhanced Content Models
 
 
+class NoticiaRelacionada(BaseModel):
+    id: str
+    titulo: str
+    resumo: Optional[str] = None
+    categoria: str = "geral"
+    foto: Optional[str] = None
+    created_at: datetime
+
+
 class Noticia(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     titulo: str
@@ -315,12 +351,19 @@ class Noticia(BaseModel):
     tags: List[str] = []
     destaque: bool = False
     publicada: bool = True
+    # Pré-calculadas por sobreposição de tags ao criar/editar notícias
+    relacionadas: List[NoticiaRelacionada] = []
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc))
 
 
+class NoticiaListagem(Noticia):
+    # A listagem só traz o conteúdo quando pedido explicitamente
+    conteudo: Optional[str] = None
+
+
 class NoticiaCreate(BaseModel):
     titulo: str
     subtitulo: Optional[str] = None
@@ -334,6 +377,13 @@ class NoticiaCreate(BaseModel):
     tags: List[str] = []
     destaque: bool = False
 
+    @field_validator('tags', mode='before')
+    @classmethod
+    def normalizar_tags(cls, v):
+        if not v:
+            return []
+        return list(dict.fromkeys(t.strip().lower() for t in v if t and t.strip()))
+
 # Dashboard Models
 
 
@@ -343,6 +393,7 @@ class DashboardStats(BaseModel):
     total_parceiros: int
     total_associados: int
     candidaturas_pendentes: int
+    imoveis_pendentes: int = 0
     total_imoveis: int
     total_noticias: int
     imoveis_destaque: int
@@ -363,6 +414,115 @@ class EmailMassa(BaseModel):
     assunto: str
     mensagem: str
 
+# Bulk Moderation Models
+
+MAX_ITENS_LOTE = 500
+
+
+class ModeracaoLote(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_ITENS_LOTE)
+
+
+class RecusaLote(ModeracaoLote):
+    motivo: str
+
+
+class CandidaturaRef(BaseModel):
+    tipo: str
+    id: str
+
+
+class CandidaturasLote(BaseModel):
+    itens: List[CandidaturaRef] = Field(...,
+                                        min_length=1, max_length=MAX_ITENS_LOTE)
+
+
+class CandidaturasRecusaLote(CandidaturasLote):
+    motivo: str
+
+
+class ResultadoItemLote(BaseModel):
+    id: str
+    tipo: Optional[str] = None
+    status: str
+    detalhe: Optional[str] = None
+
+
+class ResultadoLote(BaseModel):
+    processados: int
+    falhas: int
+    resultados: List[ResultadoItemLote]
+
+
+class CandidaturasPagina(BaseModel):
+    itens: List[Union[CandidaturaMembro, CandidaturaParceiro, CandidaturaAssociado]]
+    # Total por tipo com o filtro de status (independente de tipo e cursor)
+    contagens: Dict[str, int]
+    proximo_cursor: Optional[str] = None
+
+
+class ProprietarioPublico(BaseModel):
+    id: str
+    nome: str
+    role: Optional[str] = None
+    foto_url: Optional[str] = None
+
+
+class ImovelExpandido(Imovel):
+    # Preenchido só com ?expand=proprietario
+    proprietario: Optional[ProprietarioPublico] = None
+
+
+MAX_IDS_LOTE = 100
+
+
+class IdsLote(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_IDS_LOTE)
+
+
+class ImoveisLote(BaseModel):
+    itens: List[Imovel]
+    nao_encontrados: List[str]
+
+
+class ParceirosLote(BaseModel):
+    itens: List[PerfilParceiro]
+    nao_encontrados: List[str]
+
+
+class NoticiasLote(BaseModel):
+    itens: List[Noticia]
+    nao_encontrados: List[str]
+
+
+class ImovelCard(BaseModel):
+    id: str
+    titulo: str
+    descricao: str = ""
+    tipo: str
+    regiao: str
+    foto: Optional[str] = None
+    num_quartos: int
+    num_banheiros: int
+    capacidade: int
+    created_at: datetime
+
+
+class ImoveisPagina(BaseModel):
+    itens: List[ImovelCard]
+    proximo_cursor: Optional[str] = None
+
+
+class PerfilPublico(BaseModel):
+    id: str
+    nome: str
+    role: Optional[str] = None
+    telefone: Optional[str] = None
+    foto_url: Optional[str] = None
+    descricao: Optional[str] = None
+    imoveis: List[ImovelCard]
+    proximo_cursor: Optional[str] = None
+
 # ==============================================================================
 # Helper Functions & Security
 # ==============================================================================
@@ -370,12 +530,156 @@ class EmailMassa(BaseModel):
 # ... (todo o teu código de Helpers & Security vai aqui) ...
 
 
+MAIN_PAGE_CACHE = "main-page"
+NOTICIAS_TAGS_CACHE = "noticias-tags"
+# Perfil público de um anfitrião, por user_id
+PERFIL_PUBLICO_CACHE = "perfil-publico"
+# Canal do barramento para atualizar o índice de similaridade nos outros workers
+SIMILARES_INDEX = "imoveis-similares"
+
+
+def resultado_lote(resultados: List[ResultadoItemLote]) -> ResultadoLote:
+    sucesso = {"aprovado", "recusado"}
+    falhas = sum(1 for r in resultados if r.status not in sucesso)
+    return ResultadoLote(processados=len(resultados) - falhas, falhas=falhas, resultados=resultados)
+
+
+def invalidate_cache(namespace: str, key: Optional[str] = None):
+    """Invalida entradas da cache em memória após uma escrita, neste e nos outros workers."""
+    invalidation_bus.invalidate(namespace, key)
+
+
+def documentos_validos(modelo, docs: List[dict], colecao: str) -> list:
+    """
+    Documentos na versão de esquema atual já foram validados pelo migrations.py
+    e seguem como estão (o FastAPI valida a resposta uma vez); só se confirma
+    que têm os campos obrigatórios preenchidos, para um documento estragado depois da
+    migração não fazer falhar a lista inteira. Os antigos são validados um a
+    um e os inválidos ignorados até a migração correr.
+    """
+    atual = migrations.current_version(colecao)
+    obrigatorios = {nome for nome, campo in modelo.model_fields.items() if campo.is_required()}
+    validos = []
+    for doc in docs:
+        doc.pop("_id", None)
+        if doc.get(migrations.SCHEMA_VERSION_FIELD) == atual:
+            em_falta = {nome for nome in obrigatorios if doc.get(nome) is None}
+            if em_falta:
+                logging.warning(
+                    f"Skipping invalid {modelo.__name__} data (ID: {doc.get('id')}), "
+                    f"run migrations.py: campos em falta {sorted(em_falta)}")
+            else:
+                validos.append(doc)
+            continue
+        try:
+            validos.append(modelo(**doc))
+        except ValidationError as e:
+            logging.warning(
+                f"Skipping invalid {modelo.__name__} data (ID: {doc.get('id')}), "
+                f"run migrations.py: {e}")
+    return validos
+
+
+async def buscar_por_ids(collection, ids: List[str], filtro: dict, modelo):
+    """
+    Lê vários documentos com um único $in, pela ordem pedida (sem repetidos).
+    Devolve (itens, ids não encontrados).
+    """
+    ids = list(dict.fromkeys(ids))
+    docs = await collection.find({**filtro, "id": {"$in": ids}}, {"_id": 0}).to_list(length=None)
+    por_id = {doc["id"]: doc for doc in docs}
+    itens = documentos_validos(
+        modelo, [por_id[doc_id] for doc_id in ids if doc_id in por_id], collection.name)
+    encontrados = {item["id"] if isinstance(item, dict) else item.id for item in itens}
+    return itens, [doc_id for doc_id in ids if doc_id not in encontrados]
+
+
+def invalidate_perfil_publico(*user_ids: Optional[str]):
+    for user_id in set(user_ids):
+        if user_id:
+            invalidate_cache(PERFIL_PUBLICO_CACHE, user_id)
+
+
+MAX_RELACIONADAS = 4
+
+
+def pipeline_relacionadas() -> List[dict]:
+    """
+    Estágios do $lookup que escolhem as relacionadas da notícia `$$id` (tags
+    `$$tags`): publicadas com mais tags em comum, desempate pela mais recente.
+    """
+    return [
+        {"$match": {"publicada": True, "$expr": {"$ne": ["$id", "$$id"]}}},
+        {"$addFields": {"_comuns": {"$size": {"$setIntersection": [
+            {"$ifNull": ["$tags", []]}, "$$tags"]}}}},
+        {"$match": {"_comuns": {"$gt": 0}}},
+        {"$sort": {"_comuns": -1, "created_at": -1}},
+        {"$limit": MAX_RELACIONADAS},
+        {"$project": {"_id": 0, "id": 1, "titulo": 1, "resumo": 1, "categoria": 1,
+                      "foto": {"$first": "$fotos"}, "created_at": 1}},
+    ]
+
+
+async def atualizar_relacionadas(noticia_id: str, tags_anteriores: Optional[List[str]] = None):
+    """
+    Recalcula as relacionadas da notícia e das que partilham (ou partilhavam)
+    tags com ela, ou que a referenciam. Uma só agregação: o MongoDB calcula as
+    relacionadas de todas as afetadas e grava-as com $merge.
+    """
+    noticia = await db.noticias.find_one({"id": noticia_id}, {"_id": 0, "tags": 1})
+    tags = set(tags_anteriores or [])
+    if noticia:
+        tags.update(noticia.get("tags", []))
+    await db.noticias.aggregate([
+        {"$match": {"$or": [{"id": noticia_id}, {"tags": {"$in": list(tags)}},
+                            {"relacionadas.id": noticia_id}]}},
+        {"$lookup": {"from": "noticias",
+                     "let": {"id": "$id", "tags": {"$ifNull": ["$tags", []]}},
+                     "pipeline": pipeline_relacionadas(),
+                     "as": "relacionadas"}},
+        {"$project": {"relacionadas": 1}},
+        {"$merge": {"into": "noticias", "on": "_id",
+                    "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]).to_list(length=None)
+
+
+async def refresh_similares(imovel_id: Optional[str] = None):
+    """Atualiza o índice de similaridade local (None = reconstrução completa)."""
+    if imovel_id is None:
+        similarity_index.rebuild(await load_catalog(db))
+        return
+    projecao = {campo: 1 for campo in FEATURE_FIELDS}
+    projecao.update({"_id": 0, "status_aprovacao": 1, "ativo": 1})
+    imovel = await db.imoveis.find_one({"id": imovel_id}, projecao)
+    similarity_index.sync(imovel_id, imovel)
+
+
+async def sync_similares(imovel_id: Optional[str] = None, imovel: Optional[dict] = None):
+    """
+    Reflete uma escrita em imoveis no índice de similaridade deste e dos outros
+    workers. Se a escrita já devolveu o documento, não é lido de novo.
+    """
+    try:
+        if imovel is not None:
+            similarity_index.sync(imovel_id, imovel)
+        else:
+            await refresh_similares(imovel_id)
+    except Exception as e:
+        logger.warning(f"Falha ao atualizar o índice de similares ({imovel_id}): {e}")
+    invalidate_cache(SIMILARES_INDEX, imovel_id)
+
+
+invalidation_bus.subscribe(SIMILARES_INDEX, refresh_similares)
+
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with tracing.span("bcrypt.verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with tracing.span("bcrypt.hash"):
+        return pwd_context.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -386,6 +690,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.now(timezone.utc) + \
             timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    # Identificador do token, usado para o revogar no logout
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -404,6 +710,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    if revocation_store.is_revoked(payload.get("jti")):
+        raise credentials_exception
 
     user = await db.users.find_one({"email": email})
     if user is None:
@@ -437,6 +745,32 @@ async def get_parceiro_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+# ==============================================================================
+# Media (Cloudinary)
+# ==============================================================================
+
+
+@functools.lru_cache(maxsize=None)
+def get_cloudinary_uploader():
+    """
+    Importa e configura o Cloudinary na primeira utilização.
+    O Cloudinary vai ler a variável de ambiente CLOUDINARY_URL automaticamente
+    Certifica-te de que definiste a CLOUDINARY_URL=cloudinary://... no teu ambiente
+    """
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        secure=True  # Garante que as URLs retornadas sejam sempre HTTPS
+    )
+    logging.info("Cloudinary configurado.")
+    return cloudinary.uploader
+
+
+def cloudinary_upload(contents: bytes, **options):
+    with tracing.span("cloudinary.upload", resource_type=options.get("resource_type"),
+                      folder=options.get("folder"), bytes=len(contents)):
+        return get_cloudinary_uploader().upload(contents, **options)
+
 # ==============================================================================
 # Email Service
 # ==============================================================================
@@ -492,11 +826,64 @@ def generate_random_password(length=8):
     return ''.join(secrets.choice(characters) for _ in range(length))
 
 
-# --- Certifica-te que tens estes imports no topo do ficheiro ---
-# ---------------------------------------------------------------
+def build_imovel_aprovado_email(owner: dict, imovel: dict):
+    subject = "Seu Imóvel foi Aprovado!"
+    body_plain = f"""Olá {owner.get('nome', 'Proprietário')}, etc..."""
+    body_html_content = f"""<p>Ótimas notícias! Seu imóvel "<strong>{imovel['titulo']}</strong>" foi aprovado.</p>"""
+    html_email = create_praia_email_html(
+        titulo="Imóvel Aprovado!",
+        pre_cabecalho=f"Boas notícias sobre o seu imóvel {imovel['titulo']}",
+        nome_usuario=owner.get('nome', 'Proprietário'),
+        corpo_mensagem=body_html_content,
+        texto_botao="Gerenciar Meus Imóveis",
+        url_botao="https://alt-ilhabela.vercel.app/meus-imoveis"
+    )
+    return subject, body_plain, html_email
+
+
+def build_imovel_recusado_email(owner: dict, imovel: dict, motivo: Optional[str]):
+    subject = "Atualização sobre seu Imóvel - ALT Ilhabela"
+    body_plain = f"""Olá {owner.get('nome', 'Proprietário')}, etc..."""
+    html_motivo = f"<p><strong>Motivo:</strong> {motivo}</p>" if motivo else "<p>Por favor, revise os dados.</p>"
+    body_html_content = f"""<p>Seu imóvel "<strong>{imovel['titulo']}</strong>" precisa de ajustes.</p>{html_motivo}"""
+    html_email = create_praia_email_html(
+        titulo="Atualização sobre seu Imóvel",
+        pre_cabecalho="Informações sobre a publicação do seu imóvel.",
+        nome_usuario=owner.get('nome', 'Proprietário'),
+        corpo_mensagem=body_html_content,
+        texto_botao="Acessar Meus Imóveis",
+        url_botao="https://alt-ilhabela.vercel.app/meus-imoveis"
+    )
+    return subject, body_plain, html_email
+
+
+def build_candidatura_aprovada_email(candidatura: dict):
+    subject = "Bem-vindo à ALT Ilhabela!"
+    body_plain = f"""Olá {candidatura['nome']}, etc..."""
+    body_html_content = f"""<p>Sua candidatura foi <strong>aprovada</strong>!</p>"""
+    html_email = create_praia_email_html(
+        titulo="Bem-vindo(a)!",
+        pre_cabecalho="Sua candidatura foi aprovada.",
+        nome_usuario=candidatura['nome'],
+        corpo_mensagem=body_html_content,
+        texto_botao="Acessar o Portal",
+        url_botao="https://temp-housing.preview.emergentagent.com/login"
+    )
+    return subject, body_plain, html_email
+
+
+def build_candidatura_recusada_email(candidatura: dict):
+    subject = "Atualização sobre sua candidatura - ALT Ilhabela"
+    body = f"""Olá {candidatura['nome']}, etc..."""
+    return subject, body
 
 
 # async def send_email(to_email: str, subject: str, body: str, html_body: Optional[str] = None):
+#     # Importações locais: só pesam no arranque quando o envio real está ativo
+#     import smtplib
+#     import socket
+#     from email.mime.text import MIMEText
+#     from email.mime.multipart import MIMEMultipart
 #     try:
 #         msg = MIMEMultipart('alternative')
 #         msg['From'] = os.getenv('DEFAULT_FROM_EMAIL',
@@ -548,9 +935,116 @@ async def send_email(to_email: str, subject: str, body: str, html_body: Optional
     MODO DE SEGURANÇA:
     Finge que envia o e-mail para não travar o site no Render Gratuito.
     """
-    print(f"--- [EMAIL SIMULADO] Para: {to_email} | Assunto: {subject} ---")
-    # Não tenta conectar ao Gmail. Apenas retorna Sucesso.
-    return True
+    with tracing.span("email.send", assunto=subject):
+        print(f"--- [EMAIL SIMULADO] Para: {to_email} | Assunto: {subject} ---")
+        # Não tenta conectar ao Gmail. Apenas retorna Sucesso.
+        return True
+
+# ==============================================================================
+# Tarefas em segundo plano (fila persistente, executadas pelo worker.py)
+# ==============================================================================
+
+
+async def enqueue_email(to_email: str, subject: str, body: str, html_body: Optional[str] = None):
+    await jobs.enqueue(db, "email", {"to_email": to_email, "subject": subject,
+                                     "body": body, "html_body": html_body})
+
+
+@jobs.handler("email")
+async def job_email(payload: dict):
+    if await send_email(**payload) is False:
+        raise RuntimeError(f"Falha ao enviar email para {payload['to_email']}")
+
+
+@jobs.handler("desativar_dados_utilizador")
+async def job_desativar_dados_utilizador(payload: dict):
+    """Desativa os imóveis ou o perfil de parceiro de um utilizador desativado/apagado."""
+    agora = datetime.now(timezone.utc)
+    if payload["role"] == "membro":
+        await db.imoveis.update_many(
+            {"proprietario_id": payload["user_id"], "ativo": True},
+            {"$set": {"ativo": False, "updated_at": agora}})
+        # Os workers web reconstroem o índice de similares
+        await invalidation_bus.publish(SIMILARES_INDEX)
+        await invalidation_bus.publish(PERFIL_PUBLICO_CACHE, payload["user_id"])
+    elif payload["role"] == "parceiro":
+        await db.perfis_parceiros.update_many(
+            {"user_id": payload["user_id"], "ativo": True},
+            {"$set": {"ativo": False, "updated_at": agora}})
+    await invalidation_bus.publish(MAIN_PAGE_CACHE)
+
+
+def apagar_media_cloudinary(filename: str):
+    # O "public_id" é o nome do ficheiro sem a extensão, dentro da pasta
+    public_id = f"alt_ilhabela/fotos/{Path(filename).stem}"
+    with tracing.span("cloudinary.destroy", resource_type="image"):
+        result = get_cloudinary_uploader().destroy(public_id, resource_type="image")
+    # Se não for encontrado, tenta apagar como vídeo (para o /upload/video)
+    if result.get("result") == "not found":
+        public_id_video = f"alt_ilhabela/videos/{Path(filename).stem}"
+        with tracing.span("cloudinary.destroy", resource_type="video"):
+            result_video = get_cloudinary_uploader().destroy(
+                public_id_video, resource_type="video")
+        if result_video.get("result") == "not found":
+            logging.warning(
+                f"Ficheiro {filename} (public_id: {public_id}) não encontrado no Cloudinary para apagar.")
+
+
+async def enqueue_relacionadas(noticia_id: str, tags_anteriores: Optional[List[str]] = None):
+    await jobs.enqueue(db, "relacionadas", {"noticia_id": noticia_id,
+                                            "tags_anteriores": tags_anteriores or []},
+                       prioridade=jobs.PRIORIDADE_BAIXA)
+
+
+@jobs.handler("relacionadas")
+async def job_relacionadas(payload: dict):
+    await atualizar_relacionadas(payload["noticia_id"], payload["tags_anteriores"])
+
+
+@jobs.handler("apagar_media")
+async def job_apagar_media(payload: dict):
+    await run_in_threadpool(apagar_media_cloudinary, payload["filename"])
+
+
+@jobs.handler("media_gc")
+async def job_media_gc(payload: dict):
+    relatorio = await media_gc.recolher(
+        db, dry_run=payload.get("dry_run", False),
+        max_deletes=payload.get("max_deletes", media_gc.MAX_DELETES))
+    relatorio.pop("amostra")
+    logger.info(f"Recolha de media concluída: {relatorio}")
+
+# ==============================================================================
+# Eventos do painel de administração (SSE)
+# ==============================================================================
+
+
+async def contagens_pendentes() -> dict:
+    """Pendências mostradas no painel (contagens servidas pelos índices parciais)."""
+    contagens = {}
+    for tipo, collection in candidatura_collections().items():
+        contagens[f"candidaturas_{tipo}"] = await collection.count_documents({"status": "pendente"})
+    contagens["candidaturas_pendentes"] = sum(contagens.values())
+    contagens["imoveis_pendentes"] = await db.imoveis.count_documents(
+        {"status_aprovacao": "pendente", "ativo": True})
+    return contagens
+
+
+def notificar_admin(tipo: Optional[str] = None, dados: Optional[dict] = None):
+    """
+    Publica o evento `tipo` (se indicado) seguido das contagens atualizadas,
+    em segundo plano, para não atrasar a resposta da escrita.
+    """
+    async def publicar():
+        if tipo:
+            await event_bus.publish(tipo, dados)
+        try:
+            contagens = await contagens_pendentes()
+        except Exception as e:
+            logger.warning(f"Falha ao calcular contagens para o painel: {e}")
+            return
+        await event_bus.publish("contagens", contagens)
+    event_bus.spawn(publicar())
 
 # ==============================================================================
 # API Routes
@@ -562,43 +1056,38 @@ async def root():
     return {"message": "ALT Ilhabela Portal API"}
 
 
+async def load_main_page_data() -> MainPageData:
+    # Loaders da cache leem do primário: após uma invalidação, um secundário
+    # atrasado voltaria a pôr na cache os dados anteriores à escrita
+    noticias_destaque_data = await db.noticias.find(
+        {"destaque": True, "publicada": True}
+    ).sort("created_at", -1).limit(3).to_list(length=None)
+
+    imoveis_destaque_data = await db.imoveis.find(
+        {"destaque": True, "ativo": True, "status_aprovacao": "aprovado"}
+    ).sort("created_at", -1).limit(6).to_list(length=None)
+    parceiros_destaque_data = await db.perfis_parceiros.find(
+        {"destaque": True, "ativo": True}
+    ).sort("created_at", -1).limit(6).to_list(length=None)
+
+    ultimas_noticias_data = await db.noticias.find(
+        {"publicada": True}
+    ).sort("created_at", -1).limit(5).to_list(length=None)
+
+    return MainPageData(
+        noticias_destaque=documentos_validos(
+            Noticia, noticias_destaque_data, "noticias"),
+        imoveis_destaque=documentos_validos(Imovel, imoveis_destaque_data, "imoveis"),
+        parceiros_destaque=documentos_validos(
+            PerfilParceiro, parceiros_destaque_data, "perfis_parceiros"),
+        ultimas_noticias=documentos_validos(Noticia, ultimas_noticias_data, "noticias"),
+    )
+
+
 @api_router.get("/main-page", response_model=MainPageData)
 async def get_main_page_data():
     try:
-        noticias_destaque_data = await db.noticias.find(
-            {"destaque": True, "publicada": True}
-        ).sort("created_at", -1).limit(3).to_list(length=None)
-
-        imoveis_destaque_data = await db.imoveis.find(
-            {"destaque": True, "ativo": True, "status_aprovacao": "aprovado"}
-        ).sort("created_at", -1).limit(6).to_list(length=None)
-        parceiros_destaque_data = await db.perfis_parceiros.find(
-            {"destaque": True, "ativo": True}
-        ).sort("created_at", -1).limit(6).to_list(length=None)
-
-        ultimas_noticias_data = await db.noticias.find(
-            {"publicada": True}
-        ).sort("created_at", -1).limit(5).to_list(length=None)
-
-        def _safe_model_init(model, data_list):
-            valid_items = []
-            for item_data in data_list:
-                try:
-                    valid_items.append(model(**item_data))
-                except ValidationError as e:
-                    logging.warning(
-                        f"Skipping invalid data for model {model.__name__} (ID: {item_data.get('id')}): {e}")
-            return valid_items
-
-        return MainPageData(
-            noticias_destaque=_safe_model_init(
-                Noticia, noticias_destaque_data),
-            imoveis_destaque=_safe_model_init(Imovel, imoveis_destaque_data),
-            parceiros_destaque=_safe_model_init(
-                PerfilParceiro, parceiros_destaque_data),
-            ultimas_noticias=_safe_model_init(Noticia, ultimas_noticias_data),
-        )
-
+        return await cache.get_or_load(MAIN_PAGE_CACHE, "", load_main_page_data)
     except Exception as e:
         logging.error(f"Erro inesperado na rota /main-page: {e}")
         raise HTTPException(
@@ -641,6 +1130,21 @@ async def login(user_credentials: UserLogin):
     return Token(access_token=access_token, token_type="bearer", user=user_obj)
 
 
+@api_router.post("/auth/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user)
+):
+    """Revoga o token usado neste pedido até ao fim da sua validade."""
+    payload = jwt.decode(credentials.credentials,
+                         SECRET_KEY, algorithms=[ALGORITHM])
+    # Tokens emitidos antes da revogação existir não têm jti: expiram sozinhos
+    if payload.get("jti"):
+        await revocation_store.revoke(
+            payload["jti"], datetime.fromtimestamp(payload["exp"], timezone.utc))
+    return {"message": "Sessão terminada com sucesso"}
+
+
 @api_router.get("/auth/me", response_model=User)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
@@ -663,10 +1167,10 @@ async def alterar_senha(
     if not user_doc:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
-    if not pwd_context.verify(senha_atual, user_doc["hashed_password"]):
+    if not verify_password(senha_atual, user_doc["hashed_password"]):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
 
-    nova_senha_hash = pwd_context.hash(nova_senha)
+    nova_senha_hash = get_password_hash(nova_senha)
 
     result = await db.users.update_one(
         {"id": current_user.id},
@@ -690,7 +1194,7 @@ async def recuperar_senha(dados_email: dict):
         return {"message": "Se o email estiver cadastrado, você receberá instruções de recuperação"}
 
     nova_senha = generate_random_password(10)
-    nova_senha_hash = pwd_context.hash(nova_senha)
+    nova_senha_hash = get_password_hash(nova_senha)
     await db.users.update_one({"id": user["id"]}, {"$set": {"hashed_password": nova_senha_hash}})
 
     body_plain = f"""Olá {user.get('nome', 'Usuário')}, etc..."""
@@ -703,70 +1207,93 @@ async def recuperar_senha(dados_email: dict):
         texto_botao="Acessar o Portal",
         url_botao="https://alt-ilhabela.vercel.app/"
     )
-    await send_email(to_email=email, subject="Recuperação de Senha",
-                     body=body_plain, html_body=html_email)
+    await enqueue_email(email, "Recuperação de Senha", body_plain, html_email)
     return {"message": "Instruções enviadas para o seu email."}
 
 
+async def submeter_candidatura(candidatura, collection, idempotency_key: Optional[str]):
+    async def inserir():
+        existing_user = await db.users.find_one({"email": candidatura.email})
+        existing_candidatura = await collection.find_one({"email": candidatura.email, "status": "pendente"})
+        if existing_user or existing_candidatura:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="O email já se encontra registado ou com uma candidatura pendente."
+            )
+        candidatura_dict = candidatura.dict()
+        for key, value in candidatura_dict.items():
+            if hasattr(value, 'scheme'):
+                candidatura_dict[key] = str(value)
+        await collection.insert_one(candidatura_dict)
+        notificar_admin("candidatura_submetida", {
+            "tipo": candidatura.tipo, "id": candidatura.id, "nome": candidatura.nome})
+        return candidatura
+
+    # id e created_at são gerados em cada pedido: não entram na comparação
+    request_hash = fingerprint(candidatura.dict(exclude={"id", "created_at"}))
+    return await idempotency_store.run(
+        idempotency_key, f"candidaturas/{candidatura.tipo}", request_hash, inserir)
+
+
 @api_router.post("/candidaturas/membro", response_model=CandidaturaMembro)
-async def submit_candidatura_membro(candidatura: CandidaturaMembro):
-    existing_user = await db.users.find_one({"email": candidatura.email})
-    existing_candidatura = await db.candidaturas_membros.find_one({"email": candidatura.email, "status": "pendente"})
-    if existing_user or existing_candidatura:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O email já se encontra registado ou com uma candidatura pendente."
-        )
-    candidatura_dict = candidatura.dict()
-    for key, value in candidatura_dict.items():
-        if hasattr(value, 'scheme'):
-            candidatura_dict[key] = str(value)
-    await db.candidaturas_membros.insert_one(candidatura_dict)
-    return candidatura
+async def submit_candidatura_membro(
+    candidatura: CandidaturaMembro,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await submeter_candidatura(candidatura, db.candidaturas_membros, idempotency_key)
 
 
 @api_router.post("/candidaturas/parceiro", response_model=CandidaturaParceiro)
-async def submit_candidatura_parceiro(candidatura: CandidaturaParceiro):
-    existing_user = await db.users.find_one({"email": candidatura.email})
-    existing_candidatura = await db.candidaturas_parceiros.find_one({"email": candidatura.email, "status": "pendente"})
-    if existing_user or existing_candidatura:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O email já se encontra registado ou com uma candidatura pendente."
-        )
-    candidatura_dict = candidatura.dict()
-    for key, value in candidatura_dict.items():
-        if hasattr(value, 'scheme'):
-            candidatura_dict[key] = str(value)
-    await db.candidaturas_parceiros.insert_one(candidatura_dict)
-    return candidatura
+async def submit_candidatura_parceiro(
+    candidatura: CandidaturaParceiro,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await submeter_candidatura(candidatura, db.candidaturas_parceiros, idempotency_key)
 
 
 @api_router.post("/candidaturas/associado", response_model=CandidaturaAssociado)
-async def submit_candidatura_associado(candidatura: CandidaturaAssociado):
-    existing_user = await db.users.find_one({"email": candidatura.email})
-    existing_candidatura = await db.candidaturas_associados.find_one({"email": candidatura.email, "status": "pendente"})
-    if existing_user or existing_candidatura:
+async def submit_candidatura_associado(
+    candidatura: CandidaturaAssociado,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await submeter_candidatura(candidatura, db.candidaturas_associados, idempotency_key)
+
+
+EXPANSOES_IMOVEL = {"proprietario"}
+PROPRIETARIO_PUBLICO_PROJECTION = {"_id": 0, "id": 1, "nome": 1, "role": 1, "foto_url": 1}
+
+
+def parse_expand(expand: Optional[str]) -> set:
+    pedidas = {parte.strip() for parte in (expand or "").split(",") if parte.strip()}
+    invalidas = pedidas - EXPANSOES_IMOVEL
+    if invalidas:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O email já se encontra registado ou com uma candidatura pendente."
-        )
-    candidatura_dict = candidatura.dict()
-    for key, value in candidatura_dict.items():
-        if hasattr(value, 'scheme'):
-            candidatura_dict[key] = str(value)
-    await db.candidaturas_associados.insert_one(candidatura_dict)
-    return candidatura
+            status_code=400, detail=f"Expansão inválida: {', '.join(sorted(invalidas))}")
+    return pedidas
+
+
+async def expandir_proprietarios(imoveis: List[dict]) -> None:
+    """Junta os campos públicos do proprietário com um único $in sobre os ids distintos."""
+    ids = list({imovel["proprietario_id"] for imovel in imoveis if imovel.get("proprietario_id")})
+    if not ids:
+        return
+    proprietarios = await public_db.users.find(
+        {"id": {"$in": ids}}, PROPRIETARIO_PUBLICO_PROJECTION).to_list(length=None)
+    por_id = {proprietario["id"]: proprietario for proprietario in proprietarios}
+    for imovel in imoveis:
+        imovel["proprietario"] = por_id.get(imovel.get("proprietario_id"))
 
 
-@api_router.get("/imoveis", response_model=List[Imovel])
+@api_router.get("/imoveis", response_model=List[ImovelExpandido])
 async def get_imoveis(
     tipo: Optional[str] = None,
     regiao: Optional[str] = None,
     num_quartos: Optional[int] = None,
     possui_piscina: Optional[bool] = None,
-    permite_pets: Optional[bool] = None
+    permite_pets: Optional[bool] = None,
+    expand: Optional[str] = Query(None, description="Ex.: proprietario")
 ):
+    expansoes = parse_expand(expand)
     query = {"status_aprovacao": "aprovado", "ativo": True}
     if tipo and tipo != 'todos':
         query["tipo"] = tipo
@@ -778,17 +1305,11 @@ async def get_imoveis(
         query["possui_piscina"] = True
     if permite_pets:
         query["permite_pets"] = True
-    imoveis_cursor = db.imoveis.find(query).sort("created_at", -1)
+    imoveis_cursor = public_db.imoveis.find(query).sort("created_at", -1)
     imoveis = await imoveis_cursor.to_list(length=None)
-    valid_imoveis = []
-    for imovel_data in imoveis:
-        imovel_data.pop("_id", None)
-        try:
-            valid_imoveis.append(Imovel(**imovel_data))
-        except ValidationError as e:
-            print(
-                f"Skipping invalid property data (ID: {imovel_data.get('id')}): {e}")
-    return valid_imoveis
+    if "proprietario" in expansoes:
+        await expandir_proprietarios(imoveis)
+    return documentos_validos(ImovelExpandido, imoveis, "imoveis")
 
 
 @api_router.get("/meus-imoveis", response_model=List[Imovel])
@@ -802,7 +1323,17 @@ async def get_meus_imoveis(current_user: User = Depends(get_membro_user)):
 
 
 @api_router.post("/imoveis", response_model=Imovel)
-async def create_imovel(imovel_data: ImovelCreate, current_user: User = Depends(get_membro_user)):
+async def create_imovel(
+    imovel_data: ImovelCreate,
+    current_user: User = Depends(get_membro_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await idempotency_store.run(
+        idempotency_key, f"imoveis:{current_user.id}", fingerprint(imovel_data.dict()),
+        functools.partial(inserir_imovel, imovel_data, current_user))
+
+
+async def inserir_imovel(imovel_data: ImovelCreate, current_user: User) -> Imovel:
     imovel_dict = imovel_data.dict()
     url_fields = ['link_booking', 'link_airbnb']
     for field in url_fields:
@@ -821,31 +1352,113 @@ async def create_imovel(imovel_data: ImovelCreate, current_user: User = Depends(
         "visualizacoes": 0,
         "cliques_link": 0,
         "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc)
+        "updated_at": datetime.now(timezone.utc),
+        migrations.SCHEMA_VERSION_FIELD: migrations.current_version("imoveis"),
     })
     await db.imoveis.insert_one(imovel_dict)
-    created_property = await db.imoveis.find_one({"id": imovel_dict["id"]})
-    created_property.pop("_id", None)
-    return Imovel(**created_property)
+    # O documento inserido já é o estado gravado (o insert só acrescenta o _id)
+    imovel_dict.pop("_id", None)
+    notificar_admin("imovel_pendente", {
+        "id": imovel_dict["id"], "titulo": imovel_dict["titulo"], "proprietario_id": current_user.id})
+    return Imovel(**imovel_dict)
+
 
+@api_router.post("/imoveis/batch", response_model=ImoveisLote)
+async def get_imoveis_lote(lote: IdsLote):
+    """
+    Vários imóveis por id numa só consulta (favoritos, vistos recentemente).
+    Não conta como visualização.
+    """
+    itens, nao_encontrados = await buscar_por_ids(
+        public_db.imoveis, lote.ids, {"ativo": True}, Imovel)
+    return ImoveisLote(itens=itens, nao_encontrados=nao_encontrados)
 
-@api_router.get("/imoveis/{imovel_id}", response_model=Imovel)
-async def get_imovel(imovel_id: str):
-    imovel = await db.imoveis.find_one({"id": imovel_id, "ativo": True})
+
+@api_router.get("/imoveis/{imovel_id}", response_model=ImovelExpandido)
+async def get_imovel(imovel_id: str, expand: Optional[str] = Query(None, description="Ex.: proprietario")):
+    expansoes = parse_expand(expand)
+    imovel = await public_db.imoveis.find_one({"id": imovel_id, "ativo": True})
     if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
     await db.imoveis.update_one({"id": imovel_id}, {"$inc": {"visualizacoes": 1}})
+    engagement.record(imovel_id, "visualizacao")
     imovel.pop("_id", None)
-    return Imovel(**imovel)
+    if "proprietario" in expansoes:
+        await expandir_proprietarios([imovel])
+    return ImovelExpandido(**imovel)
+
+
+MAX_SIMILARES = 24
+
+
+@api_router.get("/imoveis/{imovel_id}/similares", response_model=List[Imovel])
+async def get_imoveis_similares(imovel_id: str, limit: int = Query(6, ge=1, le=MAX_SIMILARES)):
+    """
+    Imóveis aprovados mais parecidos com este (cosseno sobre o índice em memória).
+    """
+    projecao = {campo: 1 for campo in FEATURE_FIELDS}
+    projecao["_id"] = 0
+    imovel = await public_db.imoveis.find_one({"id": imovel_id, "ativo": True}, projecao)
+    if not imovel:
+        raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    ids = similarity_index.top_k(imovel, limit)
+    if not ids:
+        return []
+    docs = await public_db.imoveis.find(
+        {"id": {"$in": ids}, **CATALOG_QUERY}).to_list(length=None)
+    por_id = {doc["id"]: doc for doc in docs}
+    return documentos_validos(
+        Imovel, [por_id[similar_id] for similar_id in ids if similar_id in por_id], "imoveis")
+
+
+@api_router.post("/imoveis/{imovel_id}/clique")
+async def registrar_clique_imovel(imovel_id: str):
+    """Regista um clique nos links de reserva (Booking/Airbnb) do imóvel."""
+    result = await db.imoveis.update_one(
+        {"id": imovel_id, "ativo": True}, {"$inc": {"cliques_link": 1}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    engagement.record(imovel_id, "clique")
+    return {"message": "Clique registado"}
+
+
+MAX_DIAS_STATS = 366
+
+
+@api_router.get("/meus-imoveis/{imovel_id}/stats")
+async def get_imovel_stats(
+    imovel_id: str,
+    desde: Optional[date] = Query(None, alias="from"),
+    ate: Optional[date] = Query(None, alias="to"),
+    current_user: User = Depends(get_membro_user)
+):
+    """
+    Visualizações e cliques por dia, lidos só dos buckets pré-agregados.
+    """
+    query = {"id": imovel_id}
+    if current_user.role != UserRole.ADMIN:
+        query["proprietario_id"] = current_user.id
+    if not await db.imoveis.find_one(query, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    ate = ate or datetime.now(timezone.utc).date()
+    desde = desde or ate - timedelta(days=29)
+    if desde > ate:
+        raise HTTPException(
+            status_code=400, detail="A data inicial deve ser anterior à final")
+    if (ate - desde).days >= MAX_DIAS_STATS:
+        raise HTTPException(
+            status_code=400, detail=f"O intervalo máximo é de {MAX_DIAS_STATS} dias")
+    return await analytics.get_stats(db, imovel_id, desde, ate)
 
 
 @api_router.get("/imoveis/{imovel_id}/proprietario")
 async def get_imovel_proprietario(imovel_id: str, current_user: User = Depends(get_current_user)):
-    imovel = await db.imoveis.find_one({"id": imovel_id, "ativo": True})
+    imovel = await public_db.imoveis.find_one({"id": imovel_id, "ativo": True})
     if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
 
-    proprietario = await db.users.find_one({"id": imovel["proprietario_id"]})
+    proprietario = await public_db.users.find_one(
+        {"id": imovel["proprietario_id"]}, PROPRIETARIO_PUBLICO_PROJECTION)
     if not proprietario:
         raise HTTPException(
             status_code=404, detail="Proprietário não encontrado")
@@ -858,18 +1471,68 @@ async def get_imovel_proprietario(imovel_id: str, current_user: User = Depends(g
     }
 
 
-@api_router.get("/usuarios/{user_id}/perfil-publico")
+PERFIL_IMOVEIS_PAGINA = 12
+MAX_IMOVEIS_PAGINA = 50
+DESCRICAO_CARD_MAX = 200
+IMOVEL_CARD_PROJECTION = {
+    "_id": 0, "id": 1, "titulo": 1, "descricao": 1, "tipo": 1, "regiao": 1,
+    "fotos": {"$slice": 1}, "num_quartos": 1, "num_banheiros": 1,
+    "capacidade": 1, "created_at": 1}
+
+
+async def pagina_imoveis_proprietario(user_id: str, limit: int, cursor: Optional[str] = None,
+                                      fonte=None) -> ImoveisPagina:
+    """
+    Cartões dos imóveis aprovados do proprietário, do mais recente para o mais
+    antigo. `fonte` é o primário quando o resultado vai para a cache.
+    """
+    fonte = public_db if fonte is None else fonte
+    query = {"proprietario_id": user_id, "ativo": True, "status_aprovacao": "aprovado"}
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query["$or"] = [{"created_at": {"$lt": created_at}},
+                        {"created_at": created_at, "id": {"$lt": doc_id}}]
+    # Um a mais para saber se há página seguinte
+    docs = await fonte.imoveis.find(query, IMOVEL_CARD_PROJECTION).sort(
+        [("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(length=None)
+    itens = []
+    for doc in docs[:limit]:
+        doc["descricao"] = (doc.get("descricao") or "")[:DESCRICAO_CARD_MAX]
+        doc["foto"] = next(iter(doc.pop("fotos", None) or []), None)
+        try:
+            itens.append(ImovelCard(**doc))
+        except ValidationError as e:
+            logging.warning(f"Skipping invalid ImovelCard data (ID: {doc.get('id')}): {e}")
+    proximo_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return ImoveisPagina(itens=itens, proximo_cursor=proximo_cursor)
+
+
+@api_router.get("/usuarios/{user_id}/perfil-publico", response_model=PerfilPublico)
 async def get_perfil_publico(user_id: str):
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    imoveis = await db.imoveis.find(
-        {"proprietario_id": user_id, "ativo": True, "status_aprovacao": "aprovado"}
-    ).sort("created_at", -1).to_list(length=None)
-    for imovel in imoveis:
-        imovel.pop("_id", None)
-    return {"id": user["id"], "nome": user["nome"], "telefone": user.get("telefone"),
-            "role": user.get("role"), "imoveis": imoveis}
+    """
+    Perfil compacto do anfitrião com a primeira página de imóveis (em cache);
+    as seguintes vêm de /usuarios/{user_id}/imoveis?cursor=.
+    """
+    async def load_perfil_publico():
+        # Do primário: logo após uma invalidação um secundário ainda pode ter o valor antigo
+        user = await db.users.find_one(
+            {"id": user_id},
+            {"_id": 0, "id": 1, "nome": 1, "role": 1, "telefone": 1, "foto_url": 1, "descricao": 1})
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        pagina = await pagina_imoveis_proprietario(user_id, PERFIL_IMOVEIS_PAGINA, fonte=db)
+        return PerfilPublico(**user, imoveis=pagina.itens, proximo_cursor=pagina.proximo_cursor)
+
+    return await cache.get_or_load(PERFIL_PUBLICO_CACHE, user_id, load_perfil_publico)
+
+
+@api_router.get("/usuarios/{user_id}/imoveis", response_model=ImoveisPagina)
+async def get_imoveis_proprietario(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(PERFIL_IMOVEIS_PAGINA, ge=1, le=MAX_IMOVEIS_PAGINA)
+):
+    return await pagina_imoveis_proprietario(user_id, limit, cursor)
 
 
 # --- ROTA ATUALIZAR PERFIL MODIFICADA ---
@@ -901,7 +1564,7 @@ async def atualizar_perfil(
             contents = await foto.read()
 
             # Fazer o upload para o Cloudinary
-            upload_result = cloudinary.uploader.upload(
+            upload_result = cloudinary_upload(
                 contents,
                 public_id=public_id,
                 folder="alt_ilhabela/perfis",  # Organiza numa pasta
@@ -920,6 +1583,7 @@ async def atualizar_perfil(
 
     if update_data:
         await db.users.update_one({"id": user_id}, {"$set": update_data})
+        invalidate_perfil_publico(user_id)
 
     return {"message": "Perfil atualizado com sucesso"}
 
@@ -930,9 +1594,6 @@ async def update_imovel(
     imovel_data: ImovelUpdate,
     current_user: User = Depends(get_membro_user)
 ):
-    existing_imovel = await db.imoveis.find_one({"id": imovel_id, "proprietario_id": current_user.id})
-    if not existing_imovel:
-        raise HTTPException(status_code=404, detail="Imóvel não encontrado")
     update_data = imovel_data.dict(exclude_none=True)
     url_fields = ["video_url", "link_booking", "link_airbnb"]
     for field in url_fields:
@@ -941,13 +1602,16 @@ async def update_imovel(
             update_data[field] = str(
                 field_value) if field_value is not None else None
     update_data["updated_at"] = datetime.now(timezone.utc)
-    await db.imoveis.update_one({"id": imovel_id}, {"$set": update_data})
-    updated_imovel = await db.imoveis.find_one({"id": imovel_id})
-    if updated_imovel:
-        updated_imovel.pop("_id", None)
-        return Imovel(**updated_imovel)
-    raise HTTPException(
-        status_code=404, detail="Imóvel não encontrado após a atualização")
+    updated_imovel = await db.imoveis.find_one_and_update(
+        {"id": imovel_id, "proprietario_id": current_user.id},
+        {"$set": update_data},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER)
+    if not updated_imovel:
+        raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_perfil_publico(current_user.id)
+    await sync_similares(imovel_id, updated_imovel)
+    return Imovel(**updated_imovel)
 
 
 @api_router.delete("/imoveis/{imovel_id}")
@@ -958,38 +1622,34 @@ async def delete_imovel(imovel_id: str, current_user: User = Depends(get_membro_
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_perfil_publico(current_user.id)
+    await sync_similares(imovel_id)
     return {"message": "Imóvel removido com sucesso"}
 
 
 @api_router.get("/parceiros", response_model=List[PerfilParceiro])
 async def get_parceiros():
-    parceiros_cursor = await db.perfis_parceiros.find({"ativo": True}).sort("created_at", -1).to_list(length=None)
-    valid_parceiros = []
-    for parceiro_data in parceiros_cursor:
-        try:
-            valid_parceiros.append(PerfilParceiro(**parceiro_data))
-        except ValidationError as e:
-            logging.warning(
-                f"Skipping invalid partner data (ID: {parceiro_data.get('id')}): {e}")
-    return valid_parceiros
+    parceiros_cursor = await public_db.perfis_parceiros.find({"ativo": True}).sort("created_at", -1).to_list(length=None)
+    return documentos_validos(PerfilParceiro, parceiros_cursor, "perfis_parceiros")
 
 
 @api_router.get("/admin/parceiros", response_model=List[PerfilParceiro])
 async def get_admin_parceiros(current_user: User = Depends(get_admin_user)):
     parceiros_cursor = await db.perfis_parceiros.find({}).sort("created_at", -1).to_list(length=None)
-    parceiros_validos = []
-    for parceiro_data in parceiros_cursor:
-        try:
-            parceiros_validos.append(PerfilParceiro(**parceiro_data))
-        except Exception as e:
-            print(
-                f"AVISO: Dados de parceiro inválidos (ID: {parceiro_data.get('id', 'N/A')}). Erro: {e}")
-    return parceiros_validos
+    return documentos_validos(PerfilParceiro, parceiros_cursor, "perfis_parceiros")
+
+
+@api_router.post("/parceiros/batch", response_model=ParceirosLote)
+async def get_parceiros_lote(lote: IdsLote):
+    itens, nao_encontrados = await buscar_por_ids(
+        public_db.perfis_parceiros, lote.ids, {"ativo": True}, PerfilParceiro)
+    return ParceirosLote(itens=itens, nao_encontrados=nao_encontrados)
 
 
 @api_router.get("/parceiros/{parceiro_id}", response_model=PerfilParceiro)
 async def get_parceiro_detalhe(parceiro_id: str):
-    perfil = await db.perfis_parceiros.find_one({"id": parceiro_id, "ativo": True})
+    perfil = await public_db.perfis_parceiros.find_one({"id": parceiro_id, "ativo": True})
     if not perfil:
         raise HTTPException(status_code=404, detail="Parceiro não encontrado")
     return PerfilParceiro(**perfil)
@@ -1022,6 +1682,7 @@ async def create_perfil_parceiro(
         raise HTTPException(status_code=400, detail="Perfil já existe")
     perfil = PerfilParceiro(user_id=current_user.id, **perfil_data.dict())
     perfil_dict = perfil.dict()
+    perfil_dict[migrations.SCHEMA_VERSION_FIELD] = migrations.current_version("perfis_parceiros")
     await db.perfis_parceiros.insert_one(perfil_dict)
     return perfil
 
@@ -1041,19 +1702,17 @@ async def update_perfil_parceiro(
                 update_data[field] = None
             elif field in update_data:
                 update_data[field] = str(update_data[field])
-        result = await db.perfis_parceiros.update_one(
+        updated_perfil = await db.perfis_parceiros.find_one_and_update(
             {"id": perfil_id, "user_id": current_user.id},
-            {"$set": update_data}
-        )
-        if result.matched_count == 0:
-            raise HTTPException(
-                status_code=404, detail="Perfil não encontrado ou não tem permissão para editar")
-        updated_perfil = await db.perfis_parceiros.find_one({"id": perfil_id})
+            {"$set": update_data},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER)
         if not updated_perfil:
             raise HTTPException(
-                status_code=404, detail="Perfil não encontrado após atualização.")
-        updated_perfil.pop("_id", None)
+                status_code=404, detail="Perfil não encontrado ou não tem permissão para editar")
+        invalidate_cache(MAIN_PAGE_CACHE)
         return PerfilParceiro(**updated_perfil)
+    except HTTPException:
+        raise
     except ValidationError as e:
         print(
             f"!!!!! Pydantic Validation Error in update_perfil_parceiro: {e.json()}")
@@ -1088,20 +1747,48 @@ async def delete_perfil_parceiro(
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Erro ao excluir o perfil")
 
+    invalidate_cache(MAIN_PAGE_CACHE)
     return {"message": "Perfil de parceiro removido com sucesso"}
 
 
-@api_router.get("/noticias", response_model=List[Noticia])
+@api_router.get("/noticias", response_model=List[NoticiaListagem])
 async def get_noticias(
     categoria: Optional[str] = None,
+    tag: Optional[str] = None,
+    incluir_conteudo: bool = False,
     limit: Optional[int] = 20,
     current_user: User = Depends(get_current_user)
 ):
     query = {"publicada": True}
     if categoria:
         query["categoria"] = categoria
-    noticias = await db.noticias.find(query).sort("created_at", -1).limit(limit).to_list(length=None)
-    return [Noticia(**noticia) for noticia in noticias]
+    if tag:
+        query["tags"] = tag.strip().lower()
+    projecao = {"_id": 0} if incluir_conteudo else {"_id": 0, "conteudo": 0}
+    noticias = await public_db.noticias.find(query, projecao).sort("created_at", -1).limit(limit).to_list(length=None)
+    return [NoticiaListagem(**noticia) for noticia in noticias]
+
+
+MAX_TAGS_NUVEM = 50
+
+
+async def load_noticias_tags() -> List[dict]:
+    return await db.noticias.aggregate([
+        {"$match": {"publicada": True}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "total": {"$sum": 1}}},
+        {"$sort": {"total": -1, "_id": 1}},
+        {"$limit": MAX_TAGS_NUVEM},
+        {"$project": {"_id": 0, "tag": "$_id", "total": 1}},
+    ]).to_list(length=None)
+
+
+@api_router.get("/noticias/tags")
+async def get_noticias_tags():
+    """
+    Nuvem de tags das notícias publicadas (agregação em cache).
+    """
+    return await cache.get_or_load(NOTICIAS_TAGS_CACHE, "", load_noticias_tags)
 
 
 @api_router.put("/admin/imoveis/{imovel_id}/status")
@@ -1117,21 +1804,32 @@ async def admin_toggle_imovel_status(
     if novo_status is None:
         raise HTTPException(status_code=400, detail="Status não fornecido")
 
-    result = await db.imoveis.update_one(
+    imovel = await db.imoveis.find_one_and_update(
         {"id": imovel_id},
         {"$set": {"ativo": novo_status,
-                  "updated_at": datetime.now(timezone.utc)}}
+                  "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "proprietario_id": 1}
     )
 
-    if result.matched_count == 0:
+    if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
 
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_perfil_publico(imovel.get("proprietario_id"))
+    await sync_similares(imovel_id)
     return {"message": f"Imóvel {'ativado' if novo_status else 'desativado'} com sucesso"}
 
 
+@api_router.post("/noticias/batch", response_model=NoticiasLote)
+async def get_noticias_lote(lote: IdsLote):
+    itens, nao_encontrados = await buscar_por_ids(
+        public_db.noticias, lote.ids, {"publicada": True}, Noticia)
+    return NoticiasLote(itens=itens, nao_encontrados=nao_encontrados)
+
+
 @api_router.get("/noticias/{noticia_id}", response_model=Noticia)
 async def get_noticia(noticia_id: str):
-    noticia = await db.noticias.find_one({"id": noticia_id, "publicada": True})
+    noticia = await public_db.noticias.find_one({"id": noticia_id, "publicada": True})
     if not noticia:
         raise HTTPException(status_code=404, detail="Notícia não encontrada")
     return Noticia(**noticia)
@@ -1145,7 +1843,11 @@ async def create_noticia(noticia_data: NoticiaCreate, current_user: User = Depen
     for key, value in noticia_dict.items():
         if hasattr(value, 'scheme'):
             noticia_dict[key] = str(value)
+    noticia_dict[migrations.SCHEMA_VERSION_FIELD] = migrations.current_version("noticias")
     await db.noticias.insert_one(noticia_dict)
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_cache(NOTICIAS_TAGS_CACHE)
+    await enqueue_relacionadas(noticia.id)
     return noticia
 
 
@@ -1163,18 +1865,27 @@ async def update_noticia(
 ):
     update_data = noticia_data.dict()
     update_data["updated_at"] = datetime.now(timezone.utc)
-    result = await db.noticias.update_one({"id": noticia_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    # O documento anterior dá as tags antigas; o novo é ele com o $set aplicado
+    anterior = await db.noticias.find_one_and_update(
+        {"id": noticia_id}, {"$set": update_data},
+        projection={"_id": 0}, return_document=ReturnDocument.BEFORE)
+    if not anterior:
         raise HTTPException(status_code=404, detail="Notícia não encontrada")
-    updated_noticia = await db.noticias.find_one({"id": noticia_id})
+    updated_noticia = {**anterior, **update_data}
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_cache(NOTICIAS_TAGS_CACHE)
+    await enqueue_relacionadas(noticia_id, anterior.get("tags", []))
     return Noticia(**updated_noticia)
 
 
 @api_router.delete("/admin/noticias/{noticia_id}")
 async def delete_noticia(noticia_id: str, current_user: User = Depends(get_admin_user)):
-    result = await db.noticias.delete_one({"id": noticia_id})
-    if result.deleted_count == 0:
+    noticia = await db.noticias.find_one_and_delete({"id": noticia_id}, {"_id": 0, "tags": 1})
+    if not noticia:
         raise HTTPException(status_code=404, detail="Notícia não encontrada")
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_cache(NOTICIAS_TAGS_CACHE)
+    await enqueue_relacionadas(noticia_id, noticia.get("tags", []))
     return {"message": "Notícia deletada com sucesso"}
 
 
@@ -1184,14 +1895,8 @@ async def get_dashboard_stats(current_user: User = Depends(get_admin_user)):
     total_membros = await db.users.count_documents({"role": "membro"})
     total_parceiros = await db.users.count_documents({"role": "parceiro"})
     total_associados = await db.users.count_documents({"role": "associado"})
-    candidaturas_membros = await db.candidaturas_membros.count_documents(
-        {"status": "pendente"})
-    candidaturas_parceiros = await db.candidaturas_parceiros.count_documents(
-        {"status": "pendente"})
-    candidaturas_associados = await db.candidaturas_associados.count_documents(
-        {"status": "pendente"})
-    candidaturas_pendentes = candidaturas_membros + \
-        candidaturas_parceiros + candidaturas_associados
+    # As mesmas contagens que o evento SSE "contagens" atualiza
+    pendentes = await contagens_pendentes()
     total_imoveis = await db.imoveis.count_documents({"ativo": True, "status_aprovacao": "aprovado"})
     total_noticias = await db.noticias.count_documents({"publicada": True})
     imoveis_destaque = await db.imoveis.count_documents(
@@ -1199,10 +1904,153 @@ async def get_dashboard_stats(current_user: User = Depends(get_admin_user)):
     parceiros_destaque = await db.perfis_parceiros.count_documents(
         {"ativo": True, "destaque": True})
     return DashboardStats(total_users=total_users, total_membros=total_membros, total_parceiros=total_parceiros, total_associados=total_associados,
-                          candidaturas_pendentes=candidaturas_pendentes, total_imoveis=total_imoveis, total_noticias=total_noticias,
+                          candidaturas_pendentes=pendentes["candidaturas_pendentes"],
+                          imoveis_pendentes=pendentes["imoveis_pendentes"],
+                          total_imoveis=total_imoveis, total_noticias=total_noticias,
                           imoveis_destaque=imoveis_destaque, parceiros_destaque=parceiros_destaque)
 
 
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_RETRY_MS = 3000
+
+
+def formatar_sse(tipo: str, dados: Any, event_id: Optional[int] = None) -> str:
+    linhas = [] if event_id is None else [f"id: {event_id}"]
+    linhas += [f"event: {tipo}", f"data: {json.dumps(dados, default=str)}"]
+    return "\n".join(linhas) + "\n\n"
+
+
+@api_router.get("/admin/events")
+async def admin_events(
+    request: Request,
+    cursor: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Stream SSE com os eventos do painel (candidatura_submetida, imovel_pendente,
+    contagens). Ao ligar envia as contagens atuais; ao voltar a ligar com
+    Last-Event-ID (ou ?cursor=) envia primeiro os eventos perdidos, ou
+    "resync" se já expiraram. Um comentário de heartbeat mantém a ligação viva.
+    """
+    if last_event_id is not None:
+        try:
+            cursor = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID inválido")
+
+    # A assinatura é feita antes do replay para não perder eventos entre os dois
+    assinatura = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            enviados = set()
+            if cursor is not None:
+                eventos, perdidos = await event_bus.replay(cursor)
+                if perdidos:
+                    yield formatar_sse(RESYNC, {})
+                for evento in eventos:
+                    enviados.add(evento["_id"])
+                    yield formatar_sse(evento["tipo"], evento["dados"], evento["_id"])
+            yield formatar_sse("contagens", await contagens_pendentes())
+            while not await request.is_disconnected():
+                if assinatura.perdeu_eventos:
+                    # Cliente demasiado lento: descarta a fila e pede para recarregar
+                    assinatura.perdeu_eventos = False
+                    while not assinatura.fila.empty():
+                        assinatura.fila.get_nowait()
+                    yield formatar_sse(RESYNC, {})
+                try:
+                    evento = await asyncio.wait_for(assinatura.fila.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if evento["_id"] in enviados:
+                    continue
+                yield formatar_sse(evento["tipo"], evento["dados"], evento["_id"])
+        finally:
+            event_bus.unsubscribe(assinatura)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Desliga o buffering em proxies (nginx) para os eventos saírem de imediato
+        "X-Accel-Buffering": "no",
+    })
+
+
+CANDIDATURA_MODELOS = {"membro": CandidaturaMembro, "parceiro": CandidaturaParceiro,
+                       "associado": CandidaturaAssociado}
+MAX_CANDIDATURAS_PAGINA = 100
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["created_at"].isoformat(), doc["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@api_router.get("/admin/candidaturas", response_model=CandidaturasPagina)
+async def get_candidaturas(
+    tipo: Optional[List[str]] = Query(None),
+    status_filtro: str = Query("pendente", alias="status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_CANDIDATURAS_PAGINA),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Fila de moderação única: as três coleções numa só agregação ($unionWith),
+    da mais antiga para a mais recente, com paginação por keyset e contagens por tipo.
+    Cada ramo aplica o cursor, ordena e limita pelo índice fila_moderacao; a
+    união só junta e ordena no máximo limit + 1 documentos por tipo.
+    """
+    tipos = list(dict.fromkeys(tipo or CANDIDATURA_MODELOS))
+    if any(t not in CANDIDATURA_MODELOS for t in tipos):
+        raise HTTPException(
+            status_code=400, detail="Tipo de candidatura inválido")
+    collections = candidatura_collections()
+
+    filtro = {"status": status_filtro}
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        filtro["$or"] = [{"created_at": {"$gt": created_at}},
+                         {"created_at": created_at, "id": {"$gt": doc_id}}]
+    ordem = {"$sort": {"created_at": 1, "id": 1}}
+
+    def ramo(t: str) -> List[dict]:
+        # Um a mais para saber se há página seguinte
+        return [{"$match": filtro}, ordem, {"$limit": limit + 1},
+                {"$project": {"_id": 0}},
+                {"$addFields": {"tipo": t}}]
+
+    pipeline = ramo(tipos[0]) + [
+        {"$unionWith": {"coll": collections[t].name, "pipeline": ramo(t)}}
+        for t in tipos[1:]
+    ] + [ordem, {"$limit": limit + 1}]
+    # As contagens (todos os tipos, sem cursor) vêm dos índices, fora da agregação
+    docs, totais = await asyncio.gather(
+        collections[tipos[0]].aggregate(pipeline).to_list(length=None),
+        asyncio.gather(*(collections[t].count_documents({"status": status_filtro})
+                         for t in CANDIDATURA_MODELOS)))
+
+    proximo_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    itens = []
+    for doc in docs[:limit]:
+        try:
+            itens.append(CANDIDATURA_MODELOS[doc["tipo"]](**doc))
+        except ValidationError as e:
+            logging.warning(f"Skipping invalid candidatura data (ID: {doc.get('id')}): {e}")
+    contagens = dict(zip(CANDIDATURA_MODELOS, totais))
+    return CandidaturasPagina(itens=itens, contagens=contagens, proximo_cursor=proximo_cursor)
+
+
 @api_router.get("/admin/candidaturas/membros", response_model=List[CandidaturaMembro])
 async def get_candidaturas_membros(current_user: User = Depends(get_admin_user)):
     candidaturas = await db.candidaturas_membros.find({"status": "pendente"}).to_list(length=None)
@@ -1225,7 +2073,6 @@ async def get_candidaturas_associados(current_user: User = Depends(get_admin_use
 async def aprovar_candidatura(
     tipo: str,
     candidatura_id: str,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_admin_user)
 ):
     collection_map = {"membro": db.candidaturas_membros, "parceiro": db.candidaturas_parceiros,
@@ -1250,20 +2097,12 @@ async def aprovar_candidatura(
     user_doc = user_obj.dict()
     user_doc['hashed_password'] = hashed_password
     await db.users.insert_one(user_doc)
-    await collection.update_one({"id": candidatura_id}, {"$set": {"status": "aprovado"}})
-    subject = "Bem-vindo à ALT Ilhabela!"
-    body_plain = f"""Olá {candidatura['nome']}, etc..."""
-    body_html_content = f"""<p>Sua candidatura foi <strong>aprovada</strong>!</p>"""
-    html_email = create_praia_email_html(
-        titulo="Bem-vindo(a)!",
-        pre_cabecalho="Sua candidatura foi aprovada.",
-        nome_usuario=candidatura['nome'],
-        corpo_mensagem=body_html_content,
-        texto_botao="Acessar o Portal",
-        url_botao="https://temp-housing.preview.emergentagent.com/login"
-    )
-    background_tasks.add_task(
-        send_email, candidatura['email'], subject, body_plain, html_email)
+    await collection.update_one({"id": candidatura_id}, {"$set": {
+        "status": "aprovado", "resolvido_em": datetime.now(timezone.utc)}})
+    subject, body_plain, html_email = build_candidatura_aprovada_email(
+        candidatura)
+    await enqueue_email(candidatura['email'], subject, body_plain, html_email)
+    notificar_admin()
     return {"message": "Candidatura aprovada com sucesso"}
 
 
@@ -1271,7 +2110,6 @@ async def aprovar_candidatura(
 async def recusar_candidatura(
     tipo: str,
     candidatura_id: str,
-    background_tasks: BackgroundTasks,
     motivo: str = Body(..., embed=True),
     current_user: User = Depends(get_admin_user)
 ):
@@ -1286,17 +2124,213 @@ async def recusar_candidatura(
         raise HTTPException(
             status_code=404, detail="Candidatura não encontrada")
     await collection.update_one({"id": candidatura_id}, {
-                                "$set": {"status": "recusado", "motivo_recusa": motivo}})
-    subject = "Atualização sobre sua candidatura - ALT Ilhabela"
-    body = f"""Olá {candidatura['nome']}, etc..."""
-    background_tasks.add_task(send_email, candidatura['email'], subject, body)
+                                "$set": {"status": "recusado", "motivo_recusa": motivo,
+                                         "resolvido_em": datetime.now(timezone.utc)}})
+    subject, body = build_candidatura_recusada_email(candidatura)
+    await enqueue_email(candidatura['email'], subject, body)
+    notificar_admin()
     return {"message": "Candidatura recusada"}
 
 
+def candidatura_collections():
+    return {"membro": db.candidaturas_membros, "parceiro": db.candidaturas_parceiros,
+            "associado": db.candidaturas_associados}
+
+
+async def reclamar_candidaturas(collection, ids: List[str], campos: dict) -> set:
+    """
+    Aplica `campos` às candidaturas ainda pendentes e devolve os ids que este
+    pedido alterou. `campos` inclui o `resolvido_em` do pedido, que serve de
+    marca: uma candidatura resolvida em paralelo por outro admin não é devolvida.
+    """
+    if not ids:
+        return set()
+    await collection.update_many({"id": {"$in": ids}, "status": "pendente"}, {"$set": campos})
+    docs = await collection.find({"id": {"$in": ids}, **campos}, {"id": 1}).to_list(length=None)
+    return {c["id"] for c in docs}
+
+
+def agora_bson() -> datetime:
+    # O BSON guarda milissegundos; truncar para o valor poder ser usado como filtro
+    agora = datetime.now(timezone.utc)
+    return agora.replace(microsecond=agora.microsecond // 1000 * 1000)
+
+
+@api_router.post("/admin/candidaturas/aprovar-lote", response_model=ResultadoLote)
+async def aprovar_candidaturas_lote(
+    lote: CandidaturasLote,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Aprova várias candidaturas de uma vez: uma consulta e um update por coleção,
+    hashes bcrypt calculados em paralelo e e-mails entregues pela fila de tarefas.
+    Só são criados utilizadores para as candidaturas que este pedido passou de
+    pendente a aprovado.
+    """
+    collection_map = candidatura_collections()
+    itens = list(dict.fromkeys((item.tipo, item.id) for item in lote.itens))
+    resultados: Dict[tuple, ResultadoItemLote] = {}
+
+    ids_por_tipo: Dict[str, List[str]] = {}
+    for tipo, candidatura_id in itens:
+        if tipo not in collection_map:
+            resultados[(tipo, candidatura_id)] = ResultadoItemLote(
+                id=candidatura_id, tipo=tipo, status="erro", detalhe="Tipo de candidatura inválido")
+        else:
+            ids_por_tipo.setdefault(tipo, []).append(candidatura_id)
+
+    encontradas = {}
+    for tipo, ids in ids_por_tipo.items():
+        docs = await collection_map[tipo].find({"id": {"$in": ids}}).to_list(length=None)
+        for c in docs:
+            encontradas[(tipo, c["id"])] = c
+
+    emails = list({c["email"] for c in encontradas.values()})
+    existentes = await db.users.find({"email": {"$in": emails}}, {"email": 1}).to_list(length=None)
+    emails_em_uso = {u["email"] for u in existentes}
+
+    candidatas = []
+    for tipo, candidatura_id in itens:
+        key = (tipo, candidatura_id)
+        if key in resultados:
+            continue
+        candidatura = encontradas.get(key)
+        if candidatura is None:
+            resultados[key] = ResultadoItemLote(
+                id=candidatura_id, tipo=tipo, status="nao_encontrada", detalhe="Candidatura não encontrada")
+        elif candidatura.get("status") != "pendente":
+            resultados[key] = ResultadoItemLote(
+                id=candidatura_id, tipo=tipo, status="erro", detalhe=f"Candidatura já {candidatura.get('status')}")
+        elif candidatura["email"] in emails_em_uso:
+            resultados[key] = ResultadoItemLote(
+                id=candidatura_id, tipo=tipo, status="erro", detalhe="Usuário já existe")
+        else:
+            emails_em_uso.add(candidatura["email"])
+            candidatas.append((tipo, candidatura))
+
+    resolvido_em = agora_bson()
+    aprovacao = {"status": "aprovado", "resolvido_em": resolvido_em}
+    reclamadas = set()
+    for tipo in {tipo for tipo, _ in candidatas}:
+        ids = [c["id"] for t, c in candidatas if t == tipo]
+        reclamadas |= {(tipo, cid) for cid in
+                       await reclamar_candidaturas(collection_map[tipo], ids, aprovacao)}
+
+    a_aprovar = []
+    for tipo, candidatura in candidatas:
+        if (tipo, candidatura["id"]) in reclamadas:
+            a_aprovar.append((tipo, candidatura))
+        else:
+            resultados[(tipo, candidatura["id"])] = ResultadoItemLote(
+                id=candidatura["id"], tipo=tipo, status="erro", detalhe="Candidatura já resolvida")
+
+    # bcrypt liberta o GIL, por isso os hashes correm em paralelo no threadpool
+    hashes = await asyncio.gather(*[
+        run_in_threadpool(get_password_hash, secrets.token_urlsafe(12)) for _ in a_aprovar])
+
+    novos_users = []
+    for (tipo, candidatura), hashed_password in zip(a_aprovar, hashes):
+        key = (tipo, candidatura["id"])
+        try:
+            user_obj = User(email=candidatura['email'], nome=candidatura['nome'],
+                            telefone=candidatura.get('telefone'), role=tipo)
+        except ValidationError as e:
+            resultados[key] = ResultadoItemLote(
+                id=candidatura["id"], tipo=tipo, status="erro", detalhe=str(e))
+            continue
+        user_doc = user_obj.dict()
+        user_doc['hashed_password'] = hashed_password
+        novos_users.append((tipo, candidatura, user_doc))
+
+    falhados: Dict[int, dict] = {}
+    if novos_users:
+        try:
+            await db.users.bulk_write([InsertOne(doc) for _, _, doc in novos_users], ordered=False)
+        except BulkWriteError as e:
+            falhados = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+    emails = []
+    for idx, (tipo, candidatura, _) in enumerate(novos_users):
+        key = (tipo, candidatura["id"])
+        if idx in falhados:
+            # Índice único em users.email: outro pedido criou o utilizador entretanto
+            detalhe = "Usuário já existe" if falhados[idx].get("code") == 11000 \
+                else "Erro ao criar o usuário"
+            resultados[key] = ResultadoItemLote(
+                id=candidatura["id"], tipo=tipo, status="erro", detalhe=detalhe)
+            continue
+        resultados[key] = ResultadoItemLote(
+            id=candidatura["id"], tipo=tipo, status="aprovado")
+        subject, body_plain, html_email = build_candidatura_aprovada_email(
+            candidatura)
+        emails.append({"to_email": candidatura['email'], "subject": subject,
+                       "body": body_plain, "html_body": html_email})
+
+    # Sem utilizador criado, a candidatura volta a ficar pendente
+    por_reverter: Dict[str, List[str]] = {}
+    for tipo, candidatura in a_aprovar:
+        if resultados[(tipo, candidatura["id"])].status != "aprovado":
+            por_reverter.setdefault(tipo, []).append(candidatura["id"])
+    for tipo, ids in por_reverter.items():
+        await collection_map[tipo].update_many(
+            {"id": {"$in": ids}, **aprovacao},
+            {"$set": {"status": "pendente"}, "$unset": {"resolvido_em": ""}})
+
+    await jobs.enqueue_many(db, "email", emails)
+    if emails:
+        notificar_admin()
+
+    return resultado_lote([resultados[key] for key in itens])
+
+
+@api_router.post("/admin/candidaturas/recusar-lote", response_model=ResultadoLote)
+async def recusar_candidaturas_lote(
+    lote: CandidaturasRecusaLote,
+    current_user: User = Depends(get_admin_user)
+):
+    collection_map = candidatura_collections()
+    itens = list(dict.fromkeys((item.tipo, item.id) for item in lote.itens))
+    resultados: Dict[tuple, ResultadoItemLote] = {}
+
+    ids_por_tipo: Dict[str, List[str]] = {}
+    for tipo, candidatura_id in itens:
+        if tipo not in collection_map:
+            resultados[(tipo, candidatura_id)] = ResultadoItemLote(
+                id=candidatura_id, tipo=tipo, status="erro", detalhe="Tipo de candidatura inválido")
+        else:
+            ids_por_tipo.setdefault(tipo, []).append(candidatura_id)
+
+    emails = []
+    recusa = {"status": "recusado", "motivo_recusa": lote.motivo, "resolvido_em": agora_bson()}
+    for tipo, ids in ids_por_tipo.items():
+        collection = collection_map[tipo]
+        recusadas = await reclamar_candidaturas(collection, ids, recusa)
+        candidaturas = await collection.find({"id": {"$in": ids}}).to_list(length=None)
+        for candidatura in candidaturas:
+            key = (tipo, candidatura["id"])
+            if candidatura["id"] not in recusadas:
+                resultados[key] = ResultadoItemLote(
+                    id=candidatura["id"], tipo=tipo, status="erro",
+                    detalhe=f"Candidatura já {candidatura.get('status')}")
+                continue
+            resultados[key] = ResultadoItemLote(
+                id=candidatura["id"], tipo=tipo, status="recusado")
+            subject, body = build_candidatura_recusada_email(candidatura)
+            emails.append({"to_email": candidatura['email'],
+                           "subject": subject, "body": body})
+    await jobs.enqueue_many(db, "email", emails)
+    if emails:
+        notificar_admin()
+
+    return resultado_lote([
+        resultados.get((tipo, candidatura_id)) or ResultadoItemLote(
+            id=candidatura_id, tipo=tipo, status="nao_encontrada", detalhe="Candidatura não encontrada")
+        for tipo, candidatura_id in itens])
+
+
 @api_router.post("/admin/email-massa")
 async def enviar_email_massa(
     email_data: EmailMassa,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_admin_user)
 ):
     user_emails = []
@@ -1308,12 +2342,85 @@ async def enviar_email_massa(
         for user in users:
             if user['email'] not in user_emails:
                 user_emails.append(user['email'])
-    for email in user_emails:
-        background_tasks.add_task(
-            send_email, email, email_data.assunto, email_data.mensagem)
+    # Prioridade baixa: não atrasa os emails transacionais
+    await jobs.enqueue_many(db, "email", [
+        {"to_email": email, "subject": email_data.assunto, "body": email_data.mensagem}
+        for email in user_emails], prioridade=jobs.PRIORIDADE_BAIXA)
     return {"message": f"Email enviado para {len(user_emails)} usuários", "destinatarios": len(user_emails)}
 
 
+# --- Exportação em streaming (CSV / NDJSON) ---
+EXPORT_BATCH_SIZE = 500
+# recurso -> (coleção, colunas exportadas); hashed_password nunca sai
+EXPORTS = {
+    "users": ("users", list(User.model_fields)),
+    "imoveis": ("imoveis", list(Imovel.model_fields)),
+    "parceiros": ("perfis_parceiros", list(PerfilParceiro.model_fields)),
+    "candidaturas_membros": ("candidaturas_membros", list(CandidaturaMembro.model_fields) + ["motivo_recusa"]),
+    "candidaturas_parceiros": ("candidaturas_parceiros", list(CandidaturaParceiro.model_fields) + ["motivo_recusa"]),
+    "candidaturas_associados": ("candidaturas_associados", list(CandidaturaAssociado.model_fields) + ["motivo_recusa"]),
+}
+
+
+async def stream_export(collection_name: str, campos: List[str], query: dict, formato: str):
+    # O cabeçalho sai antes da primeira consulta, para o primeiro byte chegar de imediato
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=campos, extrasaction='ignore')
+    if formato == "csv":
+        writer.writeheader()
+        yield buffer.getvalue()
+    projecao = {campo: 1 for campo in campos}
+    projecao["_id"] = 0
+    cursor = db[collection_name].find(
+        query, projecao, batch_size=EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        if formato == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow({k: flat_value(v) for k, v in doc.items()})
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(doc, default=to_jsonable, ensure_ascii=False) + "\n"
+
+
+@api_router.get("/admin/export/{recurso}")
+async def exportar_recurso(
+    recurso: str,
+    formato: str = "csv",
+    status_filtro: Optional[str] = Query(None, alias="status"),
+    role: Optional[str] = None,
+    ativo: Optional[bool] = None,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Exporta users, imóveis, parceiros ou candidaturas linha a linha a partir do cursor,
+    sem montar a lista em memória.
+    """
+    if recurso not in EXPORTS:
+        raise HTTPException(
+            status_code=404, detail=f"Recurso de exportação inválido. Opções: {', '.join(EXPORTS)}")
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=400, detail="Formato inválido (use csv ou ndjson)")
+    collection_name, campos = EXPORTS[recurso]
+    query = {}
+    if status_filtro is not None:
+        campo_status = "status_aprovacao" if recurso == "imoveis" else "status"
+        query[campo_status] = status_filtro
+    if role is not None:
+        query["role"] = role
+    if ativo is not None:
+        query["ativo"] = ativo
+
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    extensao = "csv" if formato == "csv" else "ndjson"
+    filename = f"{recurso}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{extensao}"
+    return StreamingResponse(
+        stream_export(collection_name, campos, query, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 @api_router.get("/admin/users", response_model=List[User])
 async def get_all_users(current_user: User = Depends(get_admin_user)):
     users = await db.users.find({}).to_list(length=None)
@@ -1330,15 +2437,16 @@ async def update_user(
     if not user_to_update:
         raise HTTPException(
             status_code=404, detail="Utilizador não encontrado")
-    if user_updates.get("ativo") is False:
-        if user_to_update.get("role") == "membro":
-            await db.imoveis.update_many({"proprietario_id": user_id}, {"$set": {"ativo": False}})
-        elif user_to_update.get("role") == "parceiro":
-            await db.perfis_parceiros.update_many({"user_id": user_id}, {"$set": {"ativo": False}})
     result = await db.users.update_one({"id": user_id}, {"$set": user_updates})
     if result.matched_count == 0:
         raise HTTPException(
             status_code=404, detail="Utilizador não encontrado durante a atualização")
+    invalidate_perfil_publico(user_id)
+    if user_updates.get("ativo") is False and user_to_update.get("role") in ("membro", "parceiro"):
+        await jobs.enqueue(db, "desativar_dados_utilizador",
+                           {"user_id": user_id, "role": user_to_update["role"]},
+                           prioridade=jobs.PRIORIDADE_ALTA)
+    invalidate_cache(MAIN_PAGE_CACHE)
     return {"message": "Utilizador atualizado com sucesso"}
 
 
@@ -1352,59 +2460,47 @@ async def delete_user(user_id: str, current_user: User = Depends(get_admin_user)
         raise HTTPException(
             status_code=404, detail="Utilizador não encontrado")
     user_role = user_to_delete.get("role")
-    if user_role == "membro":
-        await db.imoveis.update_many({"proprietario_id": user_id}, {"$set": {"ativo": False}})
-    elif user_role == "parceiro":
-        await db.perfis_parceiros.update_many({"user_id": user_id}, {"$set": {"ativo": False}})
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(
             status_code=404, detail="Utilizador não encontrado durante a exclusão")
+    invalidate_perfil_publico(user_id)
+    if user_role in ("membro", "parceiro"):
+        await jobs.enqueue(db, "desativar_dados_utilizador",
+                           {"user_id": user_id, "role": user_role},
+                           prioridade=jobs.PRIORIDADE_ALTA)
+    invalidate_cache(MAIN_PAGE_CACHE)
     return {"message": f"Utilizador {user_to_delete.get('nome', 'desconhecido')} foi removido e seus dados associados foram desativados."}
 
 
 @api_router.get("/admin/imoveis", response_model=List[Imovel])
 async def get_admin_imoveis(current_user: User = Depends(get_admin_user)):
     imoveis = await db.imoveis.find({}).sort("created_at", -1).to_list(length=None)
-    valid_imoveis = []
-    for imovel_data in imoveis:
-        imovel_data.pop("_id", None)
-        try:
-            valid_imoveis.append(Imovel(**imovel_data))
-        except Exception as e:
-            print(
-                f"Skipping invalid property data (ID: {imovel_data.get('id')}): {e}")
-    return valid_imoveis
+    return documentos_validos(Imovel, imoveis, "imoveis")
 
 
 @api_router.post("/admin/imoveis/{imovel_id}/aprovar")
 async def aprovar_imovel(imovel_id: str, current_user: User = Depends(get_admin_user)):
-    result = await db.imoveis.update_one(
+    imovel = await db.imoveis.find_one_and_update(
         {"id": imovel_id},
         {"$set": {"status_aprovacao": "aprovado",
-                  "updated_at": datetime.now(timezone.utc)}}
+                  "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
-    imovel = await db.imoveis.find_one({"id": imovel_id})
     owner = await db.users.find_one({"id": imovel["proprietario_id"]})
     if owner and owner.get("email"):
         try:
-            subject = "Seu Imóvel foi Aprovado!"
-            body_plain = f"""Olá {owner.get('nome', 'Proprietário')}, etc..."""
-            body_html_content = f"""<p>Ótimas notícias! Seu imóvel "<strong>{imovel['titulo']}</strong>" foi aprovado.</p>"""
-            html_email = create_praia_email_html(
-                titulo="Imóvel Aprovado!",
-                pre_cabecalho=f"Boas notícias sobre o seu imóvel {imovel['titulo']}",
-                nome_usuario=owner.get('nome', 'Proprietário'),
-                corpo_mensagem=body_html_content,
-                texto_botao="Gerenciar Meus Imóveis",
-                url_botao="https://alt-ilhabela.vercel.app/meus-imoveis"
-            )
-            await send_email(to_email=owner["email"], subject=subject,
-                             body=body_plain, html_body=html_email)
+            subject, body_plain, html_email = build_imovel_aprovado_email(
+                owner, imovel)
+            await enqueue_email(owner["email"], subject, body_plain, html_email)
         except Exception as e:
-            print(f"Erro ao enviar email de aprovação de imóvel: {e}")
+            print(f"Erro ao agendar email de aprovação de imóvel: {e}")
+    invalidate_cache(MAIN_PAGE_CACHE)
+    await sync_similares(imovel_id, imovel)
+    notificar_admin()
+    invalidate_perfil_publico(imovel["proprietario_id"])
     return {"message": "Imóvel aprovado com sucesso"}
 
 
@@ -1414,71 +2510,128 @@ async def recusar_imovel(
     motivo: str = Body(..., embed=True),
     current_user: User = Depends(get_admin_user)
 ):
-    result = await db.imoveis.update_one(
+    imovel = await db.imoveis.find_one_and_update(
         {"id": imovel_id},
         {"$set": {"status_aprovacao": "recusado",
-                  "updated_at": datetime.now(timezone.utc)}}
+                  "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
-    imovel = await db.imoveis.find_one({"id": imovel_id})
     owner = await db.users.find_one({"id": imovel["proprietario_id"]})
     if owner and owner.get("email"):
         try:
-            subject = "Atualização sobre seu Imóvel - ALT Ilhabela"
-            body_plain = f"""Olá {owner.get('nome', 'Proprietário')}, etc..."""
-            html_motivo = f"<p><strong>Motivo:</strong> {motivo}</p>" if motivo else "<p>Por favor, revise os dados.</p>"
-            body_html_content = f"""<p>Seu imóvel "<strong>{imovel['titulo']}</strong>" precisa de ajustes.</p>{html_motivo}"""
-            html_email = create_praia_email_html(
-                titulo="Atualização sobre seu Imóvel",
-                pre_cabecalho="Informações sobre a publicação do seu imóvel.",
-                nome_usuario=owner.get('nome', 'Proprietário'),
-                corpo_mensagem=body_html_content,
-                texto_botao="Acessar Meus Imóveis",
-                url_botao="https://alt-ilhabela.vercel.app/meus-imoveis"
-            )
-            await send_email(to_email=owner["email"], subject=subject,
-                             body=body_plain, html_body=html_email)
+            subject, body_plain, html_email = build_imovel_recusado_email(
+                owner, imovel, motivo)
+            await enqueue_email(owner["email"], subject, body_plain, html_email)
         except Exception as e:
-            print(f"Erro ao enviar email de recusa de imóvel: {e}")
+            print(f"Erro ao agendar email de recusa de imóvel: {e}")
+    invalidate_cache(MAIN_PAGE_CACHE)
+    await sync_similares(imovel_id, imovel)
+    notificar_admin()
+    invalidate_perfil_publico(imovel["proprietario_id"])
     return {"message": "Imóvel recusado com sucesso"}
 
 
+async def moderar_imoveis_lote(ids: List[str], novo_status: str, motivo: Optional[str] = None) -> ResultadoLote:
+    ids = list(dict.fromkeys(ids))
+    imoveis = await db.imoveis.find(
+        {"id": {"$in": ids}}, {"_id": 0, "id": 1, "titulo": 1, "proprietario_id": 1}).to_list(length=None)
+    imoveis_por_id = {imovel["id"]: imovel for imovel in imoveis}
+
+    if imoveis:
+        agora = datetime.now(timezone.utc)
+        await db.imoveis.bulk_write([
+            UpdateOne({"id": imovel["id"]}, {
+                      "$set": {"status_aprovacao": novo_status, "updated_at": agora}})
+            for imovel in imoveis], ordered=False)
+        invalidate_cache(MAIN_PAGE_CACHE)
+        # Um lote grande reconstrói o índice de uma vez em vez de um find_one por imóvel
+        await sync_similares(None if len(imoveis) > 1 else imoveis[0]["id"])
+
+        proprietario_ids = list({imovel["proprietario_id"] for imovel in imoveis})
+        invalidate_perfil_publico(*proprietario_ids)
+        owners = await db.users.find(
+            {"id": {"$in": proprietario_ids}}, {"_id": 0, "id": 1, "nome": 1, "email": 1}).to_list(length=None)
+        owners_por_id = {owner["id"]: owner for owner in owners}
+        emails = []
+        for imovel in imoveis:
+            owner = owners_por_id.get(imovel["proprietario_id"])
+            if not owner or not owner.get("email"):
+                continue
+            if novo_status == "aprovado":
+                subject, body_plain, html_email = build_imovel_aprovado_email(
+                    owner, imovel)
+            else:
+                subject, body_plain, html_email = build_imovel_recusado_email(
+                    owner, imovel, motivo)
+            emails.append({"to_email": owner["email"], "subject": subject,
+                           "body": body_plain, "html_body": html_email})
+        await jobs.enqueue_many(db, "email", emails)
+        notificar_admin()
+
+    return resultado_lote([
+        ResultadoItemLote(id=imovel_id, status=novo_status) if imovel_id in imoveis_por_id
+        else ResultadoItemLote(id=imovel_id, status="nao_encontrado", detalhe="Imóvel não encontrado")
+        for imovel_id in ids])
+
+
+@api_router.post("/admin/imoveis/aprovar-lote", response_model=ResultadoLote)
+async def aprovar_imoveis_lote(
+    lote: ModeracaoLote,
+    current_user: User = Depends(get_admin_user)
+):
+    return await moderar_imoveis_lote(lote.ids, "aprovado")
+
+
+@api_router.post("/admin/imoveis/recusar-lote", response_model=ResultadoLote)
+async def recusar_imoveis_lote(
+    lote: RecusaLote,
+    current_user: User = Depends(get_admin_user)
+):
+    return await moderar_imoveis_lote(lote.ids, "recusado", motivo=lote.motivo)
+
+
 # --- ROTA DE UPLOAD DE FOTO MODIFICADA ---
 @api_router.post("/upload/foto")
 async def upload_foto(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if not file.filename:
         raise HTTPException(status_code=400, detail="Arquivo inválido")
 
-    # Gerar um ID público único para o Cloudinary
-    file_id = str(uuid.uuid4())
+    # Ler o conteúdo do ficheiro
+    contents = await file.read()
 
-    try:
-        # Ler o conteúdo do ficheiro
-        contents = await file.read()
-
-        # Fazer o upload para o Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            contents,
-            public_id=file_id,
-            folder="alt_ilhabela/fotos",  # Organiza numa pasta
-            resource_type="image"  # Garante que é tratado como imagem
-        )
+    async def enviar():
+        # Gerar um ID público único para o Cloudinary
+        file_id = str(uuid.uuid4())
+        try:
+            # Fazer o upload para o Cloudinary
+            upload_result = cloudinary_upload(
+                contents,
+                public_id=file_id,
+                folder="alt_ilhabela/fotos",  # Organiza numa pasta
+                resource_type="image"  # Garante que é tratado como imagem
+            )
 
-        # O "filename" que o frontend espera é o ID + extensão
-        # O Cloudinary pode converter o formato, por isso usamos o formato retornado
-        file_format = upload_result.get("format", "jpg")
-        filename = f"{file_id}.{file_format}"
+            # O "filename" que o frontend espera é o ID + extensão
+            # O Cloudinary pode converter o formato, por isso usamos o formato retornado
+            file_format = upload_result.get("format", "jpg")
+            filename = f"{file_id}.{file_format}"
 
-        # Retornamos a URL segura do Cloudinary e o "filename"
-        return {"url": upload_result.get("secure_url"), "filename": filename}
+            # Retornamos a URL segura do Cloudinary e o "filename"
+            return {"url": upload_result.get("secure_url"), "filename": filename}
 
-    except Exception as e:
-        logging.error(f"Erro ao fazer upload da foto para o Cloudinary: {e}")
-        raise HTTPException(status_code=500, detail="Erro ao salvar arquivo")
+        except Exception as e:
+            logging.error(f"Erro ao fazer upload da foto para o Cloudinary: {e}")
+            raise HTTPException(status_code=500, detail="Erro ao salvar arquivo")
+
+    # Uma repetição devolve o resultado do primeiro upload sem voltar ao Cloudinary
+    return await idempotency_store.run(
+        idempotency_key, f"upload/foto:{current_user.id}", fingerprint(contents), enviar)
 
 
 # --- ROTA DE APAGAR FOTO MODIFICADA ---
@@ -1488,31 +2641,13 @@ async def delete_foto(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        # O "public_id" é o nome do ficheiro sem a extensão
-        # E precisamos de incluir a pasta
-        public_id = f"alt_ilhabela/fotos/{Path(filename).stem}"
-
-        # Apagar do Cloudinary
-        result = cloudinary.uploader.destroy(
-            public_id,
-            resource_type="image"  # Especifica que é uma imagem
-        )
-
-        # Se não for encontrado, tenta apagar como vídeo (para o /upload/video)
-        if result.get("result") == "not found":
-            public_id_video = f"alt_ilhabela/videos/{Path(filename).stem}"
-            result_video = cloudinary.uploader.destroy(
-                public_id_video,
-                resource_type="video"  # Especifica que é um vídeo
-            )
-            if result_video.get("result") == "not found":
-                logging.warning(
-                    f"Ficheiro {filename} (public_id: {public_id}) não encontrado no Cloudinary para apagar.")
-
+        # A remoção no Cloudinary é feita pelo worker, com novas tentativas se falhar
+        await jobs.enqueue(db, "apagar_media", {"filename": filename},
+                           prioridade=jobs.PRIORIDADE_BAIXA)
         return {"message": "Foto removida com sucesso"}
 
     except Exception as e:
-        logging.error(f"Erro ao remover foto do Cloudinary: {e}")
+        logging.error(f"Erro ao agendar remoção de foto do Cloudinary: {e}")
         raise HTTPException(status_code=500, detail="Erro ao remover foto")
 
 
@@ -1520,36 +2655,40 @@ async def delete_foto(
 @api_router.post("/upload/video")
 async def upload_video(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if not file.filename:
         raise HTTPException(status_code=400, detail="Ficheiro inválido")
 
-    # Gerar um ID público único
-    file_id = str(uuid.uuid4())
+    # Ler o conteúdo
+    contents = await file.read()
 
-    try:
-        # Ler o conteúdo
-        contents = await file.read()
-
-        # Fazer o upload para o Cloudinary como vídeo
-        upload_result = cloudinary.uploader.upload(
-            contents,
-            public_id=file_id,
-            folder="alt_ilhabela/videos",
-            resource_type="video"  # MUITO IMPORTANTE: define como vídeo
-        )
+    async def enviar():
+        # Gerar um ID público único
+        file_id = str(uuid.uuid4())
+        try:
+            # Fazer o upload para o Cloudinary como vídeo
+            upload_result = cloudinary_upload(
+                contents,
+                public_id=file_id,
+                folder="alt_ilhabela/videos",
+                resource_type="video"  # MUITO IMPORTANTE: define como vídeo
+            )
 
-        # Construir o filename
-        file_format = upload_result.get("format", "mp4")
-        filename = f"{file_id}.{file_format}"
+            # Construir o filename
+            file_format = upload_result.get("format", "mp4")
+            filename = f"{file_id}.{file_format}"
 
-        return {"url": upload_result.get("secure_url"), "filename": filename}
+            return {"url": upload_result.get("secure_url"), "filename": filename}
 
-    except Exception as e:
-        logging.error(f"Erro ao fazer upload do vídeo para o Cloudinary: {e}")
-        raise HTTPException(
-            status_code=500, detail="Erro ao salvar o ficheiro")
+        except Exception as e:
+            logging.error(f"Erro ao fazer upload do vídeo para o Cloudinary: {e}")
+            raise HTTPException(
+                status_code=500, detail="Erro ao salvar o ficheiro")
+
+    return await idempotency_store.run(
+        idempotency_key, f"upload/video:{current_user.id}", fingerprint(contents), enviar)
 
 
 @api_router.put("/admin/imoveis/{imovel_id}/destaque")
@@ -1565,6 +2704,7 @@ async def toggle_imovel_destaque(
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
+    invalidate_cache(MAIN_PAGE_CACHE)
     return {"message": f"Imóvel {'adicionado ao' if destaque else 'removido do'} destaque"}
 
 
@@ -1581,6 +2721,7 @@ async def toggle_parceiro_destaque(
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Parceiro não encontrado")
+    invalidate_cache(MAIN_PAGE_CACHE)
     return {"message": f"Parceiro {'adicionado ao' if destaque else 'removido do'} destaque"}
 
 
@@ -1597,28 +2738,190 @@ async def admin_toggle_imovel_status(
     if novo_status is None:
         raise HTTPException(status_code=400, detail="Status não fornecido")
 
-    result = await db.imoveis.update_one(
+    imovel = await db.imoveis.find_one_and_update(
         {"id": imovel_id},
         {"$set": {"ativo": novo_status,
-                  "updated_at": datetime.now(timezone.utc)}}
+                  "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "proprietario_id": 1}
     )
 
-    if result.matched_count == 0:
+    if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
 
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_perfil_publico(imovel.get("proprietario_id"))
+    await sync_similares(imovel_id)
     return {"message": f"Imóvel {'ativado' if novo_status else 'desativado'} com sucesso"}
 
 
+@api_router.get("/admin/slow-queries")
+async def get_slow_query_plans(
+    limit: int = 50,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Lista as formas de consulta lentas e o plano vencedor capturado pelo explain().
+    """
+    plans = await db[PLANS_COLLECTION].find({}, {"_id": 0}).sort(
+        "duration_ms", -1).limit(limit).to_list(length=None)
+    return {"threshold_ms": slow_query_listener.threshold_ms, "plans": plans}
+
+
+@api_router.get("/admin/db/pool-stats")
+async def get_db_pool_stats(current_user: User = Depends(get_admin_user)):
+    """
+    Configuração do pool e utilização atual por servidor (planeamento de capacidade).
+    """
+    return {"config": pool_config(), "servers": pool_stats_listener.snapshot()}
+
+
+@api_router.get("/admin/profiling/cpu")
+async def get_perfil_cpu(
+    segundos: float = Query(10, gt=0, le=profiling.MAX_SEGUNDOS_CPU),
+    intervalo_ms: float = Query(profiling.INTERVALO_CPU_MS, ge=1, le=1000),
+    formato: str = Query("collapsed", pattern="^(collapsed|svg)$"),
+    todas_threads: bool = False,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Amostra as pilhas deste worker durante `segundos`. Por omissão só a thread
+    do event loop; `todas_threads` inclui as do driver e do threadpool.
+    Devolve pilhas colapsadas (flamegraph.pl/speedscope) ou um flamegraph SVG.
+    """
+    if profiling.cpu_profiler.ocupado:
+        raise HTTPException(status_code=409, detail="Já está a decorrer um perfil de CPU")
+    threads = None if todas_threads else [threading.get_ident()]
+    try:
+        pilhas = await asyncio.to_thread(
+            profiling.cpu_profiler.amostrar, segundos, intervalo_ms, threads)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {"X-Profiling-Pid": str(os.getpid())}
+    if formato == "svg":
+        return Response(profiling.flamegraph_svg(pilhas, f"CPU pid {os.getpid()} ({segundos:g}s)"),
+                        media_type="image/svg+xml", headers=headers)
+    return PlainTextResponse(profiling.collapsed(pilhas), headers=headers)
+
+
+@api_router.post("/admin/profiling/memoria/iniciar")
+async def iniciar_perfil_memoria(
+    frames: int = Body(profiling.TRACEMALLOC_FRAMES, embed=True, ge=1, le=64),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Ativa o tracemalloc neste worker e guarda o snapshot de base. O
+    tracemalloc abranda as alocações: parar assim que houver relatório.
+    """
+    await asyncio.to_thread(profiling.memory_profiler.iniciar, frames)
+    return {"message": "Perfil de memória iniciado", "pid": os.getpid()}
+
+
+@api_router.get("/admin/profiling/memoria")
+async def get_perfil_memoria(
+    top: int = Query(20, ge=1, le=200),
+    agrupar: str = Query("lineno", pattern="^(lineno|traceback|filename)$"),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Diferença entre um snapshot novo e o de base e o crescimento por rota.
+    """
+    if not profiling.memory_profiler.ativo:
+        raise HTTPException(status_code=409, detail="O perfil de memória não está ativo neste worker")
+    return await asyncio.to_thread(profiling.memory_profiler.relatorio, top, agrupar)
+
+
+@api_router.post("/admin/profiling/memoria/parar")
+async def parar_perfil_memoria(current_user: User = Depends(get_admin_user)):
+    profiling.memory_profiler.parar()
+    return {"message": "Perfil de memória parado", "pid": os.getpid()}
+
+
+@api_router.get("/admin/media/orfaos")
+async def get_media_orfaos(
+    max_deletes: int = Query(media_gc.MAX_DELETES, ge=1),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Dry run da recolha de media: ficheiros órfãos no Cloudinary e quais seriam apagados.
+    """
+    try:
+        return await media_gc.recolher(db, dry_run=True, max_deletes=max_deletes)
+    except Exception as e:
+        logging.error(f"Erro ao listar os ficheiros do Cloudinary: {e}")
+        raise HTTPException(status_code=502, detail="Erro ao consultar o Cloudinary")
+
+
+@api_router.post("/admin/media/gc")
+async def agendar_media_gc(
+    max_deletes: int = Body(media_gc.MAX_DELETES, embed=True, ge=1),
+    current_user: User = Depends(get_admin_user)
+):
+    job_id = await jobs.enqueue(db, "media_gc", {"max_deletes": max_deletes},
+                                prioridade=jobs.PRIORIDADE_BAIXA, max_tentativas=3)
+    return {"message": "Recolha de media agendada", "job_id": job_id}
+
+
+@api_router.get("/admin/jobs")
+async def get_jobs_resumo(current_user: User = Depends(get_admin_user)):
+    """
+    Estado da fila de tarefas: contagens por estado e as últimas falhas definitivas.
+    """
+    return await jobs.resumo(db)
+
+
+MAX_ARQUIVO_LISTAGEM = 200
+
+
+@api_router.get("/admin/arquivo/{colecao}")
+async def get_arquivo(
+    colecao: str,
+    limit: int = Query(50, ge=1, le=MAX_ARQUIVO_LISTAGEM),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Registos arquivados de uma coleção, do mais recente para o mais antigo.
+    """
+    if colecao not in archive.ARQUIVAVEIS:
+        raise HTTPException(status_code=400, detail="Coleção inválida")
+    docs = await db[archive.archive_name(colecao)].find({}, {"_id": 0}).sort(
+        "arquivado_em", -1).limit(limit).to_list(length=None)
+    return docs
+
+
+@api_router.post("/admin/arquivo/{colecao}/{doc_id}/restaurar")
+async def restaurar_arquivo(
+    colecao: str,
+    doc_id: str,
+    current_user: User = Depends(get_admin_user)
+):
+    if colecao not in archive.ARQUIVAVEIS:
+        raise HTTPException(status_code=400, detail="Coleção inválida")
+    doc = await archive.restaurar(db, colecao, doc_id)
+    if not doc:
+        raise HTTPException(
+            status_code=404, detail="Registo não encontrado no arquivo")
+    if colecao in ("imoveis", "perfis_parceiros"):
+        invalidate_cache(MAIN_PAGE_CACHE)
+    if colecao == "imoveis":
+        invalidate_perfil_publico(doc.get("proprietario_id"))
+        await sync_similares(doc_id)
+    return {"message": "Registo restaurado com sucesso"}
+
+
 @api_router.delete("/admin/imoveis/{imovel_id}")
 async def admin_delete_imovel(
     imovel_id: str,
     current_user: User = Depends(get_admin_user)
 ):
-    result = await db.imoveis.delete_one({"id": imovel_id})
+    imovel = await db.imoveis.find_one_and_delete(
+        {"id": imovel_id}, projection={"_id": 0, "proprietario_id": 1})
 
-    if result.deleted_count == 0:
+    if not imovel:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
 
+    invalidate_cache(MAIN_PAGE_CACHE)
+    invalidate_perfil_publico(imovel.get("proprietario_id"))
+    await sync_similares(imovel_id)
     return {"message": "Imóvel removido permanentemente pelo administrador"}
 
 
@@ -1631,22 +2934,228 @@ origins_from_env = os.environ.get(
 allowed_origins = list(
     set(origins_from_env + ["http://localhost:3000", "http://127.0.0.1:3000"]))
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-app.include_router(api_router)
-
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Índices usados pelas consultas do catálogo, dos painéis e da autenticação
+# Índices parciais só cobrem as linhas vivas (as mortas acabam no arquivo)
+IMOVEIS_ATIVOS = {"partialFilterExpression": {"ativo": True}}
+PARCEIROS_ATIVOS = {"partialFilterExpression": {"ativo": True}}
+CANDIDATURAS_PENDENTES = {"partialFilterExpression": {"status": "pendente"}}
+
+# Cada índice é uma lista de chaves ou (chaves, opções)
+INDEXES = {
+    # Único: a aprovação em lote e o import_users dependem do erro de chave duplicada
+    "users": [[("id", 1)], ([("email", 1)], {"unique": True}), [("role", 1), ("ativo", 1)]],
+    "imoveis": [
+        [("id", 1)],
+        ([("status_aprovacao", 1), ("created_at", -1)],
+         {"name": "catalogo_ativos", **IMOVEIS_ATIVOS}),
+        [("proprietario_id", 1), ("ativo", 1), ("created_at", -1)],
+        # Páginas do perfil público (keyset por created_at, id)
+        ([("proprietario_id", 1), ("status_aprovacao", 1), ("created_at", -1), ("id", -1)],
+         {"name": "perfil_proprietario", **IMOVEIS_ATIVOS}),
+        ([("destaque", 1), ("status_aprovacao", 1), ("created_at", -1)],
+         {"name": "destaque_ativos", **IMOVEIS_ATIVOS}),
+    ],
+    "perfis_parceiros": [
+        [("id", 1)],
+        [("user_id", 1)],
+        ([("created_at", -1)], {"name": "parceiros_ativos", **PARCEIROS_ATIVOS}),
+        ([("destaque", 1), ("created_at", -1)],
+         {"name": "parceiros_destaque_ativos", **PARCEIROS_ATIVOS}),
+    ],
+    "noticias": [
+        [("id", 1)],
+        [("publicada", 1), ("created_at", -1)],
+        # Multikey: um elemento do índice por tag
+        [("tags", 1), ("publicada", 1), ("created_at", -1)],
+        [("relacionadas.id", 1)],
+    ],
+    "candidaturas_membros": [
+        [("id", 1)], [("email", 1)],
+        ([("created_at", -1)], {"name": "pendentes", **CANDIDATURAS_PENDENTES}),
+        # Fila de moderação (keyset por created_at, id em cada estado)
+        ([("status", 1), ("created_at", 1), ("id", 1)], {"name": "fila_moderacao"})],
+    "candidaturas_parceiros": [
+        [("id", 1)], [("email", 1)],
+        ([("created_at", -1)], {"name": "pendentes", **CANDIDATURAS_PENDENTES}),
+        # Fila de moderação (keyset por created_at, id em cada estado)
+        ([("status", 1), ("created_at", 1), ("id", 1)], {"name": "fila_moderacao"})],
+    "candidaturas_associados": [
+        [("id", 1)], [("email", 1)],
+        ([("created_at", -1)], {"name": "pendentes", **CANDIDATURAS_PENDENTES}),
+        # Fila de moderação (keyset por created_at, id em cada estado)
+        ([("status", 1), ("created_at", 1), ("id", 1)], {"name": "fila_moderacao"})],
+}
+
+# Índices completos substituídos pelos parciais acima
+INDEXES_SUBSTITUIDOS = {
+    "imoveis": [
+        [("status_aprovacao", 1), ("ativo", 1), ("created_at", -1)],
+        [("destaque", 1), ("ativo", 1), ("status_aprovacao", 1), ("created_at", -1)],
+    ],
+    "perfis_parceiros": [[("ativo", 1), ("created_at", -1)]],
+    "candidaturas_membros": [[("status", 1)]],
+    "candidaturas_parceiros": [[("status", 1)]],
+    "candidaturas_associados": [[("status", 1)]],
+}
+
+
+async def ensure_indexes():
+    for collection_name, indexes in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        existing_specs = [(info["key"], info.get("partialFilterExpression"), info.get("unique", False))
+                          for info in existing.values()]
+        for index in indexes:
+            keys, options = index if isinstance(index, tuple) else (index, {})
+            if (keys, options.get("partialFilterExpression"), options.get("unique", False)) in existing_specs:
+                continue
+            # Mesmo índice que passou a (ou deixou de ser) único: o MongoDB não
+            # aceita os dois, por isso o antigo é removido antes e reposto se falhar
+            anterior = next((nome for nome, info in existing.items()
+                             if info["key"] == keys and nome != "_id_"
+                             and info.get("partialFilterExpression") == options.get("partialFilterExpression")),
+                            None)
+            try:
+                if anterior is not None:
+                    await db[collection_name].drop_index(anterior)
+                await db[collection_name].create_index(keys, **options)
+                logger.info(f"Índice criado em {collection_name}: {keys}")
+            except Exception as e:
+                logger.warning(
+                    f"Não foi possível criar o índice {keys} em {collection_name}: {e}")
+                if anterior is not None:
+                    anterior_opcoes = {k: v for k, v in existing[anterior].items()
+                                       if k in ("unique", "partialFilterExpression", "sparse")}
+                    await db[collection_name].create_index(keys, name=anterior, **anterior_opcoes)
+        for keys in INDEXES_SUBSTITUIDOS.get(collection_name, []):
+            if (keys, None, False) not in existing_specs:
+                continue
+            try:
+                await db[collection_name].drop_index(keys)
+                logger.info(f"Índice substituído removido de {collection_name}: {keys}")
+            except Exception as e:
+                logger.warning(
+                    f"Não foi possível remover o índice {keys} de {collection_name}: {e}")
+
+
+async def warm_up():
+    """
+    Pré-abre a ligação ao MongoDB, verifica os índices e pré-carrega a cache
+    da página principal, para que o primeiro pedido após um cold start não pague isso.
+    """
+    started = time.perf_counter()
+    try:
+        await client.admin.command("ping")
+        await ensure_indexes()
+        await cache.get_or_load(MAIN_PAGE_CACHE, "", load_main_page_data)
+    except Exception as e:
+        logger.warning(f"Warm-up incompleto: {e}")
+    logger.info(
+        f"Warm-up concluído em {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def health_check():
+    return {"status": "online", "message": "ALT Ilhabela Backend is running!"}
+
+
+async def track_request_scope(request, call_next):
+    # Permite ao registo de operações lentas saber qual rota originou o comando
+    token = current_request_scope.set(request.scope)
+    # Com o perfil de memória ativo, regista quanto cada rota deixou alocado
+    memoria = profiling.memory_profiler.memoria_atual() if profiling.memory_profiler.ativo else None
+    try:
+        return await call_next(request)
+    finally:
+        current_request_scope.reset(token)
+        if memoria is not None and profiling.memory_profiler.ativo:
+            route = request.scope.get("route")
+            profiling.memory_profiler.registar(
+                f"{request.method} {route.path}" if route is not None else profiling.ROTA_DESCONHECIDA,
+                profiling.memory_profiler.memoria_atual() - memoria)
+
+
+async def trace_request(request, call_next):
+    # Span raiz do pedido; os comandos MongoDB e as chamadas externas ficam como filhos
+    with tracing.trace(f"{request.method} {request.url.path}",
+                       request.headers.get(tracing.TRACEPARENT_HEADER),
+                       metodo=request.method) as raiz:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            raiz.nome = f"{request.method} {route.path}"
+        raiz.set(status=response.status_code)
+        response.headers[tracing.TRACEPARENT_HEADER] = raiz.traceparent()
+        return response
+
+
+async def on_startup():
+    slow_query_listener.bind(asyncio.get_running_loop(), db)
+    try:
+        await analytics.ensure_indexes(db)
+        await archive.ensure_indexes(db)
+        await idempotency_store.ensure_indexes()
+        await jobs.ensure_indexes(db)
+        await media_gc.ensure_indexes(db)
+        await revocation_store.ensure_indexes()
+        await invalidation_bus.ensure_indexes()
+        await event_bus.ensure_indexes()
+        # Regista as versões atuais antes de pré-carregar a cache
+        await invalidation_bus.poll_once()
+    except Exception as e:
+        logger.warning(f"Barramento de invalidação indisponível no arranque: {e}")
+    try:
+        # Carga completa dos jti revogados antes de aceitar pedidos
+        await revocation_store.poll_once()
+    except Exception as e:
+        logger.warning(f"Falha ao carregar os tokens revogados: {e}")
+    if WARMUP_ON_STARTUP:
+        await warm_up()
+    try:
+        await refresh_similares()
+        logger.info(f"Índice de similares carregado com {len(similarity_index)} imóveis")
+    except Exception as e:
+        logger.warning(f"Falha ao carregar o índice de similares: {e}")
+    invalidation_bus.start()
+    revocation_store.start()
+    event_bus.start()
+    engagement.start()
+
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
+    await engagement.stop()
+    await invalidation_bus.stop()
+    await revocation_store.stop()
+    await event_bus.stop()
     client.close()
+
+
+def create_app() -> FastAPI:
+    """
+    Monta a aplicação. Os subsistemas pesados (Cloudinary, SMTP) não são
+    carregados aqui; só na primeira vez que forem usados.
+    """
+    application = FastAPI(title="ALT Ilhabela Portal", version="1.0.0")
+    application.add_api_route("/", health_check, methods=["GET"])
+
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    application.middleware("http")(track_request_scope)
+    application.middleware("http")(trace_request)
+
+    application.include_router(api_router)
+
+    application.add_event_handler("startup", on_startup)
+    application.add_event_handler("shutdown", shutdown_db_client)
+    return application
+
+
+# --- Main App Creation (ONCE ONLY) ---
+app = create_app()
@@ -0,0 +1,179 @@
+"""
+Registo de operações lentas no MongoDB.
+
+Um CommandListener do pymongo mede cada comando enviado ao servidor. Quando a
+duração ultrapassa o limite configurado (SLOW_QUERY_MS), regista a coleção, a
+forma do filtro (valores ocultados), a duração e a rota que originou o comando.
+Na primeira ocorrência de cada forma nova é executado um explain() e o plano
+vencedor fica guardado na coleção `slow_query_plans`.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_EXPLAIN = os.environ.get(
+    'SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes')
+PLANS_COLLECTION = 'slow_query_plans'
+
+# Comandos que suportam explain e cujo filtro vale a pena registar
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count',
+                        'distinct', 'findAndModify', 'update', 'delete'}
+# Chaves de sessão/driver que não fazem parte da consulta em si
+DRIVER_KEYS = {'lsid', 'txnNumber', 'autocommit', 'startTransaction',
+               '$db', '$clusterTime', '$readPreference', 'readConcern',
+               'writeConcern', 'apiVersion', 'apiStrict', 'apiDeprecationErrors'}
+
+# Scope ASGI do pedido em curso (definido pelo middleware no server.py)
+current_request_scope: ContextVar[Optional[dict]] = ContextVar(
+    'current_request_scope', default=None)
+
+
+def current_route() -> Optional[str]:
+    scope = current_request_scope.get()
+    if not scope:
+        return None
+    route = f"{scope.get('method', '')} {scope.get('path', '')}"
+    endpoint = scope.get('endpoint')
+    if endpoint is not None:
+        route += f" ({getattr(endpoint, '__name__', endpoint)})"
+    return route
+
+
+def redact(value: Any) -> Any:
+    """Mantém a estrutura (chaves e operadores) e oculta os valores."""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(value[0])] if value else []
+    return '?'
+
+
+def command_filter(command_name: str, command: dict) -> Any:
+    if command_name in ('find', 'count', 'distinct'):
+        return command.get('filter', command.get('query', {}))
+    if command_name == 'findAndModify':
+        return command.get('query', {})
+    if command_name == 'aggregate':
+        return command.get('pipeline', [])
+    if command_name == 'update':
+        return [u.get('q', {}) for u in command.get('updates', [])[:1]]
+    if command_name == 'delete':
+        return [d.get('q', {}) for d in command.get('deletes', [])[:1]]
+    return {}
+
+
+def query_shape(command_name: str, command: dict) -> Dict[str, Any]:
+    collection = command.get(command_name)
+    shape = {
+        'command': command_name,
+        'collection': collection if isinstance(collection, str) else None,
+        'filter': redact(command_filter(command_name, command)),
+    }
+    if command.get('sort'):
+        shape['sort'] = list(command['sort'].keys())
+    return shape
+
+
+def shape_hash(shape: Dict[str, Any]) -> str:
+    raw = json.dumps(shape, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def winning_plan(explain_result: dict) -> Any:
+    planner = explain_result.get('queryPlanner')
+    if planner is None:
+        # aggregate devolve o plano dentro do primeiro estágio $cursor
+        for stage in explain_result.get('stages', []):
+            if '$cursor' in stage:
+                planner = stage['$cursor'].get('queryPlanner')
+                break
+    if planner is None:
+        return explain_result
+    return planner.get('winningPlan')
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Mede os comandos e regista os que excedem o limite configurado."""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain: bool = SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._pending: Dict[Any, tuple] = {}
+        self._seen_shapes: set = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._db = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop, db) -> None:
+        """Liga o listener ao event loop e à base de dados para os explain()."""
+        self._loop = loop
+        self._db = db
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if collection == PLANS_COLLECTION:
+            return
+        key = (event.connection_id, event.request_id)
+        with self._lock:
+            self._pending[key] = (event.database_name,
+                                  dict(event.command), current_route())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        key = (event.connection_id, event.request_id)
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        database_name, command, route = pending
+        shape = query_shape(event.command_name, command)
+        logger.warning(
+            f"Operação lenta ({duration_ms:.1f} ms) em {shape['collection']}: "
+            f"{event.command_name} filtro={json.dumps(shape['filter'], default=str)} "
+            f"rota={route or 'n/a'}")
+        digest = shape_hash(shape)
+        with self._lock:
+            is_new = digest not in self._seen_shapes
+            self._seen_shapes.add(digest)
+        if is_new and self.explain and self._loop is not None and self._db is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._capture_plan(digest, database_name, shape, command, duration_ms, route), self._loop)
+
+    async def _capture_plan(self, digest: str, database_name: str, shape: dict, command: dict, duration_ms: float, route: Optional[str]):
+        explainable = {k: v for k, v in command.items()
+                       if k not in DRIVER_KEYS}
+        try:
+            result = await self._db.client[database_name].command(
+                {'explain': explainable, 'verbosity': 'queryPlanner'})
+            plan = winning_plan(result)
+        except Exception as e:
+            logger.warning(
+                f"Não foi possível executar explain para {shape['collection']}: {e}")
+            plan = None
+        await self._db[PLANS_COLLECTION].update_one(
+            {'shape_hash': digest},
+            {'$set': {'shape': shape, 'winning_plan': plan,
+                      'route': route, 'duration_ms': duration_ms,
+                      'captured_at': datetime.now(timezone.utc)}},
+            upsert=True)
@@ -0,0 +1,245 @@
+"""
+Rastreio de pedidos com spans (tempo gasto em MongoDB, Cloudinary, bcrypt e email).
+
+Cada pedido HTTP recebe um trace_id (devolvido no cabeçalho `traceparent`,
+formato W3C). Nos pedidos amostrados (TRACE_SAMPLE_RATE) cada operação
+instrumentada abre um span filho do span corrente:
+  - todos os comandos MongoDB, via um CommandListener do pymongo (o Motor
+    copia o contexto para a thread do driver, por isso o span corrente é
+    visível no listener);
+  - uploads e remoções no Cloudinary, hashes e verificações de password e
+    envios de email, com `span()` à volta da chamada.
+
+As tarefas da fila guardam o `traceparent` de quem as registou; o worker
+continua o mesmo trace, pelo que o envio do email agendado aparece junto do
+pedido que o originou.
+
+Os spans terminados são escritos, um por linha, em TRACE_EXPORT_FILE (JSONL)
+por uma thread dedicada; se a fila de escrita encher, os spans são
+descartados em vez de atrasar os pedidos. Com TRACE_SAMPLE_RATE=0 só é
+gerado o trace_id.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+TRACE_EXPORT_FILE = os.environ.get(
+    'TRACE_EXPORT_FILE', str(Path(__file__).parent / 'traces.jsonl'))
+# Spans à espera de serem escritos; acima disto são descartados
+MAX_PENDENTES = 10000
+TRACEPARENT_HEADER = 'traceparent'
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'nome', 'atributos',
+                 'amostrado', 'inicio', '_t0', 'duracao_ms', 'erro')
+
+    def __init__(self, nome: str, trace_id: str, parent_id: Optional[str],
+                 amostrado: bool, atributos: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.nome = nome
+        self.atributos = atributos or {}
+        self.amostrado = amostrado
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+        self.duracao_ms: Optional[float] = None
+        self.erro: Optional[str] = None
+
+    def set(self, **atributos) -> None:
+        self.atributos.update(atributos)
+
+    def end(self, duracao_ms: Optional[float] = None, erro: Optional[str] = None) -> None:
+        if self.duracao_ms is not None:
+            return
+        self.duracao_ms = duracao_ms if duracao_ms is not None else \
+            (time.perf_counter() - self._t0) * 1000
+        self.erro = erro or self.erro
+        if self.amostrado:
+            exporter.export(self.to_dict())
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.amostrado else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "nome": self.nome,
+            "inicio": self.inicio,
+            "duracao_ms": round(self.duracao_ms, 3),
+            "atributos": self.atributos,
+            "erro": self.erro,
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class JsonlExporter:
+    """Escreve os spans em JSONL numa thread própria, sem bloquear o event loop."""
+
+    def __init__(self, path: str = TRACE_EXPORT_FILE, max_pendentes: int = MAX_PENDENTES):
+        self.path = path
+        self._fila: queue.Queue = queue.Queue(max_pendentes)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.descartados = 0
+
+    def export(self, span: dict) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._fila.put_nowait(span)
+        except queue.Full:
+            self.descartados += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            linhas = [self._fila.get()]
+            # Escreve de uma vez o que se acumulou entretanto
+            while len(linhas) < 1000:
+                try:
+                    linhas.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(span, default=str) + '\n' for span in linhas)
+            except OSError as e:
+                logger.warning(f"Falha ao escrever {len(linhas)} spans em {self.path}: {e}")
+            finally:
+                for _ in linhas:
+                    self._fila.task_done()
+
+    def flush(self) -> None:
+        """Espera até todos os spans pendentes estarem escritos."""
+        if self._thread is not None:
+            self._fila.join()
+
+
+exporter = JsonlExporter()
+
+
+def parse_traceparent(valor: Optional[str]):
+    """(trace_id, parent_id, amostrado) de um cabeçalho traceparent, ou None."""
+    if not valor:
+        return None
+    partes = valor.strip().split('-')
+    if len(partes) != 4 or len(partes[1]) != 32 or len(partes[2]) != 16:
+        return None
+    try:
+        int(partes[1], 16), int(partes[2], 16), int(partes[3], 16)
+    except ValueError:
+        return None
+    if partes[1] == '0' * 32:
+        return None
+    return partes[1], partes[2], bool(int(partes[3], 16) & 1)
+
+
+@contextmanager
+def trace(nome: str, traceparent: Optional[str] = None, confiar_amostragem: bool = False,
+          taxa: Optional[float] = None, **atributos) -> Iterator[Span]:
+    """
+    Abre o span raiz de um pedido ou tarefa. Um `traceparent` recebido mantém o
+    trace_id; a decisão de amostragem dele só é seguida com `confiar_amostragem`
+    (tarefas registadas por nós), para que clientes externos não a forcem.
+    """
+    taxa = TRACE_SAMPLE_RATE if taxa is None else taxa
+    pai = parse_traceparent(traceparent)
+    if pai is not None and confiar_amostragem:
+        trace_id, parent_id, amostrado = pai
+    else:
+        trace_id = pai[0] if pai else secrets.token_hex(16)
+        parent_id = pai[1] if pai else None
+        amostrado = taxa > 0 and random.random() < taxa
+    raiz = Span(nome, trace_id, parent_id, amostrado, atributos)
+    token = current_span.set(raiz)
+    try:
+        yield raiz
+    except BaseException as e:
+        raiz.erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.reset(token)
+        raiz.end()
+
+
+@contextmanager
+def span(nome: str, **atributos) -> Iterator[Optional[Span]]:
+    """Span filho do corrente; fora de um trace amostrado não faz nada (devolve None)."""
+    pai = current_span.get()
+    if pai is None or not pai.amostrado:
+        yield None
+        return
+    filho = Span(nome, pai.trace_id, pai.span_id, True, atributos)
+    token = current_span.set(filho)
+    try:
+        yield filho
+    except BaseException as e:
+        filho.erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.reset(token)
+        filho.end()
+
+
+def current_traceparent() -> Optional[str]:
+    atual = current_span.get()
+    return atual.traceparent() if atual is not None else None
+
+
+class TracingListener(monitoring.CommandListener):
+    """Um span por comando MongoDB enviado durante um trace amostrado."""
+
+    def __init__(self):
+        self._pending: Dict[Any, Span] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        pai = current_span.get()
+        if pai is None or not pai.amostrado:
+            return
+        collection = event.command.get(event.command_name)
+        filho = Span(f"mongo.{event.command_name}", pai.trace_id, pai.span_id, True, {
+            "db": event.database_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "servidor": f"{event.connection_id[0]}:{event.connection_id[1]}",
+        })
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = filho
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get('errmsg', event.failure)))
+
+    def _finish(self, event, erro: Optional[str]):
+        with self._lock:
+            filho = self._pending.pop((event.connection_id, event.request_id), None)
+        if filho is not None:
+            filho.end(event.duration_micros / 1000, erro)
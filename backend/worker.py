@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Worker da fila de tarefas (emails, desativações em cascata, remoção de media).
+
+Executa as tarefas registadas com @jobs.handler em server.py. Pode correr
+quantos processos forem precisos, em qualquer máquina com acesso ao MongoDB;
+o run_production.py já arranca JOB_WORKERS destes processos ao lado dos
+workers web. Ao receber SIGTERM/SIGINT deixa de reclamar tarefas e termina as
+que estão em curso; uma tarefa interrompida à força volta à fila quando o
+lease expira.
+
+Uso:
+    python worker.py --concorrencia 4
+    python worker.py --tipos email
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+ROOT_DIR = Path(__file__).parent
+
+
+async def main_async(concorrencia: int, tipos: Optional[List[str]]) -> None:
+    # server regista os handlers e partilha a ligação ao MongoDB e o barramento de invalidação
+    import jobs
+    import server
+
+    worker = jobs.Worker(server.db, concorrencia, tipos)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await jobs.ensure_indexes(server.db)
+    try:
+        await worker.run()
+    finally:
+        # Espera pelas invalidações publicadas pelas tarefas
+        await server.invalidation_bus.stop()
+        server.client.close()
+
+
+def run_worker(concorrencia: int = 4, tipos: Optional[List[str]] = None) -> None:
+    sys.path.insert(0, str(ROOT_DIR))
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main_async(concorrencia, tipos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de tarefas")
+    parser.add_argument('--concorrencia', type=int,
+                        default=int(os.environ.get('JOBS_CONCURRENCY', '4')),
+                        help="Tarefas executadas em paralelo por processo")
+    parser.add_argument('--tipos', help="Só executa estes tipos (separados por vírgula)")
+    args = parser.parse_args()
+    tipos = [t.strip() for t in args.tipos.split(',')] if args.tipos else None
+    run_worker(args.concorrencia, tipos)
+
+
+if __name__ == "__main__":
+    main()
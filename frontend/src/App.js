@@ -122,6 +122,12 @@ const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoga o token no servidor; a sessão local termina mesmo que o pedido falhe
+    const token = localStorage.getItem('token');
+    if (token) {
+      // keepalive: o pedido sobrevive ao redirecionamento para /login
+      fetch(`${API}/auth/logout`, { method: 'POST', keepalive: true, headers: { Authorization: `Bearer ${token}` } }).catch(() => {});
+    }
     localStorage.removeItem('token');
     delete axios.defaults.headers.common['Authorization'];
     setUser(null);
@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { toast } from '../hooks/use-toast';
+import { useAdminEvents } from '../hooks/use-admin-events';
 import {
     Users, Home, FileText, Mail, Star,
     ClipboardList, TrendingUp, Bell, ChevronRight,
@@ -48,14 +49,15 @@ const ActionCard = ({ title, description, icon: Icon, colorClass, link, badgeCou
 // --- COMPONENTE PRINCIPAL ---
 const AdminDashboard = () => {
     const navigate = useNavigate();
-    const [stats, setStats] = useState(null);
+    const [dashboard, setDashboard] = useState(null);
+    const [contagens, setContagens] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
         const fetchStats = async () => {
             try {
                 const response = await axios.get(`${API}/admin/dashboard`);
-                setStats(response.data);
+                setDashboard(response.data);
             } catch (error) {
                 toast({ title: "Erro ao carregar dashboard", variant: "destructive" });
             } finally {
@@ -65,11 +67,20 @@ const AdminDashboard = () => {
         fetchStats();
     }, []);
 
+    // As pendências chegam por SSE; não é preciso voltar a pedir o dashboard.
+    // Guardadas à parte: o evento inicial pode chegar antes da resposta do dashboard
+    useAdminEvents((tipo, dados) => {
+        if (tipo === 'contagens') {
+            setContagens(dados);
+        }
+    });
+
     if (loading) {
         return <div className="flex justify-center items-center min-h-screen"><div className="spinner"></div></div>;
     }
 
-    if (!stats) return null;
+    if (!dashboard) return null;
+    const stats = { ...dashboard, ...contagens };
 
     // Definição dos Cartões de Gestão
     const managementActions = [
@@ -87,8 +98,7 @@ const AdminDashboard = () => {
             icon: Home,
             color: "bg-blue-500",
             link: "/admin/imoveis",
-            // Assumindo que criaste um campo 'imoveis_pendentes' no stats, senão 0
-            badge: 0
+            badge: stats.imoveis_pendentes || 0
         },
         {
             title: "Conteúdo & Notícias",
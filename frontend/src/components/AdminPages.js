@@ -12,6 +12,7 @@ import { Label } from './ui/label';
 import { Textarea } from './ui/textarea';
 import { Checkbox } from './ui/checkbox';
 import { toast } from '../hooks/use-toast';
+import { useAdminEvents } from '../hooks/use-admin-events';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogFooter } from './ui/dialog';
 import RichTextEditor from './RichTextEditor';
 import { PhotoUpload } from './PhotoUpload';
@@ -325,6 +326,11 @@ export const AdminCandidaturasPage = () => {
 
     useEffect(() => { fetchCandidaturas(); }, []);
 
+    // Novas candidaturas aparecem sem recarregar a página
+    useAdminEvents((tipo) => {
+        if (tipo === 'candidatura_submetida' || tipo === 'resync') fetchCandidaturas();
+    });
+
     const handleAction = async (tipo, id, action) => {
         let motivo = '';
         if (action === 'recusar') {
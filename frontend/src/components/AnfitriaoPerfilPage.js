@@ -14,6 +14,7 @@ export const AnfitriaoPerfilPage = () => {
     const navigate = useNavigate();
     const [perfil, setPerfil] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMais, setLoadingMais] = useState(false);
 
     useEffect(() => {
         const fetchPerfil = async () => {
@@ -28,6 +29,21 @@ export const AnfitriaoPerfilPage = () => {
         fetchPerfil();
     }, [id]);
 
+    const carregarMais = async () => {
+        setLoadingMais(true);
+        try {
+            const res = await axios.get(`${API}/usuarios/${id}/imoveis`, { params: { cursor: perfil.proximo_cursor } });
+            setPerfil(prev => ({
+                ...prev,
+                imoveis: [...prev.imoveis, ...res.data.itens],
+                proximo_cursor: res.data.proximo_cursor
+            }));
+        } catch (err) {
+            console.error(err);
+        }
+        setLoadingMais(false);
+    };
+
     if (loading) return <div className="flex justify-center items-center py-20"><div className="spinner"></div></div>;
 
     if (!perfil) return <div className="text-center py-20">Perfil não encontrado</div>;
@@ -56,9 +72,9 @@ export const AnfitriaoPerfilPage = () => {
                                     className="card-custom hover-lift cursor-pointer"
                                     onClick={() => navigate(`/imovel/${imovel.id}`)}
                                 >
-                                    {imovel.fotos?.[0] && (
+                                    {imovel.foto && (
                                         <div className="aspect-video rounded-t-lg overflow-hidden">
-                                            <img src={imovel.fotos[0]} alt={imovel.titulo} className="w-full h-full object-cover" />
+                                            <img src={imovel.foto} alt={imovel.titulo} className="w-full h-full object-cover" />
                                         </div>
                                     )}
                                     <CardHeader>
@@ -71,6 +87,13 @@ export const AnfitriaoPerfilPage = () => {
                                 </Card>
                             ))}
                         </div>
+                        {perfil.proximo_cursor && (
+                            <div className="flex justify-center mt-8">
+                                <Button variant="outline" onClick={carregarMais} disabled={loadingMais}>
+                                    {loadingMais ? 'A carregar...' : 'Ver mais imóveis'}
+                                </Button>
+                            </div>
+                        )}
                     </CardContent>
                 </Card>
             </div>
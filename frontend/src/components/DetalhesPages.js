@@ -47,13 +47,10 @@ export const ImovelDetalhePage = () => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const imovelRes = await axios.get(`${API}/imoveis/${id}`);
+        // O anfitrião vem no mesmo pedido (sem a chamada extra a /proprietario)
+        const imovelRes = await axios.get(`${API}/imoveis/${id}`, { params: { expand: 'proprietario' } });
         setImovel(imovelRes.data);
-
-        try {
-          const anfitriaoRes = await axios.get(`${API}/imoveis/${id}/proprietario`);
-          setAnfitriao(anfitriaoRes.data);
-        } catch (err) { console.error(err); }
+        setAnfitriao(imovelRes.data.proprietario);
 
         try {
           const meRes = await axios.get(`${API}/auth/me`);
@@ -0,0 +1,69 @@
+import { useEffect, useRef } from 'react';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Lê o stream SSE de /admin/events com fetch (o EventSource não envia o token no cabeçalho)
+// e volta a ligar com Last-Event-ID para receber os eventos perdidos.
+export function useAdminEvents(onEvent) {
+    const handlerRef = useRef(onEvent);
+    handlerRef.current = onEvent;
+
+    useEffect(() => {
+        const controller = new AbortController();
+        let lastEventId = null;
+        let retryMs = 3000;
+
+        const dispatch = (block) => {
+            let tipo = 'message';
+            let id = null;
+            const dados = [];
+            for (const line of block.split('\n')) {
+                if (line.startsWith(':')) continue; // heartbeat
+                const sep = line.indexOf(':');
+                const field = sep === -1 ? line : line.slice(0, sep);
+                const value = sep === -1 ? '' : line.slice(sep + 1).replace(/^ /, '');
+                if (field === 'event') tipo = value;
+                else if (field === 'data') dados.push(value);
+                else if (field === 'id') id = value;
+                else if (field === 'retry') retryMs = Number(value) || retryMs;
+            }
+            if (id !== null) lastEventId = id;
+            if (!dados.length) return;
+            try {
+                handlerRef.current(tipo, JSON.parse(dados.join('\n')));
+            } catch (e) {
+                console.error('Evento inválido do painel:', e);
+            }
+        };
+
+        const connect = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    const headers = { Authorization: `Bearer ${localStorage.getItem('token')}` };
+                    if (lastEventId !== null) headers['Last-Event-ID'] = lastEventId;
+                    const response = await fetch(`${API}/admin/events`, { headers, signal: controller.signal });
+                    if (response.status === 401 || response.status === 403) return;
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    for (;;) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        let end;
+                        while ((end = buffer.indexOf('\n\n')) !== -1) {
+                            dispatch(buffer.slice(0, end));
+                            buffer = buffer.slice(end + 2);
+                        }
+                    }
+                } catch (e) {
+                    if (controller.signal.aborted) return;
+                }
+                await new Promise(resolve => setTimeout(resolve, retryMs));
+            }
+        };
+        connect();
+        return () => controller.abort();
+    }, []);
+}
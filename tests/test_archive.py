@@ -0,0 +1,42 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import archive  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _db():
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+def test_candidatura_antiga_resolvida_ontem_nao_e_arquivada():
+    db = _db()
+    agora = datetime.now(timezone.utc)
+    asyncio.run(db.candidaturas_membros.insert_many([
+        {"id": "recente", "status": "aprovado", "created_at": agora - timedelta(days=400),
+         "resolvido_em": agora - timedelta(days=1)},
+        {"id": "antiga", "status": "recusado", "created_at": agora - timedelta(days=400),
+         "resolvido_em": agora - timedelta(days=200)},
+    ]))
+    movidos = asyncio.run(archive.arquivar(db, dias=90))
+    assert movidos["candidaturas_membros"] == 1
+    restantes = asyncio.run(db.candidaturas_membros.distinct("id"))
+    assert restantes == ["recente"]
+
+
+def test_registo_restaurado_nao_volta_ao_arquivo():
+    db = _db()
+    antigo = datetime.now(timezone.utc) - timedelta(days=200)
+    asyncio.run(db.imoveis.insert_one(
+        {"id": "i1", "ativo": False, "created_at": antigo, "updated_at": antigo}))
+    assert asyncio.run(archive.arquivar(db, dias=90))["imoveis"] == 1
+    assert asyncio.run(archive.restaurar(db, "imoveis", "i1")) is not None
+    assert asyncio.run(archive.arquivar(db, dias=90))["imoveis"] == 0
+    assert asyncio.run(db.imoveis.count_documents({"id": "i1"})) == 1
@@ -0,0 +1,46 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from cache import TTLCache  # noqa: E402
+
+
+def test_numero_de_entradas_e_limitado():
+    cache = TTLCache(max_entries=3)
+    for i in range(10):
+        cache.set("perfil", str(i), i)
+    assert len(cache) == 3
+    assert cache.get("perfil", "0") is None
+    assert cache.get("perfil", "9") == 9
+
+
+def test_lru_mantem_as_entradas_lidas():
+    cache = TTLCache(max_entries=2)
+    cache.set("ns", "a", 1)
+    cache.set("ns", "b", 2)
+    cache.get("ns", "a")
+    cache.set("ns", "c", 3)
+    assert cache.get("ns", "a") == 1
+    assert cache.get("ns", "b") is None
+
+
+def test_locks_sao_libertados_mesmo_quando_o_loader_falha():
+    cache = TTLCache()
+
+    async def falha():
+        raise LookupError("não existe")
+
+    async def carregar():
+        for i in range(50):
+            with pytest.raises(LookupError):
+                await cache.get_or_load("perfil", f"aleatorio-{i}", falha)
+        await asyncio.gather(*(cache.get_or_load("perfil", "x", lambda: asyncio.sleep(0, 1))
+                               for _ in range(5)))
+
+    asyncio.run(carregar())
+    assert cache._locks == {}
+    assert len(cache) == 1
@@ -0,0 +1,53 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import media_gc  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+CLOUD = "https://res.cloudinary.com/demo"
+
+
+def _url(resource_type, public_id, ext):
+    return f"{CLOUD}/{resource_type}/upload/v1700000000/{public_id}.{ext}"
+
+
+def test_urls_em_texto_encontra_img_e_video_do_editor():
+    conteudo = (
+        f'<p>Texto</p><img src="https://api.exemplo.com{_url("image", "alt_ilhabela/fotos/a", "jpg")}">'
+        f"<video src='{_url('video', 'alt_ilhabela/videos/b', 'mp4')}'></video>"
+    )
+    assets = {media_gc.asset_from_url(url) for url in media_gc.urls_em_texto(conteudo)}
+    assert assets == {("image", "alt_ilhabela/fotos/a"), ("video", "alt_ilhabela/videos/b")}
+
+
+def test_media_referenciada_so_no_conteudo_nao_e_orfa():
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    embutida = _url("image", "alt_ilhabela/fotos/no-conteudo", "jpg")
+    asyncio.run(db.noticias.insert_one({
+        "id": "n1", "fotos": [], "conteudo": f'<p><img src="{embutida}"></p>'}))
+
+    class Api:
+        def resources(self, **kwargs):
+            if kwargs["resource_type"] != "image":
+                return {"resources": []}
+            return {"resources": [
+                {"public_id": "alt_ilhabela/fotos/no-conteudo", "created_at": "2020-01-01T00:00:00Z"},
+                {"public_id": "alt_ilhabela/fotos/orfa", "created_at": "2020-01-01T00:00:00Z"},
+            ]}
+
+    relatorio = asyncio.run(media_gc.recolher(db, dry_run=True, api=Api()))
+    assert relatorio["referenciados"] == 1
+    assert relatorio["orfaos"] == 1
+
+
+def test_colecoes_arquivadas_e_em_quarentena_sao_referencias():
+    assert media_gc.colecoes_referencia("imoveis") == [
+        "imoveis", "imoveis_arquivo", "imoveis_quarentena"]
+    assert media_gc.colecoes_referencia("noticias") == ["noticias", "noticias_quarentena"]
+    assert media_gc.colecoes_referencia("users") == ["users"]